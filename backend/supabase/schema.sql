@@ -1,4 +1,6 @@
 -- Drop existing tables if they exist
+DROP TABLE IF EXISTS public.broadcast_recipients;
+DROP TABLE IF EXISTS public.broadcasts;
 DROP TABLE IF EXISTS public.messages;
 DROP TABLE IF EXISTS public.contacts;
 
@@ -9,6 +11,9 @@ CREATE TABLE public.contacts (
     contact_info TEXT NOT NULL UNIQUE, -- This stores Telegram chat ID
     last_contact TIMESTAMP WITH TIME ZONE DEFAULT now(),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+    -- Bot part of contact_info (telegram_user_id:bot_identifier), used to find a bot's contacts
+    bot_identifier TEXT GENERATED ALWAYS AS (NULLIF(split_part(contact_info, ':', 2), '')) STORED,
+    chat_id BIGINT,  -- Telegram chat the customer last wrote from; replies are sent there
     
     -- Enable RLS
     CONSTRAINT valid_contact_info CHECK (contact_info IS NOT NULL AND contact_info != '')
@@ -21,101 +26,752 @@ COMMENT ON COLUMN public.contacts.name IS 'Name of the contact';
 COMMENT ON COLUMN public.contacts.contact_info IS 'Telegram chat ID or other contact identifier';
 COMMENT ON COLUMN public.contacts.last_contact IS 'Timestamp of the last contact with this customer';
 COMMENT ON COLUMN public.contacts.created_at IS 'Timestamp when the contact was created';
+COMMENT ON COLUMN public.contacts.bot_identifier IS 'Bot the contact talks to, derived from contact_info';
+COMMENT ON COLUMN public.contacts.chat_id IS 'Telegram chat the customer last wrote from, where outgoing messages are delivered';
 
--- Create messages table
+-- Create messages table, partitioned by month of timestamp (see create_message_partitions
+-- below). Unique keys have to include the partition key, hence (id, timestamp).
 CREATE TABLE public.messages (
-    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    id UUID NOT NULL DEFAULT uuid_generate_v4(),
     contact_id UUID REFERENCES public.contacts(id) ON DELETE CASCADE,
     content TEXT NOT NULL,
-    timestamp TIMESTAMP WITH TIME ZONE DEFAULT now(),
+    timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
     direction TEXT NOT NULL CHECK (direction IN ('incoming', 'outgoing')),
     is_from_customer BOOLEAN DEFAULT FALSE,
     is_ai_response BOOLEAN DEFAULT FALSE,
     is_sent BOOLEAN DEFAULT FALSE,  -- Flag to track if outgoing messages were sent to Telegram
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
-);
+    claimed_by TEXT,  -- Bot worker currently delivering this outgoing message
+    lease_expires_at TIMESTAMP WITH TIME ZONE,  -- Claim expiry; also used to delay retries
+    delivery_attempts INTEGER NOT NULL DEFAULT 0,
+    delivery_error TEXT,  -- Set when delivery was given up
+    -- Where an incoming message came from in Telegram, so retried or replayed inserts are skipped
+    bot_identifier TEXT,
+    telegram_chat_id BIGINT,
+    telegram_message_id BIGINT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+    
+    PRIMARY KEY (id, timestamp),
+    -- Catches retried inserts of the same record; a message Telegram delivers again is
+    -- stored with a later timestamp and skipped by skip_redelivered_message_trigger instead
+    CONSTRAINT messages_telegram_message_key UNIQUE (bot_identifier, telegram_chat_id, telegram_message_id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+-- No default partition: old partitions are detached with DETACH PARTITION ... CONCURRENTLY,
+-- which Postgres refuses while one exists. Create the partitions for older months
+-- (e.g. before importing history) with create_message_partitions(n, p_from).
 
 -- Add comments to the table and columns
 COMMENT ON TABLE public.messages IS 'Stores all messages sent to and received from contacts';
 COMMENT ON COLUMN public.messages.id IS 'Unique identifier for the message';
 COMMENT ON COLUMN public.messages.contact_id IS 'Foreign key to contacts table';
 COMMENT ON COLUMN public.messages.content IS 'Content of the message';
-COMMENT ON COLUMN public.messages.timestamp IS 'Timestamp when the message was sent or received';
+COMMENT ON COLUMN public.messages.timestamp IS 'Timestamp when the message was sent or received; partition key';
 COMMENT ON COLUMN public.messages.direction IS 'Direction of the message: incoming or outgoing';
 COMMENT ON COLUMN public.messages.is_from_customer IS 'Whether this message is from the customer (true) or from the system/operator (false)';
 COMMENT ON COLUMN public.messages.is_ai_response IS 'Whether this message was generated by AI';
+COMMENT ON COLUMN public.messages.claimed_by IS 'Worker ID of the bot process that claimed this outgoing message for delivery';
+COMMENT ON COLUMN public.messages.lease_expires_at IS 'When the current claim expires and the message can be claimed again';
+COMMENT ON COLUMN public.messages.delivery_attempts IS 'Number of times this outgoing message has been claimed for delivery';
+COMMENT ON COLUMN public.messages.delivery_error IS 'Last delivery error for outgoing messages that will not be retried';
+COMMENT ON COLUMN public.messages.bot_identifier IS 'Bot that received the message from Telegram, or that delivers an outgoing one';
+COMMENT ON COLUMN public.messages.telegram_chat_id IS 'Telegram chat the message was received in';
+COMMENT ON COLUMN public.messages.telegram_message_id IS 'Telegram message_id, unique per bot and chat; NULL for messages written in the UI';
 COMMENT ON COLUMN public.messages.created_at IS 'Timestamp when the message was created in the database';
 
 -- Create indexes
 CREATE INDEX idx_contacts_contact_info ON public.contacts(contact_info);
 CREATE INDEX idx_messages_contact_id ON public.messages(contact_id);
-CREATE INDEX idx_messages_timestamp ON public.messages(timestamp);
+-- (timestamp, id) also serves keyset pagination, e.g. telegram-bots/export_messages.py
+CREATE INDEX idx_messages_timestamp ON public.messages(timestamp, id);
+CREATE INDEX idx_contacts_bot_identifier ON public.contacts(bot_identifier);
+-- Keyword search (get_customers_by_message_keyword*): trigram index for substring
+-- matches (ILIKE '%keyword%') and a full-text index for word matches and ranking
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX idx_messages_content_trgm ON public.messages USING gin (content gin_trgm_ops);
+CREATE INDEX idx_messages_content_fts ON public.messages USING gin (to_tsvector('english', content));
+-- Small partial index covering only the outgoing messages the bots still have to deliver,
+-- in the order claim_outgoing_messages takes them. It stays tiny however much history
+-- the partitions hold, and is empty in all but the latest ones.
+CREATE INDEX idx_messages_pending_outgoing ON public.messages(timestamp, contact_id)
+    WHERE direction = 'outgoing' AND is_sent = FALSE AND delivery_error IS NULL;
 
--- Create function to update last_contact in contacts when a new message is inserted
-CREATE OR REPLACE FUNCTION public.update_contact_last_contact()
+-- Create the monthly partitions of messages from the month of p_from up to p_months_ahead
+-- months later, skipping those that exist. Months are UTC, partitions are named
+-- messages_pYYYY_MM. Returns the names of the partitions created. Run by
+-- telegram-bots/maintain_partitions.py, which also archives and drops old partitions.
+CREATE OR REPLACE FUNCTION public.create_message_partitions(
+    p_months_ahead INTEGER DEFAULT 3,
+    p_from TIMESTAMP WITH TIME ZONE DEFAULT now()
+)
+RETURNS SETOF TEXT AS $$
+DECLARE
+    v_month TIMESTAMP := date_trunc('month', p_from AT TIME ZONE 'UTC');
+    v_start TIMESTAMP;
+    v_name TEXT;
+BEGIN
+    FOR i IN 0..p_months_ahead LOOP
+        v_start := v_month + make_interval(months => i);
+        v_name := 'messages_p' || to_char(v_start, 'YYYY_MM');
+        CONTINUE WHEN to_regclass(format('public.%I', v_name)) IS NOT NULL;
+
+        EXECUTE format(
+            'CREATE TABLE public.%I PARTITION OF public.messages FOR VALUES FROM (%L) TO (%L)',
+            v_name, v_start AT TIME ZONE 'UTC', (v_start + interval '1 month') AT TIME ZONE 'UTC'
+        );
+        -- Only reachable through public.messages and its policies, not as a table of its own
+        EXECUTE format('REVOKE ALL ON public.%I FROM anon, authenticated', v_name);
+        RETURN NEXT v_name;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- List the partitions of messages with their ranges, oldest first. detach_pending is set
+-- for a partition whose DETACH ... CONCURRENTLY was interrupted; it has to be finished
+-- with DETACH PARTITION ... FINALIZE.
+DROP FUNCTION IF EXISTS public.message_partitions();
+CREATE OR REPLACE FUNCTION public.message_partitions()
+RETURNS TABLE (
+    partition_name TEXT,
+    range_start TIMESTAMP WITH TIME ZONE,
+    range_end TIMESTAMP WITH TIME ZONE,
+    detach_pending BOOLEAN
+) AS $$
+    SELECT c.relname::TEXT,
+           b.bounds[1]::TIMESTAMP WITH TIME ZONE,
+           b.bounds[2]::TIMESTAMP WITH TIME ZONE,
+           i.inhdetachpending
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    CROSS JOIN LATERAL (
+        SELECT regexp_match(pg_get_expr(c.relpartbound, c.oid), 'FROM \(''([^'']+)''\) TO \(''([^'']+)''\)') AS bounds
+    ) b
+    WHERE i.inhparent = 'public.messages'::regclass
+    ORDER BY 2;
+$$ LANGUAGE sql STABLE;
+
+REVOKE EXECUTE ON FUNCTION public.create_message_partitions(INTEGER, TIMESTAMP WITH TIME ZONE) FROM PUBLIC, anon, authenticated;
+
+-- The current month and the next three; maintain_partitions.py keeps creating them ahead
+SELECT public.create_message_partitions(3);
+
+-- Skip an incoming message that is already stored. Its timestamp is when the bot received
+-- it, so a message Telegram delivers again (e.g. after a bot restart before the update was
+-- confirmed) arrives with a new timestamp and isn't caught by messages_telegram_message_key.
+-- Telegram keeps an update for at most a day, so only that window is searched, which also
+-- limits the lookup to one or two partitions. Two deliveries inserted concurrently can
+-- still both be stored; Telegram doesn't hand the same update to two getUpdates calls.
+CREATE OR REPLACE FUNCTION public.skip_redelivered_message()
 RETURNS TRIGGER AS $$
 BEGIN
-    UPDATE public.contacts
-    SET last_contact = NEW.timestamp
-    WHERE id = NEW.contact_id;
-    
+    IF NEW.telegram_message_id IS NOT NULL AND EXISTS (
+        SELECT 1
+        FROM public.messages m
+        WHERE m.bot_identifier = NEW.bot_identifier
+        AND m.telegram_chat_id = NEW.telegram_chat_id
+        AND m.telegram_message_id = NEW.telegram_message_id
+        AND m.timestamp >= NEW.timestamp - interval '1 day'
+    ) THEN
+        RETURN NULL;
+    END IF;
+
     RETURN NEW;
 END;
 $$ LANGUAGE plpgsql;
 
+CREATE TRIGGER skip_redelivered_message_trigger
+BEFORE INSERT ON public.messages
+FOR EACH ROW
+EXECUTE FUNCTION public.skip_redelivered_message();
+
+-- Fill in the bot of an outgoing message queued without one (the dashboard only names the
+-- contact), so the bots' Realtime listener can hand the insert to the bot that delivers it
+-- instead of waking every bot for every outgoing message.
+CREATE OR REPLACE FUNCTION public.set_outgoing_bot_identifier()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.direction = 'outgoing' AND NEW.bot_identifier IS NULL THEN
+        SELECT c.bot_identifier INTO NEW.bot_identifier
+        FROM public.contacts c
+        WHERE c.id = NEW.contact_id;
+    END IF;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER set_outgoing_bot_identifier_trigger
+BEFORE INSERT ON public.messages
+FOR EACH ROW
+EXECUTE FUNCTION public.set_outgoing_bot_identifier();
+
+-- Check whether the current request left last_contact to the bots. The bots send
+-- "X-Last-Contact: deferred" (PostgREST exposes request headers as request.headers)
+-- with the messages they store, and update last_contact themselves in batches
+-- through touch_contacts. SQL clients can SET bladex.defer_last_contact = 'on' instead.
+CREATE OR REPLACE FUNCTION public.is_last_contact_deferred()
+RETURNS BOOLEAN AS $$
+    SELECT coalesce(NULLIF(current_setting('request.headers', TRUE), '')::json->>'x-last-contact', '') = 'deferred'
+        OR coalesce(current_setting('bladex.defer_last_contact', TRUE), '') = 'on';
+$$ LANGUAGE sql STABLE;
+
+-- Create function to update last_contact in contacts when new messages are inserted.
+-- Runs once per INSERT statement: every contact in the statement is updated once, to
+-- its newest message, and only if that is newer than what's stored, so a batch insert
+-- doesn't rewrite (and lock) the same contact row once per message.
+CREATE OR REPLACE FUNCTION public.update_contact_last_contact()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF public.is_last_contact_deferred() THEN
+        RETURN NULL;
+    END IF;
+
+    UPDATE public.contacts c
+    SET last_contact = n.last_contact
+    FROM (
+        SELECT contact_id, max(timestamp) AS last_contact
+        FROM new_messages
+        GROUP BY contact_id
+    ) n
+    WHERE c.id = n.contact_id
+    AND (c.last_contact IS NULL OR c.last_contact < n.last_contact);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
 -- Create trigger to update last_contact
 CREATE TRIGGER update_contact_last_contact_trigger
 AFTER INSERT ON public.messages
-FOR EACH ROW
+REFERENCING NEW TABLE AS new_messages
+FOR EACH STATEMENT
 EXECUTE FUNCTION public.update_contact_last_contact();
 
+-- Create function used by the bots to update last_contact for many contacts at once.
+-- p_contacts is an array of {contact_info, last_contact}; each contact is moved
+-- forward to its newest timestamp, never back. Rows are locked in id order so
+-- concurrent calls from several bot processes can't deadlock. Returns the number
+-- of contacts updated.
+CREATE OR REPLACE FUNCTION public.touch_contacts(p_contacts JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+    v_updated INTEGER;
+BEGIN
+    WITH touched AS (
+        SELECT x.contact_info, max(x.last_contact) AS last_contact
+        FROM jsonb_to_recordset(p_contacts) AS x(contact_info TEXT, last_contact TIMESTAMP WITH TIME ZONE)
+        GROUP BY x.contact_info
+    ),
+    locked AS (
+        SELECT c.id, t.last_contact
+        FROM public.contacts c
+        JOIN touched t ON t.contact_info = c.contact_info
+        WHERE c.last_contact IS NULL OR c.last_contact < t.last_contact
+        ORDER BY c.id
+        FOR NO KEY UPDATE OF c
+    )
+    UPDATE public.contacts c
+    SET last_contact = l.last_contact
+    FROM locked l
+    WHERE c.id = l.id
+    AND (c.last_contact IS NULL OR c.last_contact < l.last_contact);
+    GET DIAGNOSTICS v_updated = ROW_COUNT;
+
+    RETURN v_updated;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Create function used by the Telegram bots to save a message in a single round trip:
+-- creates the contact if it doesn't exist yet and inserts the message.
+-- A message already stored under the same (bot, chat, Telegram message id) is not
+-- inserted again (see skip_redelivered_message); its existing id is returned instead.
+-- last_contact is updated by update_contact_last_contact_trigger, or by the bots through
+-- touch_contacts when they send X-Last-Contact: deferred.
+-- The bots' auto-reply worker also saves its replies through here, as unsent
+-- outgoing messages with p_is_ai_response.
+DROP FUNCTION IF EXISTS public.ingest_message(TEXT, TEXT, TEXT, TEXT, TIMESTAMP WITH TIME ZONE);
+DROP FUNCTION IF EXISTS public.ingest_message(TEXT, TEXT, TEXT, TEXT, TIMESTAMP WITH TIME ZONE, TEXT, BIGINT, BIGINT);
+CREATE OR REPLACE FUNCTION public.ingest_message(
+    p_contact_info TEXT,
+    p_contact_name TEXT,
+    p_content TEXT,
+    p_direction TEXT DEFAULT 'incoming',
+    p_timestamp TIMESTAMP WITH TIME ZONE DEFAULT now(),
+    p_bot_identifier TEXT DEFAULT NULL,
+    p_telegram_chat_id BIGINT DEFAULT NULL,
+    p_telegram_message_id BIGINT DEFAULT NULL,
+    p_is_ai_response BOOLEAN DEFAULT FALSE
+)
+RETURNS TABLE (
+    message_id UUID,
+    contact_id UUID,
+    contact_created BOOLEAN
+) AS $$
+#variable_conflict use_column
+DECLARE
+    v_contact_id UUID;
+    v_contact_created BOOLEAN := FALSE;
+    v_message_id UUID;
+BEGIN
+    -- Existing contacts keep their name
+    INSERT INTO public.contacts AS c (name, contact_info, last_contact, chat_id)
+    VALUES (p_contact_name, p_contact_info, p_timestamp, p_telegram_chat_id)
+    ON CONFLICT (contact_info) DO NOTHING
+    RETURNING c.id INTO v_contact_id;
+
+    IF v_contact_id IS NULL THEN
+        -- Replies go to the chat the customer last wrote from (e.g. a group instead of the private chat)
+        UPDATE public.contacts c
+        SET chat_id = p_telegram_chat_id
+        WHERE c.contact_info = p_contact_info
+        AND p_telegram_chat_id IS NOT NULL
+        AND c.chat_id IS DISTINCT FROM p_telegram_chat_id;
+
+        SELECT c.id INTO v_contact_id
+        FROM public.contacts c
+        WHERE c.contact_info = p_contact_info;
+    ELSE
+        v_contact_created := TRUE;
+    END IF;
+
+    INSERT INTO public.messages AS m (
+        contact_id, content, timestamp, direction, is_from_customer, is_ai_response, is_sent,
+        bot_identifier, telegram_chat_id, telegram_message_id
+    )
+    VALUES (
+        v_contact_id,
+        p_content,
+        p_timestamp,
+        p_direction,
+        p_direction = 'incoming',
+        p_is_ai_response,
+        p_direction = 'incoming',  -- Incoming messages are considered sent, outgoing need to be delivered
+        p_bot_identifier,
+        p_telegram_chat_id,
+        p_telegram_message_id
+    )
+    ON CONFLICT (bot_identifier, telegram_chat_id, telegram_message_id, timestamp) DO NOTHING
+    RETURNING m.id INTO v_message_id;
+
+    -- Already stored, e.g. Telegram delivered the update again or the request was retried
+    IF v_message_id IS NULL THEN
+        SELECT m.id INTO v_message_id
+        FROM public.messages m
+        WHERE m.bot_identifier = p_bot_identifier
+        AND m.telegram_chat_id = p_telegram_chat_id
+        AND m.telegram_message_id = p_telegram_message_id
+        AND m.timestamp >= p_timestamp - interval '1 day'
+        ORDER BY m.timestamp
+        LIMIT 1;
+    END IF;
+
+    RETURN QUERY SELECT v_message_id, v_contact_id, v_contact_created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Create function used by the bots' write-behind mode to save a batch of messages
+-- in one request. Each element of p_messages has contact_info, contact_name,
+-- content, direction, timestamp and, for messages from Telegram, bot_identifier,
+-- telegram_chat_id and telegram_message_id. Missing contacts are created first.
+-- Messages that are already stored are skipped, so a batch can safely be sent
+-- again after a timeout.
+CREATE OR REPLACE FUNCTION public.ingest_messages(p_messages JSONB)
+RETURNS TABLE (
+    message_id UUID,
+    contact_id UUID,
+    contact_info TEXT
+) AS $$
+#variable_conflict use_column
+BEGIN
+    -- Create missing contacts and point existing ones at the chat of their latest message in the batch
+    INSERT INTO public.contacts AS c (name, contact_info, last_contact, chat_id)
+    SELECT DISTINCT ON (r.contact_info) r.contact_name, r.contact_info, r.timestamp, r.telegram_chat_id
+    FROM jsonb_array_elements(p_messages) WITH ORDINALITY AS e(value, ord),
+         jsonb_to_record(e.value) AS r(contact_info TEXT, contact_name TEXT, timestamp TIMESTAMP WITH TIME ZONE, telegram_chat_id BIGINT)
+    ORDER BY r.contact_info, e.ord DESC
+    ON CONFLICT (contact_info) DO UPDATE
+        SET chat_id = EXCLUDED.chat_id
+        WHERE EXCLUDED.chat_id IS NOT NULL AND c.chat_id IS DISTINCT FROM EXCLUDED.chat_id;
+
+    RETURN QUERY
+    WITH batch AS (
+        SELECT r.*, e.ord
+        FROM jsonb_array_elements(p_messages) WITH ORDINALITY AS e(value, ord),
+             jsonb_to_record(e.value) AS r(
+                 contact_info TEXT, content TEXT, direction TEXT, timestamp TIMESTAMP WITH TIME ZONE,
+                 bot_identifier TEXT, telegram_chat_id BIGINT, telegram_message_id BIGINT
+             )
+    ),
+    inserted AS (
+        INSERT INTO public.messages AS m (
+            contact_id, content, timestamp, direction, is_from_customer, is_ai_response, is_sent,
+            bot_identifier, telegram_chat_id, telegram_message_id
+        )
+        SELECT c.id, b.content, b.timestamp, b.direction, b.direction = 'incoming', FALSE, b.direction = 'incoming',
+               b.bot_identifier, b.telegram_chat_id, b.telegram_message_id
+        FROM batch b
+        JOIN public.contacts c ON c.contact_info = b.contact_info
+        ORDER BY b.ord
+        ON CONFLICT (bot_identifier, telegram_chat_id, telegram_message_id, timestamp) DO NOTHING
+        RETURNING m.id, m.contact_id
+    )
+    SELECT i.id, i.contact_id, c.contact_info
+    FROM inserted i
+    JOIN public.contacts c ON c.id = i.contact_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Create function used by the bots to claim outgoing messages for delivery.
+-- Rows are locked with SKIP LOCKED so concurrent workers never claim the same message,
+-- and a claim is only valid until lease_expires_at, after which another worker may take over.
+-- The contact's chat_id is returned so the bot knows where to deliver without another request.
+DROP FUNCTION IF EXISTS public.claim_outgoing_messages(TEXT, TEXT, INTEGER, INTEGER);
+CREATE OR REPLACE FUNCTION public.claim_outgoing_messages(
+    p_bot_identifier TEXT,
+    p_worker_id TEXT,
+    p_limit INTEGER DEFAULT 100,
+    p_lease_seconds INTEGER DEFAULT 120
+)
+RETURNS TABLE (
+    message_id UUID,
+    contact_id UUID,
+    content TEXT,
+    message_timestamp TIMESTAMP WITH TIME ZONE,
+    contact_info TEXT,
+    delivery_attempts INTEGER,
+    chat_id BIGINT
+) AS $$
+#variable_conflict use_column
+BEGIN
+    RETURN QUERY
+    WITH claimable AS (
+        SELECT m.id, m.timestamp
+        FROM public.messages m
+        JOIN public.contacts c ON c.id = m.contact_id
+        WHERE m.direction = 'outgoing'
+        AND m.is_sent = FALSE
+        AND m.delivery_error IS NULL
+        AND (m.lease_expires_at IS NULL OR m.lease_expires_at < now())
+        AND (p_bot_identifier IS NULL OR c.bot_identifier = p_bot_identifier)
+        ORDER BY m.timestamp
+        LIMIT p_limit
+        FOR UPDATE OF m SKIP LOCKED
+    ),
+    claimed AS (
+        UPDATE public.messages m
+        SET claimed_by = p_worker_id,
+            lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+            delivery_attempts = m.delivery_attempts + 1
+        FROM claimable
+        WHERE m.id = claimable.id
+        AND m.timestamp = claimable.timestamp
+        RETURNING m.id, m.contact_id, m.content, m.timestamp, m.delivery_attempts
+    )
+    SELECT cl.id, cl.contact_id, cl.content, cl.timestamp, c.contact_info, cl.delivery_attempts, c.chat_id
+    FROM claimed cl
+    JOIN public.contacts c ON c.id = cl.contact_id
+    ORDER BY cl.timestamp;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Broadcasts: one message sent to many contacts. The dashboard creates the broadcast
+-- and its recipient rows in a single call; the bots claim recipients in batches,
+-- send them concurrently and record the outcome of each batch in one call.
+CREATE TABLE public.broadcasts (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    content TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'sending' CHECK (status IN ('sending', 'completed')),
+    total_recipients INTEGER NOT NULL DEFAULT 0,
+    sent_count INTEGER NOT NULL DEFAULT 0,
+    failed_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+    completed_at TIMESTAMP WITH TIME ZONE
+);
+
+COMMENT ON TABLE public.broadcasts IS 'Messages sent to many contacts at once, with delivery progress';
+COMMENT ON COLUMN public.broadcasts.status IS 'sending until every recipient was sent to or failed, then completed';
+COMMENT ON COLUMN public.broadcasts.sent_count IS 'Recipients the message was delivered to so far';
+COMMENT ON COLUMN public.broadcasts.failed_count IS 'Recipients delivery was given up for';
+
+CREATE TABLE public.broadcast_recipients (
+    broadcast_id UUID NOT NULL REFERENCES public.broadcasts(id) ON DELETE CASCADE,
+    contact_id UUID NOT NULL REFERENCES public.contacts(id) ON DELETE CASCADE,
+    bot_identifier TEXT,  -- Copied from the contact, so bots claim their recipients without a join
+    status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'sent', 'failed')),
+    claimed_by TEXT,  -- Bot worker currently sending to this recipient
+    lease_expires_at TIMESTAMP WITH TIME ZONE,  -- Claim expiry; also used to delay retries
+    delivery_attempts INTEGER NOT NULL DEFAULT 0,
+    delivery_error TEXT,
+    sent_at TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (broadcast_id, contact_id)
+);
+
+COMMENT ON TABLE public.broadcast_recipients IS 'Delivery state of a broadcast for each of its recipients';
+
+CREATE INDEX idx_broadcast_recipients_pending ON public.broadcast_recipients(bot_identifier)
+    WHERE status = 'pending';
+
+-- Create a broadcast to the given contacts; unknown contact ids are skipped. Contacts
+-- without a bot (no bot_identifier in their contact_info) can't be claimed by any bot,
+-- so they are recorded as failed right away instead of keeping the broadcast open.
+CREATE OR REPLACE FUNCTION public.create_broadcast(
+    p_content TEXT,
+    p_contact_ids UUID[]
+)
+RETURNS TABLE (
+    broadcast_id UUID,
+    total_recipients INTEGER
+) AS $$
+#variable_conflict use_column
+DECLARE
+    v_broadcast_id UUID;
+    v_total INTEGER;
+    v_failed INTEGER;
+BEGIN
+    INSERT INTO public.broadcasts (content)
+    VALUES (p_content)
+    RETURNING id INTO v_broadcast_id;
+
+    WITH inserted AS (
+        INSERT INTO public.broadcast_recipients (broadcast_id, contact_id, bot_identifier, status, delivery_error)
+        SELECT v_broadcast_id, c.id, c.bot_identifier,
+               CASE WHEN c.bot_identifier IS NULL THEN 'failed' ELSE 'pending' END,
+               CASE WHEN c.bot_identifier IS NULL THEN 'Contact is not linked to a bot' END
+        FROM public.contacts c
+        WHERE c.id = ANY(p_contact_ids)
+        RETURNING status
+    )
+    SELECT count(*), count(*) FILTER (WHERE status = 'failed')
+    INTO v_total, v_failed
+    FROM inserted;
+
+    UPDATE public.broadcasts
+    SET total_recipients = v_total,
+        failed_count = v_failed,
+        status = CASE WHEN v_failed = v_total THEN 'completed' ELSE status END,
+        completed_at = CASE WHEN v_failed = v_total THEN now() END
+    WHERE id = v_broadcast_id;
+
+    RETURN QUERY SELECT v_broadcast_id, v_total;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Claim a batch of pending broadcast recipients for one bot, like claim_outgoing_messages
+CREATE OR REPLACE FUNCTION public.claim_broadcast_recipients(
+    p_bot_identifier TEXT,
+    p_worker_id TEXT,
+    p_limit INTEGER DEFAULT 500,
+    p_lease_seconds INTEGER DEFAULT 300
+)
+RETURNS TABLE (
+    broadcast_id UUID,
+    contact_id UUID,
+    content TEXT,
+    contact_info TEXT,
+    chat_id BIGINT,
+    delivery_attempts INTEGER
+) AS $$
+#variable_conflict use_column
+BEGIN
+    RETURN QUERY
+    WITH claimable AS (
+        SELECT r.broadcast_id, r.contact_id
+        FROM public.broadcast_recipients r
+        WHERE r.status = 'pending'
+        AND (r.lease_expires_at IS NULL OR r.lease_expires_at < now())
+        AND (p_bot_identifier IS NULL OR r.bot_identifier = p_bot_identifier)
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    ),
+    claimed AS (
+        UPDATE public.broadcast_recipients r
+        SET claimed_by = p_worker_id,
+            lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+            delivery_attempts = r.delivery_attempts + 1
+        FROM claimable
+        WHERE r.broadcast_id = claimable.broadcast_id
+        AND r.contact_id = claimable.contact_id
+        RETURNING r.broadcast_id, r.contact_id, r.delivery_attempts
+    )
+    SELECT cl.broadcast_id, cl.contact_id, b.content, c.contact_info, c.chat_id, cl.delivery_attempts
+    FROM claimed cl
+    JOIN public.broadcasts b ON b.id = cl.broadcast_id
+    JOIN public.contacts c ON c.id = cl.contact_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Record the outcome of a batch of claimed recipients in one statement. p_results is an
+-- array of {broadcast_id, contact_id, status, error} with status 'sent', 'failed' or
+-- 'retry' (released again after p_retry_delay_seconds). Delivered messages are added to
+-- each contact's conversation and the broadcasts' counters are bumped. Returns the
+-- number of recipients updated; results for recipients no longer claimed by
+-- p_worker_id (their lease expired) are ignored.
+CREATE OR REPLACE FUNCTION public.complete_broadcast_recipients(
+    p_worker_id TEXT,
+    p_results JSONB,
+    p_retry_delay_seconds INTEGER DEFAULT 30
+)
+RETURNS INTEGER AS $$
+DECLARE
+    v_updated INTEGER;
+BEGIN
+    WITH results AS (
+        SELECT *
+        FROM jsonb_to_recordset(p_results) AS x(broadcast_id UUID, contact_id UUID, status TEXT, error TEXT)
+    ),
+    updated AS (
+        UPDATE public.broadcast_recipients r
+        SET status = CASE WHEN x.status = 'retry' THEN 'pending' ELSE x.status END,
+            claimed_by = NULL,
+            lease_expires_at = CASE WHEN x.status = 'retry' THEN now() + make_interval(secs => p_retry_delay_seconds) END,
+            delivery_error = x.error,
+            sent_at = CASE WHEN x.status = 'sent' THEN now() END
+        FROM results x
+        WHERE r.broadcast_id = x.broadcast_id
+        AND r.contact_id = x.contact_id
+        AND r.claimed_by = p_worker_id
+        AND r.status = 'pending'
+        RETURNING r.broadcast_id, r.contact_id, r.status
+    ),
+    history AS (
+        INSERT INTO public.messages (contact_id, content, direction, is_from_customer, is_ai_response, is_sent)
+        SELECT u.contact_id, b.content, 'outgoing', FALSE, FALSE, TRUE
+        FROM updated u
+        JOIN public.broadcasts b ON b.id = u.broadcast_id
+        WHERE u.status = 'sent'
+    ),
+    counts AS (
+        SELECT broadcast_id,
+               count(*) FILTER (WHERE status = 'sent') AS sent,
+               count(*) FILTER (WHERE status = 'failed') AS failed
+        FROM updated
+        GROUP BY broadcast_id
+    ),
+    progress AS (
+        UPDATE public.broadcasts b
+        SET sent_count = b.sent_count + counts.sent,
+            failed_count = b.failed_count + counts.failed,
+            status = CASE
+                WHEN b.sent_count + b.failed_count + counts.sent + counts.failed >= b.total_recipients THEN 'completed'
+                ELSE b.status
+            END,
+            completed_at = CASE
+                WHEN b.sent_count + b.failed_count + counts.sent + counts.failed >= b.total_recipients THEN now()
+                ELSE b.completed_at
+            END
+        FROM counts
+        WHERE b.id = counts.broadcast_id
+    )
+    SELECT count(*) INTO v_updated FROM updated;
+
+    RETURN v_updated;
+END;
+$$ LANGUAGE plpgsql;
+
 -- Create functions for querying customers
-CREATE OR REPLACE FUNCTION public.get_customers_by_message_keyword(keyword TEXT)
+
+-- Contacts with messages matching a keyword, optionally within a date range. A message
+-- matches if it contains the keyword (case-insensitive, served by the trigram index) or
+-- matches it as full-text words (served by the full-text index, so "refunds" also finds
+-- "refund"). rank is the summed full-text relevance of the contact's matching messages.
+CREATE OR REPLACE FUNCTION public.search_message_contacts(
+    keyword TEXT,
+    start_date TIMESTAMP WITH TIME ZONE DEFAULT NULL,
+    end_date TIMESTAMP WITH TIME ZONE DEFAULT NULL
+)
+RETURNS TABLE (
+    contact_id UUID,
+    match_count BIGINT,
+    last_match_at TIMESTAMP WITH TIME ZONE,
+    rank REAL
+) AS $$
+#variable_conflict use_column
+DECLARE
+    v_query TSQUERY := plainto_tsquery('english', keyword);
+    -- Match the keyword literally, not as a LIKE pattern
+    v_pattern TEXT := '%' || replace(replace(replace(keyword, '\', '\\'), '%', '\%'), '_', '\_') || '%';
+BEGIN
+    RETURN QUERY
+    SELECT m.contact_id,
+           count(*),
+           max(m.timestamp),
+           sum(ts_rank(to_tsvector('english', m.content), v_query))::REAL
+    FROM public.messages m
+    WHERE (to_tsvector('english', m.content) @@ v_query OR m.content ILIKE v_pattern)
+    AND (start_date IS NULL OR m.timestamp >= start_date)
+    AND (end_date IS NULL OR m.timestamp <= end_date)
+    GROUP BY m.contact_id;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+DROP FUNCTION IF EXISTS public.get_customers_by_message_keyword(TEXT);
+CREATE OR REPLACE FUNCTION public.get_customers_by_message_keyword(
+    keyword TEXT,
+    result_limit INTEGER DEFAULT 100,
+    result_offset INTEGER DEFAULT 0
+)
 RETURNS TABLE (
     id UUID,
     name TEXT,
-    contact_info TEXT
+    contact_info TEXT,
+    match_count BIGINT,
+    last_match_at TIMESTAMP WITH TIME ZONE,
+    rank REAL
 ) AS $$
+#variable_conflict use_column
 BEGIN
     RETURN QUERY 
-    SELECT DISTINCT c.id, c.name, c.contact_info
-    FROM public.contacts c
-    JOIN public.messages m ON c.id = m.contact_id
-    WHERE m.content ILIKE '%' || keyword || '%'
-    ORDER BY c.last_contact DESC;
+    SELECT c.id, c.name, c.contact_info, s.match_count, s.last_match_at, s.rank
+    FROM public.search_message_contacts(keyword) s
+    JOIN public.contacts c ON c.id = s.contact_id
+    ORDER BY s.rank DESC, s.last_match_at DESC, c.id
+    LIMIT result_limit
+    OFFSET result_offset;
 END;
-$$ LANGUAGE plpgsql;
+$$ LANGUAGE plpgsql STABLE;
 
+DROP FUNCTION IF EXISTS public.get_customers_by_message_keyword_and_date_range(TEXT, TIMESTAMP WITH TIME ZONE, TIMESTAMP WITH TIME ZONE);
 CREATE OR REPLACE FUNCTION public.get_customers_by_message_keyword_and_date_range(
     keyword TEXT,
     start_date TIMESTAMP WITH TIME ZONE,
-    end_date TIMESTAMP WITH TIME ZONE
+    end_date TIMESTAMP WITH TIME ZONE,
+    result_limit INTEGER DEFAULT 100,
+    result_offset INTEGER DEFAULT 0
 )
 RETURNS TABLE (
     id UUID,
     name TEXT,
-    contact_info TEXT
+    contact_info TEXT,
+    match_count BIGINT,
+    last_match_at TIMESTAMP WITH TIME ZONE,
+    rank REAL
 ) AS $$
+#variable_conflict use_column
 BEGIN
     RETURN QUERY 
-    SELECT DISTINCT c.id, c.name, c.contact_info
-    FROM public.contacts c
-    JOIN public.messages m ON c.id = m.contact_id
-    WHERE m.content ILIKE '%' || keyword || '%'
-    AND m.timestamp >= start_date
-    AND m.timestamp <= end_date
-    ORDER BY c.last_contact DESC;
+    SELECT c.id, c.name, c.contact_info, s.match_count, s.last_match_at, s.rank
+    FROM public.search_message_contacts(keyword, start_date, end_date) s
+    JOIN public.contacts c ON c.id = s.contact_id
+    ORDER BY s.rank DESC, s.last_match_at DESC, c.id
+    LIMIT result_limit
+    OFFSET result_offset;
 END;
-$$ LANGUAGE plpgsql;
+$$ LANGUAGE plpgsql STABLE;
 
 -- Enable Row Level Security (RLS)
 ALTER TABLE public.contacts ENABLE ROW LEVEL SECURITY;
 ALTER TABLE public.messages ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.broadcasts ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.broadcast_recipients ENABLE ROW LEVEL SECURITY;
 
 -- Create policies (for now, we'll allow all access for simplicity)
 CREATE POLICY "Allow full access to contacts" ON public.contacts FOR ALL USING (true);
 CREATE POLICY "Allow full access to messages" ON public.messages FOR ALL USING (true);
+CREATE POLICY "Allow full access to broadcasts" ON public.broadcasts FOR ALL USING (true);
+CREATE POLICY "Allow full access to broadcast_recipients" ON public.broadcast_recipients FOR ALL USING (true);
 
--- Enable realtime subscriptions
+-- Enable realtime subscriptions. Changes to the messages partitions are published as
+-- changes to public.messages, which is what the dashboard and the bots subscribe to.
+ALTER PUBLICATION supabase_realtime SET (publish_via_partition_root = true);
 ALTER PUBLICATION supabase_realtime ADD TABLE public.contacts;
-ALTER PUBLICATION supabase_realtime ADD TABLE public.messages;
\ No newline at end of file
+ALTER PUBLICATION supabase_realtime ADD TABLE public.messages;
+ALTER PUBLICATION supabase_realtime ADD TABLE public.broadcasts;
\ No newline at end of file
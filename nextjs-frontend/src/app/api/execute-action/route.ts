@@ -13,52 +13,37 @@ export async function POST(request: Request) {
     }
 
     if (action === 'send_message') {
-      // In a real implementation, this would call the Telegram API to send messages
-      // For the MVP, we'll just insert the messages into the database
-      
-      const results = [];
-      const errors = [];
-
-      for (const recipient of recipients) {
-        // Insert message record for each recipient
-        const { data, error } = await supabase
-          .from('messages')
-          .insert({
-            contact_id: recipient.id,
-            content: message,
-            direction: 'outgoing',
-            is_from_customer: false,
-            is_ai_response: false,
-            timestamp: new Date().toISOString(),
-          })
-          .select();
+      // Create one broadcast job for all recipients; the Telegram bots claim the
+      // recipients in batches, send concurrently within Telegram's rate limits and
+      // record delivery progress on the broadcast
+      const { data, error } = await supabase.rpc('create_broadcast', {
+        p_content: message,
+        p_contact_ids: recipients.map((recipient: any) => recipient.id),
+      });
 
-        if (error) {
-          errors.push({ recipient: recipient.name, error: error.message });
-        } else {
-          results.push({ recipient: recipient.name, status: 'sent' });
-          
-          // Update the contact's last_contact timestamp
-          await supabase
-            .from('contacts')
-            .update({ last_contact: new Date().toISOString() })
-            .eq('id', recipient.id);
-        }
+      if (error) {
+        return NextResponse.json(
+          { error: error.message || 'Failed to create broadcast' },
+          { status: 500 }
+        );
       }
 
-      if (errors.length > 0) {
-        return NextResponse.json({ 
+      const { broadcast_id, total_recipients } = data[0];
+
+      if (total_recipients < recipients.length) {
+        return NextResponse.json({
           status: 'partial_success',
-          message: 'Some messages could not be sent',
-          results,
-          errors
+          message: `${recipients.length - total_recipients} recipients were not found`,
+          broadcast_id,
+          total_recipients
         });
       }
 
-      return NextResponse.json({ 
+      return NextResponse.json({
         status: 'success',
-        message: 'Messages sent successfully',
-        results
+        message: 'Broadcast queued for delivery',
+        broadcast_id,
+        total_recipients
       });
     }
 
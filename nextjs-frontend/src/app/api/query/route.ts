@@ -2,9 +2,45 @@ import { NextResponse } from 'next/server';
 import { parseNaturalLanguageQuery } from '@/lib/anthropic/client';
 import { supabase } from '@/lib/supabase/client';
 
+const SEARCH_FUNCTIONS = [
+  'get_customers_by_message_keyword',
+  'get_customers_by_message_keyword_and_date_range',
+];
+
+// Page size used when collecting every matching customer for an action
+const ACTION_PAGE_SIZE = 1000;
+
+// Largest page of results a query may ask for; larger limits are lowered to it
+const MAX_QUERY_LIMIT = 1000;
+
+// Parse a request field holding a non-negative integer (a number or a numeric string);
+// null if it holds anything else
+function parseNonNegativeInteger(value: unknown): number | null {
+  const parsed = typeof value === 'string' && value.trim() !== '' ? Number(value) : value;
+  return typeof parsed === 'number' && Number.isSafeInteger(parsed) && parsed >= 0 ? parsed : null;
+}
+
+// Run one of the indexed keyword search functions (see backend/supabase/schema.sql);
+// results are ranked by relevance and paginated
+async function searchCustomers(functionName: string, parameters: any, limit: number, offset: number) {
+  const args: Record<string, any> = {
+    keyword: parameters.keyword,
+    result_limit: limit,
+    result_offset: offset,
+  };
+  if (functionName === 'get_customers_by_message_keyword_and_date_range') {
+    args.start_date = parameters.start_date;
+    args.end_date = parameters.end_date;
+  }
+
+  const { data, error } = await supabase.rpc(functionName, args);
+  if (error) throw error;
+  return data || [];
+}
+
 export async function POST(request: Request) {
   try {
-    const { prompt } = await request.json();
+    const { prompt, limit: requestedLimit = 100, offset: requestedOffset = 0 } = await request.json();
 
     if (!prompt) {
       return NextResponse.json(
@@ -13,6 +49,16 @@ export async function POST(request: Request) {
       );
     }
 
+    const parsedLimit = parseNonNegativeInteger(requestedLimit);
+    const offset = parseNonNegativeInteger(requestedOffset);
+    if (!parsedLimit || offset === null) {
+      return NextResponse.json(
+        { error: 'limit must be a positive integer and offset a non-negative integer' },
+        { status: 400 }
+      );
+    }
+    const limit = Math.min(parsedLimit, MAX_QUERY_LIMIT);
+
     // Parse the natural language query
     const parsedQuery = await parseNaturalLanguageQuery(prompt);
 
@@ -27,72 +73,14 @@ export async function POST(request: Request) {
     if (parsedQuery.type === 'query') {
       const { functionName, parameters } = parsedQuery.query;
       
-      // Execute the query against Supabase using a direct approach
-      if (functionName === 'get_customers_by_message_keyword') {
-        // First, get messages matching the keyword
-        const { data: messageData, error: messageError } = await supabase
-          .from('messages')
-          .select('contact_id')
-          .ilike('content', `%${parameters.keyword}%`);
-          
-        if (messageError) throw messageError;
-        
-        if (!messageData || messageData.length === 0) {
-          return NextResponse.json({ 
-            type: 'query_result', 
-            data: [] 
-          });
-        }
-        
-        // Get unique contact IDs
-        const contactIds = [...new Set(messageData.map(msg => msg.contact_id))];
-        
-        // Then get the contact details
-        const { data: contactData, error: contactError } = await supabase
-          .from('contacts')
-          .select('id, name, contact_info')
-          .in('id', contactIds);
-          
-        if (contactError) throw contactError;
+      if (SEARCH_FUNCTIONS.includes(functionName)) {
+        const data = await searchCustomers(functionName, parameters, limit, offset);
         
         return NextResponse.json({ 
           type: 'query_result', 
-          data: contactData || [] 
-        });
-      }
-      
-      if (functionName === 'get_customers_by_message_keyword_and_date_range') {
-        // First, get messages matching the keyword and date range
-        const { data: messageData, error: messageError } = await supabase
-          .from('messages')
-          .select('contact_id')
-          .ilike('content', `%${parameters.keyword}%`)
-          .gte('timestamp', parameters.start_date)
-          .lte('timestamp', parameters.end_date);
-          
-        if (messageError) throw messageError;
-        
-        if (!messageData || messageData.length === 0) {
-          return NextResponse.json({ 
-            type: 'query_result', 
-            data: [] 
-          });
-        }
-        
-        // Get unique contact IDs
-        const contactIds = [...new Set(messageData.map(msg => msg.contact_id))];
-        
-        // Then get the contact details
-        const { data: contactData, error: contactError } = await supabase
-          .from('contacts')
-          .select('id, name, contact_info')
-          .in('id', contactIds);
-          
-        if (contactError) throw contactError;
-        
-        return NextResponse.json({ 
-          type: 'query_result', 
-          data: contactData || [] 
+          data,
+          limit,
+          offset
         });
       }
     }
@@ -102,57 +90,13 @@ export async function POST(request: Request) {
       if (parsedQuery.action === 'send_message') {
         const { functionName, parameters } = parsedQuery.query;
         
-        // Get the list of customers using the direct approach
-        let data;
-        if (functionName === 'get_customers_by_message_keyword') {
-          // First, get messages matching the keyword
-          const { data: messageData, error: messageError } = await supabase
-            .from('messages')
-            .select('contact_id')
-            .ilike('content', `%${parameters.keyword}%`);
-            
-          if (messageError) throw messageError;
-          
-          if (messageData && messageData.length > 0) {
-            // Get unique contact IDs
-            const contactIds = [...new Set(messageData.map(msg => msg.contact_id))];
-            
-            // Then get the contact details
-            const { data: contactData, error: contactError } = await supabase
-              .from('contacts')
-              .select('id, name, contact_info')
-              .in('id', contactIds);
-              
-            if (contactError) throw contactError;
-            data = contactData;
-          } else {
-            data = [];
-          }
-        } else if (functionName === 'get_customers_by_message_keyword_and_date_range') {
-          // First, get messages matching the keyword and date range
-          const { data: messageData, error: messageError } = await supabase
-            .from('messages')
-            .select('contact_id')
-            .ilike('content', `%${parameters.keyword}%`)
-            .gte('timestamp', parameters.start_date)
-            .lte('timestamp', parameters.end_date);
-            
-          if (messageError) throw messageError;
-          
-          if (messageData && messageData.length > 0) {
-            // Get unique contact IDs
-            const contactIds = [...new Set(messageData.map(msg => msg.contact_id))];
-            
-            // Then get the contact details
-            const { data: contactData, error: contactError } = await supabase
-              .from('contacts')
-              .select('id, name, contact_info')
-              .in('id', contactIds);
-              
-            if (contactError) throw contactError;
-            data = contactData;
-          } else {
-            data = [];
+        // Collect every matching customer, a page at a time
+        const data: any[] = [];
+        if (SEARCH_FUNCTIONS.includes(functionName)) {
+          for (let page = 0; ; page += ACTION_PAGE_SIZE) {
+            const customers = await searchCustomers(functionName, parameters, ACTION_PAGE_SIZE, page);
+            data.push(...customers);
+            if (customers.length < ACTION_PAGE_SIZE) break;
           }
         }
         
@@ -161,7 +105,7 @@ export async function POST(request: Request) {
           type: 'pending_action', 
           action: 'send_message',
           message: parsedQuery.message,
-          recipients: data || []
+          recipients: data
         });
       }
     }
@@ -191,12 +191,8 @@ const ChatDashboard = () => {
 
       if (error) throw error;
 
-      // Update customer's last_contact timestamp
-      await supabase
-        .from('contacts')
-        .update({ last_contact: timestamp })
-        .eq('id', selectedCustomerId);
-        
+      // The customer's last_contact is updated by the messages trigger
+      
       console.log(`Message sent and will be delivered by the bot: ${content}`);
     } catch (error) {
       console.error('Error sending message:', error);
@@ -0,0 +1,78 @@
+"""
+Benchmark for concurrent update handling (UPDATE_CONCURRENCY)
+
+Runs the offline load test (benchmarks/load_test.py) once per concurrency limit,
+each in its own process since the bots read their settings at import, and reports
+ingest throughput, message-to-DB latency and messages stored out of order within
+their chat, which should be 0 at every limit.
+
+Examples:
+    python -m benchmarks.concurrency_benchmark
+    python -m benchmarks.concurrency_benchmark --concurrency 1 4 16 64 --db-latency-ms 50 --rate 2000
+"""
+import sys
+import json
+import argparse
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def run_load_test(args, concurrency):
+    command = [
+        sys.executable, "-m", "benchmarks.load_test", "--json",
+        "--bots", str(args.bots), "--users", str(args.users), "--rate", str(args.rate),
+        "--outgoing-rate", "0", "--duration", str(args.duration),
+        "--db-latency-ms", str(args.db_latency_ms), "--db-jitter-ms", str(args.db_jitter_ms),
+        "--update-concurrency", str(concurrency), "--drain-timeout", str(args.drain_timeout)
+    ]
+    if args.write_behind:
+        command.append("--write-behind")
+
+    output = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    incoming = json.loads(output)['incoming']
+    return {
+        'concurrency': concurrency,
+        'stored': incoming['stored'],
+        'generated': incoming['generated'],
+        'throughput_per_s': incoming['throughput_per_s'],
+        'p50_ms': incoming['latency_ms']['p50'],
+        'p95_ms': incoming['latency_ms']['p95'],
+        'out_of_order': incoming['out_of_order']
+    }
+
+def print_report(result):
+    print(f"\n{'concurrency':>11} {'stored':>13} {'msg/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'out of order':>13}")
+    for row in result['results']:
+        print(f"{row['concurrency']:>11} {row['stored']:>6}/{row['generated']:<6} {row['throughput_per_s']:>8} "
+              f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['out_of_order']:>13}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure ingest throughput for several UPDATE_CONCURRENCY limits")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--bots", type=int, default=2)
+    parser.add_argument("--users", type=int, default=200, help="Customers per bot")
+    parser.add_argument("--rate", type=float, default=1000, help="Incoming messages per second (all bots)")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--db-latency-ms", type=float, default=30)
+    parser.add_argument("--db-jitter-ms", type=float, default=20)
+    parser.add_argument("--drain-timeout", type=float, default=300)
+    parser.add_argument("--write-behind", action="store_true", help="Enable MESSAGE_WRITE_BEHIND")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = []
+    for concurrency in args.concurrency:
+        print(f"UPDATE_CONCURRENCY={concurrency}...", file=sys.stderr)
+        results.append(run_load_test(args, concurrency))
+    result = {'settings': vars(args), 'results': results}
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+if __name__ == "__main__":
+    main()
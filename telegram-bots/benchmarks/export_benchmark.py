@@ -0,0 +1,130 @@
+"""
+Benchmark for export_messages.py
+
+Seeds the fake PostgREST (see stubs/) with synthetic messages, runs the
+exporter against it in a child process for each page size and reports:
+
+- export throughput (rows per second)
+- peak RSS of the exporter process, which should stay flat as --rows grows
+- rows read back from the part files, to check nothing was skipped or repeated
+
+Examples:
+    python -m benchmarks.export_benchmark --rows 50000
+    python -m benchmarks.export_benchmark --rows 200000 --page-sizes 500 1000 5000 --db-latency-ms 5
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import shutil
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from datetime import datetime, timedelta
+
+# Make the bots package importable when run as a script
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stubs.fake_postgrest import FakePostgrestServer
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def seed_messages(db, rows, bots, contacts_per_bot, seed):
+    """Insert `rows` messages spread over the bots' contacts, a second apart"""
+    rng = random.Random(seed)
+    contacts = [
+        db.upsert_contact(f"{100000 + i}:bot{b + 1}")[0]
+        for b in range(bots) for i in range(contacts_per_bot)
+    ]
+    started = datetime(2024, 1, 1)
+    for index in range(rows):
+        db.insert_message({
+            'contact_id': rng.choice(contacts),
+            'content': f"Message {index} " + "lorem ipsum " * rng.randint(1, 20),
+            'timestamp': (started + timedelta(seconds=index // 2)).isoformat(),
+            'direction': rng.choice(('incoming', 'outgoing'))
+        })
+
+def run_exporter(command, env):
+    """Run the exporter and return (exit status, seconds, peak RSS in MB)"""
+    started = time.monotonic()
+    process = subprocess.Popen(command, env=env, cwd=ROOT)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.monotonic() - started
+    # ru_maxrss is in kilobytes on Linux
+    return os.waitstatus_to_exitcode(status), elapsed, usage.ru_maxrss / 1024
+
+def count_rows(out_dir):
+    ids = set()
+    for path in sorted(Path(out_dir).glob("part-*.jsonl.gz")):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                ids.add(json.loads(line)['id'])
+    return len(ids)
+
+async def run_benchmark(args):
+    db = await FakePostgrestServer(latency=args.db_latency_ms / 1000).start()
+    print(f"Seeding {args.rows} messages...", file=sys.stderr)
+    seed_messages(db, args.rows, args.bots, args.contacts, args.seed)
+
+    env = {**os.environ, 'SUPABASE_URL': db.url}
+    results = []
+    for page_size in args.page_sizes:
+        out_dir = tempfile.mkdtemp(prefix="bladex-export-")
+        command = [
+            sys.executable, "export_messages.py", "--out", out_dir, "--format", args.format,
+            "--page-size", str(page_size), "--part-rows", str(args.part_rows), "--log-level", "WARNING"
+        ]
+        if args.bot:
+            command += ["--bot", args.bot]
+
+        # The fake server runs on this event loop, so wait for the child in a thread
+        status, elapsed, peak_rss = await asyncio.to_thread(run_exporter, command, env)
+        results.append({
+            'page_size': page_size,
+            'status': status,
+            'rows_exported': count_rows(out_dir) if args.format == 'jsonl' else None,
+            'seconds': round(elapsed, 2),
+            'rows_per_s': round(args.rows / elapsed) if not args.bot else None,
+            'peak_rss_mb': round(peak_rss, 1)
+        })
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    await db.stop()
+    return {'settings': vars(args), 'results': results}
+
+def print_report(result):
+    print(f"\n{'page size':>10} {'status':>7} {'rows':>9} {'seconds':>8} {'rows/s':>8} {'peak RSS MB':>12}")
+    for row in result['results']:
+        print(f"{row['page_size']:>10} {row['status']:>7} {str(row['rows_exported']):>9} {row['seconds']:>8} "
+              f"{str(row['rows_per_s']):>8} {row['peak_rss_mb']:>12}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark export_messages.py against the fake PostgREST")
+    parser.add_argument("--rows", type=int, default=50000, help="Messages to seed")
+    parser.add_argument("--bots", type=int, default=4)
+    parser.add_argument("--contacts", type=int, default=100, help="Contacts per bot")
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--part-rows", type=int, default=100000)
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    parser.add_argument("--bot", help="Export only this bot (rows/s is then not reported)")
+    parser.add_argument("--db-latency-ms", type=float, default=0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = asyncio.run(run_benchmark(args))
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+if __name__ == "__main__":
+    main()
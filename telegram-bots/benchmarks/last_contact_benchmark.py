@@ -0,0 +1,99 @@
+"""
+Benchmark for the contacts.last_contact updates behind every stored message
+
+Runs the offline load test (benchmarks/load_test.py) once per configuration,
+each in its own process since the bots read their settings at import, with a
+few hot customers per bot, and reports DB writes per stored message (message
+inserts plus contact rows updated for last_contact) and Supabase calls:
+
+- row trigger: the original FOR EACH ROW trigger, one contact update per message
+- statement trigger: the per-statement trigger alone (LAST_CONTACT_FLUSH_INTERVAL=0),
+  which only saves writes on batch inserts (--write-behind)
+- coalesced: the bots defer last_contact and write it in batches through touch_contacts
+
+The fake Supabase counts writes but doesn't model row locks, so the reduction in
+contact row lock waits on a real Postgres comes on top of what is shown here.
+
+Examples:
+    python -m benchmarks.last_contact_benchmark
+    python -m benchmarks.last_contact_benchmark --users 5 --rate 1000 --write-behind --json
+"""
+import sys
+import json
+import argparse
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# (label, emulated trigger, LAST_CONTACT_FLUSH_INTERVAL)
+CONFIGURATIONS = (
+    ('row trigger', 'row', 0),
+    ('statement trigger', 'statement', 0),
+    ('coalesced', 'statement', None)
+)
+
+def run_load_test(args, trigger, flush_interval):
+    command = [
+        sys.executable, "-m", "benchmarks.load_test", "--json",
+        "--bots", str(args.bots), "--users", str(args.users), "--rate", str(args.rate),
+        "--outgoing-rate", "0", "--duration", str(args.duration),
+        "--db-latency-ms", str(args.db_latency_ms), "--drain-timeout", str(args.drain_timeout),
+        "--last-contact-trigger", trigger,
+        "--last-contact-flush-interval", str(args.flush_interval if flush_interval is None else flush_interval)
+    ]
+    if args.write_behind:
+        command.append("--write-behind")
+
+    output = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+def summarize(label, result):
+    incoming = result['incoming']
+    db_writes = result['db_writes']
+    return {
+        'configuration': label,
+        'stored': incoming['stored'],
+        'contact_updates': db_writes['contact_updates'],
+        'writes_per_message': db_writes['writes_per_message'],
+        'supabase_calls_per_message': result['http_calls']['supabase_per_message'],
+        'p50_ms': incoming['latency_ms']['p50'],
+        'p95_ms': incoming['latency_ms']['p95']
+    }
+
+def print_report(result):
+    print(f"\n{'configuration':<18} {'stored':>7} {'contact updates':>16} {'writes/msg':>11} "
+          f"{'calls/msg':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    for row in result['results']:
+        print(f"{row['configuration']:<18} {row['stored']:>7} {row['contact_updates']:>16} "
+              f"{row['writes_per_message']:>11} {row['supabase_calls_per_message']:>10} "
+              f"{row['p50_ms']:>8} {row['p95_ms']:>8}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure DB writes per message with and without batched last_contact updates")
+    parser.add_argument("--bots", type=int, default=2)
+    parser.add_argument("--users", type=int, default=10, help="Customers per bot; fewer means hotter contacts")
+    parser.add_argument("--rate", type=float, default=500, help="Incoming messages per second (all bots)")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--db-latency-ms", type=float, default=10)
+    parser.add_argument("--flush-interval", type=float, default=2, help="LAST_CONTACT_FLUSH_INTERVAL when coalesced")
+    parser.add_argument("--drain-timeout", type=float, default=120)
+    parser.add_argument("--write-behind", action="store_true", help="Enable MESSAGE_WRITE_BEHIND")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = []
+    for label, trigger, flush_interval in CONFIGURATIONS:
+        print(f"{label}...", file=sys.stderr)
+        results.append(summarize(label, run_load_test(args, trigger, flush_interval)))
+    result = {'settings': vars(args), 'results': results}
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,490 @@
+"""
+Offline load test for the Telegram bots
+
+Starts a fake Telegram Bot API and a fake PostgREST (see stubs/), runs N bots
+against them the same way run_all.py does, replays incoming customer traffic
+and dashboard-queued outgoing messages, and reports:
+
+- ingest throughput (incoming messages stored per second)
+- incoming messages stored out of order within their chat (should always be 0)
+- message-to-DB latency: update available on getUpdates -> row in messages
+- outgoing delivery latency: row queued in messages -> sendMessage received
+- broadcast fan-out time and rate for one broadcast to --broadcast-recipients contacts
+- with --auto-reply, AI replies from a fake LLM (stubs/fake_llm.py): LLM calls saved by
+  the reply cache and request coalescing, and message-to-reply latency (stored and delivered)
+- with --realtime, outgoing messages are delivered on Supabase Realtime events from a fake
+  Realtime server (stubs/fake_realtime.py) instead of polling. A third of the way in its
+  connections are dropped, and two thirds of the way in they go silent without closing, so
+  every message queued meanwhile is only delivered through reconnects (after a heartbeat
+  timeout for the silent connections) and the catch-up check that follows them
+- HTTP calls per message to Supabase and Telegram
+- DB writes per stored message: message inserts plus contact rows updated for last_contact
+
+Examples:
+    python -m benchmarks.load_test --bots 4 --rate 200 --duration 20
+    python -m benchmarks.load_test --bots 20 --rate 500 --db-latency-ms 20 --write-behind
+    python -m benchmarks.load_test --outgoing-rate 50 --poll-interval 1 --json
+    python -m benchmarks.load_test --rate 1000 --db-latency-ms 50 --update-concurrency 1
+    python -m benchmarks.load_test --rate 0 --outgoing-rate 0 --broadcast-recipients 10000 --telegram-rate 1000
+    python -m benchmarks.load_test --rate 50 --outgoing-rate 0 --auto-reply --llm-latency-ms 800 --llm-jitter-ms 400
+    python -m benchmarks.load_test --rate 20 --outgoing-rate 50 --realtime --duration 30
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+
+# Make the bots package importable when run as a script
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stubs.fake_telegram import FakeTelegramServer
+from stubs.fake_postgrest import FakePostgrestServer
+from stubs.fake_llm import FakeLLMServer
+from stubs.fake_realtime import FakeRealtimeServer
+from stubs.fake_updates import UpdateGenerator
+
+def percentile(values, p):
+    """p-th percentile (0-100) of values, nearest-rank; None when empty"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def latency_summary(seconds):
+    """p50/p95/p99/max of latencies in milliseconds"""
+    return {
+        'count': len(seconds),
+        **{
+            f"p{p}": round(percentile(seconds, p) * 1000, 1) if seconds else None
+            for p in (50, 95, 99)
+        },
+        'max': round(max(seconds) * 1000, 1) if seconds else None
+    }
+
+async def replay_incoming(telegram, tokens, generators, rate, duration, sent_at):
+    """Queue `rate` updates per second spread round-robin over the bots"""
+    started = time.monotonic()
+    count = 0
+    while time.monotonic() - started < duration:
+        index = count % len(tokens)
+        update = generators[index].next_update()
+        # Stored rows are matched back to the update by chat and Telegram message id
+        sent_at[(update['message']['chat']['id'], update['message']['message_id'])] = time.monotonic()
+        telegram.enqueue_update(tokens[index], update)
+        count += 1
+
+        delay = started + count / rate - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    return count
+
+async def replay_outgoing(db, bot_identifiers, generators, rate, duration, queued_at):
+    """Queue `rate` outgoing messages per second as if sent from the dashboard"""
+    started = time.monotonic()
+    count = 0
+    while time.monotonic() - started < duration:
+        index = count % len(bot_identifiers)
+        user_id = generators[index].user_ids[count % len(generators[index].user_ids)]
+        content = f"Reply from support [lt-out-{count}]"
+        db.add_outgoing(f"{user_id}:{bot_identifiers[index]}", content)
+        queued_at[content] = time.monotonic()
+        count += 1
+
+        delay = started + count / rate - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    return count
+
+async def disrupt_realtime(realtime, duration):
+    """Drop the Realtime connections a third of the way in, and stall them two thirds of the way in"""
+    await asyncio.sleep(duration / 3)
+    await realtime.disconnect_all()
+    await asyncio.sleep(duration / 3)
+    realtime.stall_all()
+
+def count_out_of_order(stored):
+    """Stored rows whose Telegram message id is lower than an earlier stored row of the same contact"""
+    latest = {}
+    out_of_order = 0
+    for row in stored:
+        if row['telegram_message_id'] is None:
+            continue
+        previous = latest.get(row['contact_id'], 0)
+        if row['telegram_message_id'] < previous:
+            out_of_order += 1
+        latest[row['contact_id']] = max(previous, row['telegram_message_id'])
+    return out_of_order
+
+def match_auto_replies(replies, sent_at, reply_at):
+    """
+    Latencies from each incoming message to its auto-reply
+
+    Replies to a chat are generated in the order its messages came in, so the n-th
+    reply in a chat answers the chat's n-th message. `reply_at(reply)` is when the
+    reply was stored or delivered.
+    """
+    received = {}
+    for chat_id, message_id in sorted(sent_at):
+        received.setdefault(chat_id, []).append(sent_at[(chat_id, message_id)])
+
+    latencies = []
+    answered = {}
+    for chat_id, at in sorted(reply_at(reply) for reply in replies):
+        index = answered.get(chat_id, 0)
+        if index < len(received.get(chat_id, [])):
+            latencies.append(at - received[chat_id][index])
+        answered[chat_id] = index + 1
+    return latencies
+
+def create_broadcast(db, bot_identifiers, recipients):
+    """Create one broadcast to `recipients` new contacts spread over the bots"""
+    contact_ids = []
+    for index in range(recipients):
+        user_id = 500000 + index
+        contact_id, _ = db.upsert_contact(f"{user_id}:{bot_identifiers[index % len(bot_identifiers)]}", chat_id=user_id)
+        contact_ids.append(contact_id)
+    return db.create_broadcast("Broadcast from support [lt-broadcast]", contact_ids)
+
+async def wait_until(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    return predicate()
+
+async def run_load_test(args):
+    telegram = await FakeTelegramServer(latency=args.telegram_latency_ms / 1000).start()
+    db = await FakePostgrestServer(
+        latency=args.db_latency_ms / 1000,
+        jitter=args.db_jitter_ms / 1000,
+        seed=args.seed,
+        last_contact_trigger=args.last_contact_trigger
+    ).start()
+    llm = await FakeLLMServer(
+        latency=args.llm_latency_ms / 1000,
+        jitter=args.llm_jitter_ms / 1000,
+        seed=args.seed
+    ).start() if args.auto_reply else None
+    realtime = await FakeRealtimeServer().start() if args.realtime else None
+    if realtime:
+        # Publish every insert the way Realtime does; keep the tasks so they aren't garbage collected
+        pushes = set()
+
+        def publish(row):
+            task = asyncio.create_task(realtime.push_insert(row))
+            pushes.add(task)
+            task.add_done_callback(pushes.discard)
+        db.on_insert = publish
+
+    # Settings are read when the bots modules are imported, so set them first
+    os.environ['SUPABASE_URL'] = db.url
+    os.environ['TELEGRAM_API_BASE_URL'] = telegram.url
+    os.environ['OUTGOING_DELIVERY'] = 'realtime' if args.realtime else 'poll'
+    if args.realtime:
+        os.environ['SUPABASE_REALTIME_URL'] = realtime.url
+        os.environ['REALTIME_HEARTBEAT_INTERVAL'] = str(args.realtime_heartbeat_interval)
+        os.environ['REALTIME_MAX_BACKOFF'] = '2'
+    os.environ['OUTGOING_POLL_INTERVAL'] = str(args.poll_interval)
+    os.environ['BROADCAST_POLL_INTERVAL'] = str(args.poll_interval)
+    if args.telegram_rate:
+        os.environ['TELEGRAM_GLOBAL_RATE'] = os.environ['TELEGRAM_GLOBAL_BURST'] = str(args.telegram_rate)
+    if args.update_concurrency:
+        os.environ['UPDATE_CONCURRENCY'] = str(args.update_concurrency)
+    os.environ['MESSAGE_WRITE_BEHIND'] = '1' if args.write_behind else '0'
+    os.environ['MESSAGE_SPOOL'] = '1' if args.spool else '0'
+    if args.spool:
+        os.environ['SPOOL_DIR'] = args.spool_dir
+    if args.last_contact_flush_interval is not None:
+        os.environ['LAST_CONTACT_FLUSH_INTERVAL'] = str(args.last_contact_flush_interval)
+    os.environ['AUTO_REPLY'] = '1' if args.auto_reply else '0'
+    if args.auto_reply:
+        os.environ['LLM_API_URL'] = llm.url
+        os.environ.setdefault('ANTHROPIC_API_KEY', 'load-test')
+        if args.auto_reply_workers:
+            os.environ['AUTO_REPLY_WORKERS'] = str(args.auto_reply_workers)
+        if args.auto_reply_cache_ttl is not None:
+            os.environ['AUTO_REPLY_CACHE_TTL'] = str(args.auto_reply_cache_ttl)
+    os.environ.setdefault('CONTACT_CACHE_STATS_INTERVAL', '0')
+
+    from run_all import BotSupervisor
+    from bots.supabase_client import close_supabase_client
+    from bots.auto_reply import reply_cache, close_llm_client
+    from bots.last_contact import close_last_contact_coalescer
+
+    bots = [(f"bot{i + 1}", f"{900000 + i}:LOADTEST{i}") for i in range(args.bots)]
+    bot_identifiers = [bot_identifier for bot_identifier, _ in bots]
+    tokens = [token for _, token in bots]
+    generators = [
+        UpdateGenerator(users=args.users, first_user_id=100000 + i * args.users, seed=args.seed)
+        for i in range(args.bots)
+    ]
+
+    supervisor = BotSupervisor(bots)
+    supervisor_task = asyncio.create_task(supervisor.run())
+
+    # Wait for every bot to be polling before sending traffic
+    started = await wait_until(
+        lambda: all(bot.state == "running" for bot in supervisor.bots.values()),
+        args.startup_timeout
+    )
+    if not started:
+        states = {name: bot.state for name, bot in supervisor.bots.items()}
+        raise RuntimeError(f"Bots did not start within {args.startup_timeout}s: {states}")
+
+    requests_before = dict(db.requests)
+    messages_before = len(db.messages)
+    contact_writes_before = db.contact_writes
+    telegram_before = dict(telegram.requests)
+    sent_at = {}
+    queued_at = {}
+
+    print(f"Replaying {args.rate}/s incoming and {args.outgoing_rate}/s outgoing messages "
+          f"over {args.bots} bots for {args.duration}s...", file=sys.stderr)
+    load_started = time.monotonic()
+    broadcast = create_broadcast(db, bot_identifiers, args.broadcast_recipients) if args.broadcast_recipients else None
+    jobs = []
+    if args.rate > 0:
+        jobs.append(replay_incoming(telegram, tokens, generators, args.rate, args.duration, sent_at))
+    if args.outgoing_rate > 0:
+        jobs.append(replay_outgoing(db, bot_identifiers, generators, args.outgoing_rate, args.duration, queued_at))
+    if realtime:
+        jobs.append(disrupt_realtime(realtime, args.duration))
+    await asyncio.gather(*jobs)
+
+    def ingested():
+        return sum(1 for m in db.messages.values() if (m['telegram_chat_id'], m['telegram_message_id']) in sent_at)
+
+    def auto_repliers():
+        return [
+            bot.application.bot_data['auto_replier'] for bot in supervisor.bots.values()
+            if bot.application is not None and 'auto_replier' in bot.application.bot_data
+        ]
+
+    def ai_replies():
+        return [m for m in db.messages.values() if m['is_ai_response']]
+
+    def auto_replies_done():
+        if not args.auto_reply:
+            return True
+        return (all(replier.stats()['pending'] == 0 for replier in auto_repliers())
+                and all(m['is_sent'] for m in ai_replies()))
+
+    def delivered():
+        return sum(1 for m in telegram.sent_messages if m['text'] in queued_at)
+
+    def broadcast_done():
+        return broadcast is None or broadcast['status'] == 'completed'
+
+    # Let queued work drain
+    await wait_until(
+        lambda: ingested() >= len(sent_at) and delivered() >= len(queued_at) and broadcast_done()
+        and auto_replies_done(),
+        args.drain_timeout
+    )
+    elapsed = time.monotonic() - load_started
+    replier_stats = [replier.stats() for replier in auto_repliers()]
+    # The bots share one listener per process
+    listeners = {
+        bot.application.bot_data['realtime_subscription'].listener for bot in supervisor.bots.values()
+        if bot.application is not None and 'realtime_subscription' in bot.application.bot_data
+    } - {None}
+    listener_stats = {
+        'reconnects': sum(listener.reconnects for listener in listeners),
+        'heartbeat_timeouts': sum(listener.heartbeat_timeouts for listener in listeners)
+    }
+
+    supervisor.stop()
+    await supervisor_task
+    await close_last_contact_coalescer()
+    await close_supabase_client()
+    await close_llm_client()
+
+    # Match rows and sends back to when their traffic was generated
+    stored = [m for m in db.messages.values() if (m['telegram_chat_id'], m['telegram_message_id']) in sent_at]
+    ingest_latencies = [m['inserted_at'] - sent_at[(m['telegram_chat_id'], m['telegram_message_id'])] for m in stored]
+    ingest_done = max((m['inserted_at'] for m in stored), default=load_started)
+    sends = [m for m in telegram.sent_messages if m['text'] in queued_at]
+    delivery_latencies = [m['received_at'] - queued_at[m['text']] for m in sends]
+    broadcast_sends = [m for m in telegram.sent_messages if broadcast and m['text'] == broadcast['content']]
+    broadcast_seconds = max((m['received_at'] for m in broadcast_sends), default=load_started) - load_started
+
+    db_requests = {key: value - requests_before.get(key, 0) for key, value in db.requests.items()}
+    db_requests = {key: value for key, value in db_requests.items() if value}
+    telegram_requests = {key: value - telegram_before.get(key, 0) for key, value in telegram.requests.items()}
+    telegram_requests = {key: value for key, value in telegram_requests.items() if value}
+
+    ingest_calls = sum(value for key, value in db_requests.items() if 'ingest' in key or key == 'POST /messages')
+    delivery_calls = sum(value for key, value in db_requests.items() if 'claim_outgoing' in key or key.startswith('PATCH'))
+    broadcast_calls = sum(value for key, value in db_requests.items() if 'broadcast' in key)
+
+    replies = ai_replies()
+    messages_written = len(db.messages) - messages_before
+    contact_writes = db.contact_writes - contact_writes_before
+    reply_texts = {m['content'] for m in replies}
+    reply_sends = [m for m in telegram.sent_messages if m['text'] in reply_texts]
+    cache = reply_cache.stats()
+
+    await telegram.stop()
+    await db.stop()
+    if llm:
+        await llm.stop()
+    if realtime:
+        await realtime.stop()
+
+    return {
+        'settings': vars(args),
+        'incoming': {
+            'generated': len(sent_at),
+            'stored': len(stored),
+            'throughput_per_s': round(len(stored) / max(ingest_done - load_started, 1e-9), 1),
+            'out_of_order': count_out_of_order(stored),
+            'latency_ms': latency_summary(ingest_latencies),
+            'db_calls_per_message': round(ingest_calls / len(stored), 3) if stored else None,
+            'get_updates_calls': telegram_requests.get('getUpdates', 0)
+        },
+        'outgoing': {
+            'queued': len(queued_at),
+            'delivered': len(sends),
+            'latency_ms': latency_summary(delivery_latencies),
+            'db_calls_per_message': round(delivery_calls / len(sends), 3) if sends else None,
+            'telegram_calls_per_message': round(telegram_requests.get('sendMessage', 0) / len(sends), 3) if sends else None
+        },
+        'broadcast': {
+            'recipients': broadcast['total_recipients'] if broadcast else 0,
+            'delivered': len(broadcast_sends),
+            'status': broadcast['status'] if broadcast else None,
+            'seconds': round(broadcast_seconds, 2),
+            'sends_per_s': round(len(broadcast_sends) / max(broadcast_seconds, 1e-9), 1),
+            'db_calls': broadcast_calls
+        },
+        'auto_reply': {
+            'stored': len(replies),
+            'delivered': len(reply_sends),
+            'llm_calls': len(llm.requests) if llm else 0,
+            'llm_max_in_flight': llm.max_in_flight if llm else 0,
+            'coalesced': sum(stats['coalesced'] for stats in replier_stats),
+            'errors': sum(stats['errors'] for stats in replier_stats),
+            'dropped': sum(stats['dropped'] for stats in replier_stats),
+            'cache_hit_rate': round(cache['hit_rate'], 3),
+            'cache_exact_hits': cache['exact_hits'],
+            'cache_similar_hits': cache['similar_hits'],
+            'stored_latency_ms': latency_summary(
+                match_auto_replies(replies, sent_at, lambda m: (m['telegram_chat_id'], m['inserted_at']))),
+            'delivered_latency_ms': latency_summary(
+                match_auto_replies(reply_sends, sent_at, lambda m: (int(m['chat_id']), m['received_at'])))
+        } if args.auto_reply else None,
+        'realtime': {
+            **listener_stats,
+            'joins': realtime.joins,
+            'events_pushed': realtime.pushed,
+            'events_missed': realtime.missed
+        } if realtime else None,
+        'db_writes': {
+            'messages': messages_written,
+            'contact_updates': contact_writes,
+            'contact_updates_per_message': round(contact_writes / messages_written, 3) if messages_written else None,
+            'writes_per_message': round((messages_written + contact_writes) / messages_written, 3) if messages_written else None
+        },
+        'http_calls': {
+            'supabase': db_requests,
+            'telegram': telegram_requests,
+            'supabase_per_message': round(
+                sum(db_requests.values()) / max(len(stored) + len(sends) + len(broadcast_sends), 1), 3)
+        },
+        'elapsed_s': round(elapsed, 2)
+    }
+
+def print_report(result):
+    incoming = result['incoming']
+    outgoing = result['outgoing']
+    print(f"\nIncoming: {incoming['stored']}/{incoming['generated']} stored, "
+          f"{incoming['throughput_per_s']} msg/s, {incoming['out_of_order']} out of order within their chat")
+    print(f"  message-to-DB latency ms: {incoming['latency_ms']}")
+    print(f"  Supabase calls per message: {incoming['db_calls_per_message']}, "
+          f"getUpdates calls: {incoming['get_updates_calls']}")
+    if outgoing['queued']:
+        print(f"Outgoing: {outgoing['delivered']}/{outgoing['queued']} delivered")
+        print(f"  delivery latency ms: {outgoing['latency_ms']}")
+        print(f"  Supabase calls per message: {outgoing['db_calls_per_message']}, "
+              f"sendMessage calls per message: {outgoing['telegram_calls_per_message']}")
+    broadcast = result['broadcast']
+    if broadcast['recipients']:
+        print(f"Broadcast: {broadcast['delivered']}/{broadcast['recipients']} delivered ({broadcast['status']}) "
+              f"in {broadcast['seconds']}s, {broadcast['sends_per_s']} sends/s, {broadcast['db_calls']} Supabase calls")
+    auto_reply = result['auto_reply']
+    if auto_reply:
+        print(f"Auto-reply: {auto_reply['stored']} replies stored, {auto_reply['delivered']} delivered, "
+              f"{auto_reply['llm_calls']} LLM calls (max {auto_reply['llm_max_in_flight']} at once), "
+              f"{auto_reply['coalesced']} coalesced, {auto_reply['errors']} errors, {auto_reply['dropped']} dropped")
+        print(f"  cache hit rate {auto_reply['cache_hit_rate']:.1%} ({auto_reply['cache_exact_hits']} exact, "
+              f"{auto_reply['cache_similar_hits']} similar)")
+        print(f"  message-to-reply latency ms, stored: {auto_reply['stored_latency_ms']}")
+        print(f"  message-to-reply latency ms, delivered: {auto_reply['delivered_latency_ms']}")
+    realtime = result['realtime']
+    if realtime:
+        print(f"Realtime: {realtime['joins']} joins, {realtime['reconnects']} reconnects "
+              f"({realtime['heartbeat_timeouts']} after a heartbeat timeout), {realtime['events_pushed']} events pushed, "
+              f"{realtime['events_missed']} missed while disconnected")
+    db_writes = result['db_writes']
+    print(f"DB writes: {db_writes['messages']} messages, {db_writes['contact_updates']} last_contact updates, "
+          f"{db_writes['writes_per_message']} writes per message")
+    print(f"HTTP calls: Supabase {result['http_calls']['supabase']}")
+    print(f"            Telegram {result['http_calls']['telegram']}")
+    print(f"Supabase calls per message overall: {result['http_calls']['supabase_per_message']}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test against fake Telegram and Supabase servers")
+    parser.add_argument("--bots", type=int, default=4, help="Number of bots")
+    parser.add_argument("--users", type=int, default=50, help="Customers per bot")
+    parser.add_argument("--rate", type=float, default=100, help="Incoming messages per second (all bots)")
+    parser.add_argument("--outgoing-rate", type=float, default=10, help="Outgoing messages queued per second (0 disables)")
+    parser.add_argument("--broadcast-recipients", type=int, default=0, help="Send one broadcast to this many contacts")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of traffic")
+    parser.add_argument("--db-latency-ms", type=float, default=5, help="Latency added to every Supabase request")
+    parser.add_argument("--db-jitter-ms", type=float, default=0, help="Random extra Supabase latency, up to this much")
+    parser.add_argument("--telegram-latency-ms", type=float, default=5, help="Latency added to every Telegram request")
+    parser.add_argument("--telegram-rate", type=float, help="TELEGRAM_GLOBAL_RATE per bot (default: Telegram's 30/s)")
+    parser.add_argument("--poll-interval", type=float, default=1, help="OUTGOING_POLL_INTERVAL and BROADCAST_POLL_INTERVAL for the bots")
+    parser.add_argument("--update-concurrency", type=int, help="UPDATE_CONCURRENCY for the bots (default: the bots' default)")
+    parser.add_argument("--write-behind", action="store_true", help="Enable MESSAGE_WRITE_BEHIND")
+    parser.add_argument("--spool", action="store_true", help="Enable MESSAGE_SPOOL")
+    parser.add_argument("--spool-dir", default=os.path.join(tempfile.gettempdir(), "bladex-load-test-spool"))
+    parser.add_argument("--last-contact-flush-interval", type=float,
+                        help="LAST_CONTACT_FLUSH_INTERVAL for the bots (0 leaves last_contact to the trigger)")
+    parser.add_argument("--last-contact-trigger", choices=("statement", "row"), default="statement",
+                        help="last_contact trigger emulated by the fake Supabase: per statement, or the original per row")
+    parser.add_argument("--auto-reply", action="store_true", help="Enable AUTO_REPLY against a fake LLM")
+    parser.add_argument("--llm-latency-ms", type=float, default=500, help="Latency added to every LLM request")
+    parser.add_argument("--llm-jitter-ms", type=float, default=0, help="Random extra LLM latency, up to this much")
+    parser.add_argument("--auto-reply-workers", type=int, help="AUTO_REPLY_WORKERS per bot (default: the bots' default)")
+    parser.add_argument("--auto-reply-cache-ttl", type=float, help="AUTO_REPLY_CACHE_TTL (0 disables the reply cache)")
+    parser.add_argument("--realtime", action="store_true",
+                        help="Deliver outgoing messages on events from a fake Realtime server that drops and stalls mid-run")
+    parser.add_argument("--realtime-heartbeat-interval", type=float, default=1,
+                        help="REALTIME_HEARTBEAT_INTERVAL for the bots in --realtime mode")
+    parser.add_argument("--startup-timeout", type=float, default=30)
+    parser.add_argument("--drain-timeout", type=float, default=60, help="Max seconds to wait for queued work after the load")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper())
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    result = asyncio.run(run_load_test(args))
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Startup benchmark for run_all.py with many bots
+
+Runs --bots bots through BotSupervisor against the fake Telegram Bot API and the
+fake PostgREST (see stubs/) and reports:
+
+- time to load the bots from a generated bots.toml, and from the same number of
+  generated bot_template.py copies imported the way discover_bots() does
+- time until the first and until every bot is polling, for each --start-concurrency
+- a hot reload adding, removing and changing a few bots: time until applied and
+  how many of the other bots were restarted (should be 0)
+- time to stop every bot, and the process's peak RSS
+
+Examples:
+    python -m benchmarks.startup_benchmark --bots 200
+    python -m benchmarks.startup_benchmark --bots 200 --start-concurrency 10 50 200 --telegram-latency-ms 50
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import logging
+import argparse
+import resource
+import importlib
+import tempfile
+from pathlib import Path
+
+# Make the bots package importable when run as a script
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stubs.fake_telegram import FakeTelegramServer
+from stubs.fake_postgrest import FakePostgrestServer
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def write_registry(path, bots):
+    with open(path, 'w') as f:
+        for bot_identifier, token in bots:
+            f.write(f'[bots.{bot_identifier}]\ntoken = "{token}"\n\n')
+
+def time_module_discovery(directory, bots):
+    """Seconds to import one bot_template.py copy per bot, like discover_bots() does"""
+    package = Path(directory) / "legacy_bots"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    template = (ROOT / "bots" / "bot_template.py").read_text()
+    for index, (bot_identifier, token) in enumerate(bots):
+        os.environ[f"{bot_identifier.upper()}_TOKEN"] = token
+        (package / f"bot{index}.py").write_text(
+            template.replace('BOT_NAME = "template"', f'BOT_NAME = "{bot_identifier}"'))
+
+    sys.path.insert(0, str(directory))
+    started = time.perf_counter()
+    for index in range(len(bots)):
+        module = importlib.import_module(f"legacy_bots.bot{index}")
+        assert module.TOKEN
+    return time.perf_counter() - started
+
+async def wait_for(predicate, timeout, interval=0.02):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Timed out after {timeout}s")
+        await asyncio.sleep(interval)
+
+def running(supervisor):
+    return sum(1 for bot in supervisor.bots.values() if bot.state == "running")
+
+async def measure_startup(run_all, bots, start_concurrency, timeout):
+    """Start the bots; return the running supervisor, its task and the timings"""
+    run_all.BOT_START_CONCURRENCY = start_concurrency
+    supervisor = run_all.BotSupervisor(bots)
+    started = time.monotonic()
+    task = asyncio.create_task(supervisor.run())
+
+    await wait_for(lambda: running(supervisor) > 0, timeout)
+    first = time.monotonic() - started
+    await wait_for(lambda: running(supervisor) == len(bots), timeout)
+    return supervisor, task, {'first_running_s': round(first, 2), 'all_running_s': round(time.monotonic() - started, 2)}
+
+async def measure_reload(supervisor, registry_path, bots, changes, timeout, load_registry):
+    """Remove, add and re-token `changes` bots each through the registry and apply it"""
+    removed = bots[:changes]
+    retokened = [(bot_identifier, f"{token}0") for bot_identifier, token in bots[changes:2 * changes]]
+    untouched = bots[2 * changes:]
+    added = [(f"added{index}", f"{800000 + index}:STARTUP{index}") for index in range(changes)]
+    started_at = {bot_identifier: supervisor.bots[bot_identifier].started_at for bot_identifier, _ in untouched}
+
+    new_bots = retokened + untouched + added
+    write_registry(registry_path, new_bots)
+    started = time.monotonic()
+    await supervisor.apply(load_registry(registry_path))
+    await wait_for(lambda: running(supervisor) == len(new_bots), timeout)
+
+    return {
+        'removed': len(removed),
+        'added': len(added),
+        'restarted': len(retokened),
+        'applied_s': round(time.monotonic() - started, 2),
+        'untouched_restarted': sum(
+            1 for bot_identifier, _ in untouched if supervisor.bots[bot_identifier].started_at != started_at[bot_identifier]
+        ),
+        'bots_after': sorted(supervisor.bots) == sorted(bot_identifier for bot_identifier, _ in new_bots)
+    }
+
+async def run_benchmark(args):
+    telegram = await FakeTelegramServer(latency=args.telegram_latency_ms / 1000).start()
+    db = await FakePostgrestServer(latency=args.db_latency_ms / 1000).start()
+
+    # Settings are read when the bots modules are imported, so set them first
+    os.environ['SUPABASE_URL'] = db.url
+    os.environ['TELEGRAM_API_BASE_URL'] = telegram.url
+    os.environ['OUTGOING_DELIVERY'] = 'poll'
+    os.environ.setdefault('CONTACT_CACHE_STATS_INTERVAL', '0')
+
+    import run_all
+    from bots.registry import load_registry
+    from bots.supabase_client import close_supabase_client
+
+    bots = [(f"startup{index}", f"{700000 + index}:STARTUP{index}") for index in range(args.bots)]
+    directory = tempfile.mkdtemp(prefix="bladex-startup-")
+    registry_path = os.path.join(directory, "bots.toml")
+    write_registry(registry_path, bots)
+
+    started = time.perf_counter()
+    loaded = load_registry(registry_path)
+    registry_seconds = time.perf_counter() - started
+    assert len(loaded) == args.bots
+    module_seconds = time_module_discovery(directory, bots)
+
+    results = []
+    reload = None
+    for index, start_concurrency in enumerate(args.start_concurrency):
+        print(f"Starting {args.bots} bots, {start_concurrency} at a time...", file=sys.stderr)
+        supervisor, task, timings = await measure_startup(run_all, loaded, start_concurrency, args.timeout)
+
+        # Measure one hot reload, on the last run
+        if index == len(args.start_concurrency) - 1 and args.reload_changes:
+            reload = await measure_reload(
+                supervisor, registry_path, bots, args.reload_changes, args.timeout, load_registry)
+
+        started = time.monotonic()
+        supervisor.stop()
+        await task
+        timings['stop_s'] = round(time.monotonic() - started, 2)
+        results.append({'start_concurrency': start_concurrency, **timings})
+
+    await close_supabase_client()
+    await telegram.stop()
+    await db.stop()
+    shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        'settings': vars(args),
+        'load_ms': {
+            'registry': round(registry_seconds * 1000, 1),
+            'bot_modules': round(module_seconds * 1000, 1)
+        },
+        'startup': results,
+        'reload': reload,
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+def print_report(result):
+    load = result['load_ms']
+    print(f"\nLoading {result['settings']['bots']} bots: bots.toml {load['registry']} ms, "
+          f"bot modules {load['bot_modules']} ms")
+    print(f"\n{'start concurrency':>17} {'first running s':>16} {'all running s':>14} {'stop s':>7}")
+    for row in result['startup']:
+        print(f"{row['start_concurrency']:>17} {row['first_running_s']:>16} {row['all_running_s']:>14} {row['stop_s']:>7}")
+    reload = result['reload']
+    if reload:
+        print(f"\nHot reload: {reload['added']} added, {reload['removed']} removed, {reload['restarted']} restarted "
+              f"in {reload['applied_s']}s; other bots restarted: {reload['untouched_restarted']}")
+    print(f"Peak RSS: {result['peak_rss_mb']} MB")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark starting many bots from a bot registry")
+    parser.add_argument("--bots", type=int, default=200)
+    parser.add_argument("--start-concurrency", type=int, nargs="+", default=[20, 200],
+                        help="BOT_START_CONCURRENCY values to start the bots with")
+    parser.add_argument("--reload-changes", type=int, default=10,
+                        help="Bots added, removed and re-tokened in the hot reload (0 skips it)")
+    parser.add_argument("--telegram-latency-ms", type=float, default=20)
+    parser.add_argument("--db-latency-ms", type=float, default=5)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper())
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    result = asyncio.run(run_benchmark(args))
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,477 @@
+import os
+import re
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from collections import OrderedDict, deque
+import httpx
+
+from bots.supabase_client import get_supabase_client
+from bots.keyed_serializer import KeyedSerializer
+from bots.last_contact import last_contact_headers, touch_last_contact
+from bots.metrics import AUTO_REPLY_LATENCY, AUTO_REPLIES, AUTO_REPLY_PENDING
+
+# LLM endpoint (Anthropic Messages API, or the fake one in stubs/ for load tests)
+LLM_API_URL = os.getenv('LLM_API_URL', 'https://api.anthropic.com').rstrip('/')
+ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY', '')
+AUTO_REPLY_MODEL = os.getenv('AUTO_REPLY_MODEL', 'claude-3-haiku-20240307')
+AUTO_REPLY_MAX_TOKENS = int(os.getenv('AUTO_REPLY_MAX_TOKENS', '400'))
+AUTO_REPLY_TIMEOUT = float(os.getenv('AUTO_REPLY_TIMEOUT', '30'))
+
+# Replies generated at once per bot, and replies waiting beyond that before new ones are dropped
+AUTO_REPLY_WORKERS = int(os.getenv('AUTO_REPLY_WORKERS', '8'))
+AUTO_REPLY_QUEUE_SIZE = int(os.getenv('AUTO_REPLY_QUEUE_SIZE', '1000'))
+# Earlier messages of the conversation sent along as context
+AUTO_REPLY_HISTORY = int(os.getenv('AUTO_REPLY_HISTORY', '6'))
+
+# Reply cache settings (AUTO_REPLY_CACHE_TTL=0 disables the cache and request coalescing)
+AUTO_REPLY_CACHE_SIZE = int(os.getenv('AUTO_REPLY_CACHE_SIZE', '10000'))
+AUTO_REPLY_CACHE_TTL = float(os.getenv('AUTO_REPLY_CACHE_TTL', '3600'))
+# Shorter messages ("yes", "how much?") depend on the conversation and always go to the LLM
+AUTO_REPLY_CACHE_MIN_WORDS = int(os.getenv('AUTO_REPLY_CACHE_MIN_WORDS', '2'))
+
+# Same prompt as generateAutoReply in the Next.js app (src/lib/anthropic/client.ts)
+SYSTEM_PROMPT = (
+    "You are an AI customer service assistant. Provide helpful, concise, and friendly responses. "
+    "Keep your answers brief and to the point. If you're not confident about an answer, "
+    "indicate that a human representative will follow up."
+)
+
+# Words that don't change what a question is about, left out of the similarity key
+STOPWORDS = frozenset((
+    "a an the and or but if then so to of in on at by for with from about as into is are was were be been "
+    "am do does did have has had i me my we our you your he she it its they them their this that these those "
+    "there here what which who whom whose when where why how can could would should will shall may might must "
+    "please hi hello hey thanks thank just any some ok okay"
+).split())
+
+# Negations are kept in the similarity key, folded into one word so "can't cancel",
+# "cannot cancel" and "can not cancel" match each other but not "can cancel".
+# normalize_question turns "can't" into "can t" and "isn't" into "isn t".
+NEGATIONS = frozenset(("not", "no", "never", "cannot", "nor", "without", "t", "nt"))
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+logger = logging.getLogger(__name__)
+
+def is_auto_reply_enabled():
+    """Check whether AI auto-replies are turned on in the environment"""
+    return os.getenv('AUTO_REPLY', '').lower() in ('1', 'true', 'yes')
+
+def normalize_question(text):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", text.lower())).strip()
+
+def similarity_key(normalized):
+    """
+    Sorted content words of a normalized question, so rewordings like "What are your
+    opening hours?" and "opening hours??" share a key; None if too short to cache
+
+    Questions with opposite meanings must never share a key (python -m doctest bots/auto_reply.py):
+
+    >>> similarity_key(normalize_question("What are your opening hours?")) == similarity_key("opening hours")
+    True
+    >>> similarity_key(normalize_question("Can I cancel my order?")) == similarity_key(normalize_question("Can I not cancel my order?"))
+    False
+    >>> similarity_key(normalize_question("Can't I cancel my order?")) == similarity_key(normalize_question("cannot cancel order"))
+    True
+    >>> similarity_key(normalize_question("Is delivery free?")) == similarity_key(normalize_question("Is delivery not free?"))
+    False
+    >>> similarity_key(normalize_question("yes delivery")) == similarity_key(normalize_question("no delivery"))
+    False
+    """
+    words = set()
+    for word in normalized.split():
+        if word in NEGATIONS:
+            words.add("not")
+            continue
+        if word in STOPWORDS:
+            continue
+        # Cheap plural folding: "hours" and "hour" are the same question
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.add(word)
+
+    if len(words) < AUTO_REPLY_CACHE_MIN_WORDS:
+        return None
+    return " ".join(sorted(words))
+
+class ReplyCache:
+    """
+    Bounded LRU cache of generated replies per bot, keyed by normalized question
+
+    A reply is stored under the hash of the exact normalized question and under
+    its similarity key; lookups try the exact key first. Entries expire after
+    `ttl` seconds. Safe to share between bots running in different threads.
+    """
+
+    def __init__(self, maxsize=AUTO_REPLY_CACHE_SIZE, ttl=AUTO_REPLY_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def keys(self, bot_identifier, text):
+        """(exact key, similarity key) for a question; both None if it shouldn't be cached"""
+        normalized = normalize_question(text)
+        similar = similarity_key(normalized)
+        if similar is None or self.ttl <= 0:
+            return None, None
+        exact = hashlib.blake2b(normalized.encode(), digest_size=16).hexdigest()
+        return (bot_identifier, "exact", exact), (bot_identifier, "similar", similar)
+
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        reply, expires_at = entry
+        if expires_at < now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return reply
+
+    def get(self, keys):
+        """Return the cached reply for keys() of a question, or None on a miss"""
+        exact, similar = keys
+        if exact is None:
+            return None
+
+        with self._lock:
+            now = time.monotonic()
+            reply = self._lookup(exact, now)
+            if reply is not None:
+                self.exact_hits += 1
+                return reply
+            reply = self._lookup(similar, now)
+            if reply is not None:
+                self.similar_hits += 1
+                return reply
+            self.misses += 1
+            return None
+
+    def set(self, keys, reply):
+        """Store a reply under both keys, evicting the least recently used entries if full"""
+        if keys[0] is None:
+            return
+
+        with self._lock:
+            expires_at = time.monotonic() + self.ttl
+            for key in keys:
+                self._entries[key] = (reply, expires_at)
+                self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return hit/miss counters and the current size"""
+        with self._lock:
+            hits = self.exact_hits + self.similar_hits
+            lookups = hits + self.misses
+            return {
+                'size': len(self._entries),
+                'exact_hits': self.exact_hits,
+                'similar_hits': self.similar_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': hits / lookups if lookups else 0.0
+            }
+
+# Shared by every bot in the process; keys include the bot identifier
+reply_cache = ReplyCache()
+
+class LLMError(Exception):
+    """The LLM request failed or returned no text"""
+
+class LLMClient:
+    """
+    Async client for the Anthropic Messages API
+
+    Keeps a pool of keep-alive connections, so the auto-reply workers of every
+    bot on an event loop share connections instead of opening one per reply.
+    """
+
+    def __init__(self, url=None, api_key=None, model=None, max_tokens=None, timeout=None):
+        self.url = (url or LLM_API_URL).rstrip('/')
+        self.model = model or AUTO_REPLY_MODEL
+        self.max_tokens = max_tokens or AUTO_REPLY_MAX_TOKENS
+
+        self._client = httpx.AsyncClient(
+            base_url=self.url,
+            headers={
+                "x-api-key": api_key or ANTHROPIC_API_KEY,
+                "anthropic-version": "2023-06-01"
+            },
+            timeout=timeout or AUTO_REPLY_TIMEOUT
+        )
+
+    async def complete(self, messages, system=SYSTEM_PROMPT):
+        """Send a conversation ([{'role', 'content'}], ending with a user turn) and return the reply text"""
+        try:
+            response = await self._client.post("/v1/messages", json={
+                "model": self.model,
+                "max_tokens": self.max_tokens,
+                "system": system,
+                "messages": messages
+            })
+        except httpx.HTTPError as e:
+            raise LLMError(f"LLM request failed: {e!r}") from e
+
+        if response.status_code != 200:
+            raise LLMError(f"LLM request failed with {response.status_code}: {response.text[:200]}")
+
+        text = "".join(
+            block.get("text", "") for block in response.json().get("content", []) if block.get("type") == "text"
+        ).strip()
+        if not text:
+            raise LLMError("LLM returned an empty reply")
+        return text
+
+    async def aclose(self):
+        await self._client.aclose()
+
+# One client per event loop - httpx clients can't be shared across loops
+_clients = {}
+
+def get_llm_client():
+    """Get the shared LLM client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+
+    if client is None:
+        client = LLMClient()
+        _clients[loop] = client
+        logger.info(f"Created LLM client for {LLM_API_URL}")
+
+    return client
+
+async def close_llm_client():
+    """Close the shared LLM client for the running event loop, if any"""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+
+    if client is not None:
+        await client.aclose()
+
+def build_conversation(history, message_text):
+    """
+    Messages API conversation from get_conversation_history entries plus the new message
+
+    Incoming messages become user turns and outgoing ones assistant turns; consecutive
+    messages from the same side are merged, as the API requires alternating roles
+    starting with the user.
+    """
+    # The new message is usually in the history already (it was saved before we got here)
+    if history and history[-1]['direction'] == 'incoming' and history[-1]['content'] == message_text:
+        history = history[:-1]
+
+    messages = []
+    for entry in list(history) + [{'content': message_text, 'direction': 'incoming'}]:
+        role = "user" if entry['direction'] == 'incoming' else "assistant"
+        if messages and messages[-1]['role'] == role:
+            messages[-1]['content'] += "\n" + entry['content']
+        elif messages or role == "user":
+            messages.append({'role': role, 'content': entry['content']})
+    return messages
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+class AutoReplier:
+    """
+    Generates AI replies to incoming messages for one bot
+
+    submit() returns immediately; replies are generated by up to `workers` calls
+    at once, in order per contact. Every message is answered with the
+    conversation loaded by `history_loader(user_id, limit)`. Only when that
+    conversation is the message alone (a customer's first question) is the
+    reply shared with other customers: a question long enough to cache is then
+    answered from the reply cache if it was answered recently, joins an
+    identical LLM request that is already in flight, or else is asked and
+    cached. Replies that saw a customer's history are never cached, so they
+    can't leak into, or be out of context for, anyone else's conversation.
+    The reply is stored as an unsent outgoing message with is_ai_response set,
+    and `on_reply()` is called so outgoing delivery can pick it up. When more than `queue_size` replies are
+    waiting, new messages get no auto-reply, and a failed LLM request leaves
+    the message for a human to answer from the dashboard.
+    """
+
+    def __init__(self, bot_identifier, history_loader, on_reply=None, logger=None, workers=None,
+                 queue_size=None, history_limit=None, cache=None, client=None):
+        self.bot_identifier = bot_identifier
+        self.history_loader = history_loader
+        self.on_reply = on_reply
+        self.logger = logger or logging.getLogger(__name__)
+        self.queue_size = queue_size or AUTO_REPLY_QUEUE_SIZE
+        self.history_limit = history_limit if history_limit is not None else AUTO_REPLY_HISTORY
+        self.cache = cache or reply_cache
+        self._client = client
+        self._pool = KeyedSerializer(workers or AUTO_REPLY_WORKERS)
+        self._inflight = {}    # similarity key -> future of the LLM reply
+        self._tasks = set()
+        self._stopping = False
+
+        # Counters for tuning
+        self.replies = 0
+        self.llm_calls = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.dropped = 0
+        self.latencies = deque(maxlen=10000)
+
+        label = bot_identifier or self.logger.name
+        self._latency = AUTO_REPLY_LATENCY.labels(label)
+        self._sources = {source: AUTO_REPLIES.labels(label, source)
+                         for source in ("cache", "coalesced", "llm", "error", "dropped")}
+        AUTO_REPLY_PENDING.labels(label).set_function(lambda: self._pool.pending)
+
+    @property
+    def client(self):
+        return self._client or get_llm_client()
+
+    def submit(self, user_id, contact_info, contact_name, chat_id, message_text):
+        """Queue a reply to an incoming message"""
+        if self._stopping or self._pool.pending >= self.queue_size:
+            self.dropped += 1
+            self._sources["dropped"].inc()
+            self.logger.warning(f"Auto-reply queue full ({self._pool.pending} waiting), not replying to {contact_info}",
+                                extra={'bot': self.bot_identifier})
+            return
+
+        job = (user_id, contact_info, contact_name, chat_id, message_text, time.monotonic())
+        task = asyncio.create_task(self._pool.run(contact_info, self._reply, job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def stop(self):
+        """Finish the replies being generated; ones still waiting are dropped"""
+        self._stopping = True
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _reply(self, job):
+        user_id, contact_info, contact_name, chat_id, message_text, received_at = job
+        if self._stopping:
+            self.dropped += 1
+            self._sources["dropped"].inc()
+            return
+
+        source = "cache"
+        try:
+            history = await self.history_loader(user_id, self.history_limit) if self.history_limit > 0 else []
+            conversation = build_conversation(history, message_text)
+            # Shared with other customers only when asked without any history
+            if conversation == [{'role': 'user', 'content': message_text}]:
+                keys = self.cache.keys(self.bot_identifier, message_text)
+            else:
+                keys = (None, None)
+            reply = self.cache.get(keys)
+            if reply is None:
+                reply, source = await self._generate(conversation, keys)
+        except Exception as e:
+            self.errors += 1
+            self._sources["error"].inc()
+            self.logger.error(f"Error generating auto-reply for {contact_info}: {e}", extra={'bot': self.bot_identifier})
+            return
+
+        if not await self._save_reply(contact_info, contact_name, chat_id, reply):
+            self.errors += 1
+            self._sources["error"].inc()
+            return
+
+        elapsed = time.monotonic() - received_at
+        self.replies += 1
+        self.latencies.append(elapsed)
+        self._latency.observe(elapsed)
+        self._sources[source].inc()
+        self.logger.debug(f"Auto-reply to {contact_info} from {source} after {elapsed * 1000:.0f} ms",
+                          extra={'bot': self.bot_identifier, 'source': source, 'latency_ms': round(elapsed * 1000)})
+
+        if self.on_reply is not None:
+            self.on_reply()
+
+    async def _generate(self, conversation, keys):
+        """Ask the LLM, or wait for an identical question already being asked; returns (reply, source)"""
+        similar = keys[1]
+        if similar is None:
+            self.llm_calls += 1
+            return await self.client.complete(conversation), "llm"
+
+        if similar in self._inflight:
+            self.coalesced += 1
+            return await asyncio.shield(self._inflight[similar]), "coalesced"
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[similar] = future
+        try:
+            self.llm_calls += 1
+            reply = await self.client.complete(conversation)
+            self.cache.set(keys, reply)
+            future.set_result(reply)
+            return reply, "llm"
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters get the exception; mark it retrieved so it isn't logged again when nobody was waiting
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(similar, None)
+
+    async def _save_reply(self, contact_info, contact_name, chat_id, reply):
+        """Store the reply as an unsent outgoing AI message for outgoing delivery"""
+        timestamp = datetime.utcnow().isoformat()
+        try:
+            response = await get_supabase_client().rpc("ingest_message", {
+                'p_contact_info': contact_info,
+                'p_contact_name': contact_name,
+                'p_content': reply,
+                'p_direction': 'outgoing',
+                'p_timestamp': timestamp,
+                'p_bot_identifier': self.bot_identifier,
+                'p_telegram_chat_id': chat_id,
+                'p_telegram_message_id': None,
+                'p_is_ai_response': True
+            }, headers=last_contact_headers())
+        except Exception as e:
+            self.logger.error(f"Error saving auto-reply for {contact_info}: {e}")
+            return False
+
+        if response.status_code != 200:
+            self.logger.error(f"Error saving auto-reply for {contact_info}: {response.text}")
+            return False
+        touch_last_contact(contact_info, timestamp)
+        return True
+
+    def stats(self):
+        """Reply counters, cache hit rate and reply latency percentiles (ms)"""
+        latencies = sorted(self.latencies)
+        cache = self.cache.stats()
+        return {
+            'replies': self.replies,
+            'llm_calls': self.llm_calls,
+            'coalesced': self.coalesced,
+            'errors': self.errors,
+            'dropped': self.dropped,
+            'pending': self._pool.pending,
+            'cache_hit_rate': cache['hit_rate'],
+            'cache_exact_hits': cache['exact_hits'],
+            'cache_similar_hits': cache['similar_hits'],
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 1)
+        }
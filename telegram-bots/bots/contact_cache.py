@@ -0,0 +1,94 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# Cache settings
+CONTACT_CACHE_SIZE = int(os.getenv('CONTACT_CACHE_SIZE', '10000'))
+CONTACT_CACHE_TTL = float(os.getenv('CONTACT_CACHE_TTL', '3600'))
+CHAT_REGISTRY_SIZE = int(os.getenv('CHAT_REGISTRY_SIZE', '10000'))
+CHAT_REGISTRY_TTL = float(os.getenv('CHAT_REGISTRY_TTL', '3600'))
+
+class ContactCache:
+    """
+    Bounded LRU cache mapping contact_info (user_id:bot_identifier) to a value stored
+    on the contact row - its id, or the Telegram chat replies go to
+
+    Entries expire after `ttl` seconds and the least recently used entry is evicted
+    once `maxsize` is reached. Safe to share between bots running in different threads.
+    """
+
+    def __init__(self, maxsize=CONTACT_CACHE_SIZE, ttl=CONTACT_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, contact_info):
+        """Return the cached value, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(contact_info)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            contact_id, expires_at = entry
+            if expires_at < time.monotonic():
+                # Expired - treat as a miss so the id gets looked up again
+                del self._entries[contact_info]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(contact_info)
+            self.hits += 1
+            return contact_id
+
+    def set(self, contact_info, contact_id):
+        """Store a value, evicting the least recently used entry if full"""
+        with self._lock:
+            self._entries[contact_info] = (contact_id, time.monotonic() + self.ttl)
+            self._entries.move_to_end(contact_info)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, contact_info):
+        """Drop a contact, e.g. when it turns out to have been deleted"""
+        with self._lock:
+            self._entries.pop(contact_info, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return hit/miss counters and the current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+# Shared by save_message_to_supabase and get_conversation_history
+contact_cache = ContactCache()
+
+# contact_info -> contacts.chat_id, in front of the chat_id column
+chat_registry = ContactCache(CHAT_REGISTRY_SIZE, CHAT_REGISTRY_TTL)
+
+def is_chat_registered(contact_info, chat_id):
+    """
+    Check whether the contact row is known to already have this chat_id
+
+    When it isn't, the message has to go through an ingest RPC, which records
+    the chat on the contact.
+    """
+    return chat_id is None or chat_registry.get(contact_info) == chat_id
@@ -0,0 +1,238 @@
+import os
+import re
+import sys
+import time
+import threading
+from datetime import datetime, timezone
+from collections import OrderedDict, deque
+
+# History cache settings
+HISTORY_CACHE_MAX_BYTES = int(os.getenv('HISTORY_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+HISTORY_CACHE_PER_CONTACT = int(os.getenv('HISTORY_CACHE_PER_CONTACT', '50'))
+HISTORY_CACHE_TTL = float(os.getenv('HISTORY_CACHE_TTL', '3600'))
+# How long messages of uncached contacts are kept for their next seed. In write-behind
+# and spool mode they may not have reached Supabase yet when the history is fetched.
+HISTORY_CACHE_UNSAVED_TTL = float(os.getenv('HISTORY_CACHE_UNSAVED_TTL', '300'))
+
+# Rough per-entry cost of the dict, its keys and the timestamp, on top of the content
+ENTRY_OVERHEAD = 400
+
+def make_entry(content, direction, timestamp):
+    """A history entry as returned by get_conversation_history"""
+    return {'content': content, 'direction': direction, 'timestamp': timestamp}
+
+def entry_size(entry):
+    return sys.getsizeof(entry['content']) + ENTRY_OVERHEAD
+
+_FRACTION = re.compile(r"\.(\d+)")
+
+def _entry_time(entry):
+    """
+    An entry's timestamp as an aware datetime, whether written by the bots
+    (naive UTC) or returned by Supabase (+00:00, any number of fraction digits)
+    """
+    value = _FRACTION.sub(lambda m: "." + m.group(1)[:6].ljust(6, "0"), str(entry['timestamp']).replace('Z', '+00:00'), 1)
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.min.replace(tzinfo=timezone.utc)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def merge_entries(fetched, appended):
+    """Fetched entries plus appended ones they don't already contain, oldest first"""
+    seen = {(entry['direction'], entry['content'], _entry_time(entry)) for entry in fetched}
+    merged = list(fetched)
+    for entry in appended:
+        key = (entry['direction'], entry['content'], _entry_time(entry))
+        if key not in seen:
+            seen.add(key)
+            merged.append(entry)
+    merged.sort(key=_entry_time)
+    return merged
+
+class _History:
+    __slots__ = ('entries', 'size', 'expires_at')
+
+    def __init__(self, maxlen, expires_at):
+        self.entries = deque(maxlen=maxlen)
+        self.size = 0
+        self.expires_at = expires_at
+
+class HistoryCache:
+    """
+    Recent messages per contact, bounded by total memory
+
+    Each contact (contact_info) gets a ring buffer of its last `per_contact`
+    messages, seeded from Supabase the first time its history is read and kept
+    current by appending every message the bot saves or delivers. Once the
+    entries of all contacts together exceed `max_bytes`, the least recently
+    used contacts are evicted. Safe to share between bots running in different
+    threads.
+
+    Appends for a contact that isn't cached are kept aside for `unsaved_ttl`
+    seconds and merged into its history when it is next fetched, since with
+    write-behind or the spool they may not have reached Supabase by then. Every
+    seed (begin_seed/finish_seed) also collects the appends made while it was
+    fetching, so none are lost whichever of two overlapping seeds finishes first.
+    """
+
+    def __init__(self, max_bytes=HISTORY_CACHE_MAX_BYTES, per_contact=HISTORY_CACHE_PER_CONTACT,
+                 ttl=HISTORY_CACHE_TTL, unsaved_ttl=HISTORY_CACHE_UNSAVED_TTL):
+        self.max_bytes = max_bytes
+        self.per_contact = per_contact
+        self.ttl = ttl
+        self.unsaved_ttl = unsaved_ttl
+        self.size = 0
+        self.unsaved_size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._histories = OrderedDict()
+        # contact_info -> {seed token: entries appended while that seed was being fetched}
+        self._seeds = {}
+        # contact_info -> deque of (entry, appended_at) for contacts that weren't cached
+        self._unsaved = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, contact_info, limit):
+        """Return the last `limit` entries (oldest first), or None if they have to be fetched"""
+        with self._lock:
+            history = self._histories.get(contact_info)
+
+            if history is None or limit > self.per_contact:
+                self.misses += 1
+                return None
+
+            if history.expires_at < time.monotonic():
+                self._drop(contact_info)
+                self.misses += 1
+                return None
+
+            self._histories.move_to_end(contact_info)
+            self.hits += 1
+            entries = history.entries
+            return list(entries)[-limit:] if limit < len(entries) else list(entries)
+
+    def begin_seed(self, contact_info):
+        """Call before fetching a contact's history; returns the token to pass to finish_seed"""
+        token = object()
+        with self._lock:
+            self._seeds.setdefault(contact_info, {})[token] = []
+        return token
+
+    def finish_seed(self, contact_info, token, entries):
+        """
+        Cache the fetched history (oldest first) for a contact; entries=None if the fetch failed
+
+        The fetched entries may miss messages appended while they were being fetched,
+        or not yet written to Supabase, so those are merged in. Returns the entries
+        cached, or None if nothing was (another seed got there first).
+        """
+        with self._lock:
+            seeds = self._seeds.get(contact_info, {})
+            appended = seeds.pop(token, [])
+            if not seeds:
+                self._seeds.pop(contact_info, None)
+            if entries is None or contact_info in self._histories:
+                return None
+
+            entries = merge_entries(entries, self._take_unsaved(contact_info) + appended)
+            history = _History(self.per_contact, time.monotonic() + self.ttl)
+            self._histories[contact_info] = history
+            for entry in entries[-self.per_contact:]:
+                self._push(history, entry)
+            self._evict()
+            return entries
+
+    def append(self, contact_info, content, direction, timestamp):
+        """Add a message to a contact's history, or keep it for the next seed if it isn't cached"""
+        entry = make_entry(content, direction, timestamp)
+        with self._lock:
+            for appended in self._seeds.get(contact_info, {}).values():
+                appended.append(entry)
+
+            history = self._histories.get(contact_info)
+            if history is None:
+                self._keep_unsaved(contact_info, entry)
+                return
+
+            self._histories.move_to_end(contact_info)
+            self._push(history, entry)
+            self._evict()
+
+    def invalidate(self, contact_info):
+        with self._lock:
+            self._drop(contact_info)
+
+    def clear(self):
+        with self._lock:
+            self._histories.clear()
+            self._unsaved.clear()
+            self.size = 0
+            self.unsaved_size = 0
+
+    def stats(self):
+        """Return hit/miss counters, the number of contacts and the bytes in use"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'contacts': len(self._histories),
+                'bytes': self.size,
+                'unsaved_bytes': self.unsaved_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+    def _push(self, history, entry):
+        if len(history.entries) == history.entries.maxlen:
+            removed = entry_size(history.entries[0])
+            history.size -= removed
+            self.size -= removed
+        history.entries.append(entry)
+        added = entry_size(entry)
+        history.size += added
+        self.size += added
+
+    def _keep_unsaved(self, contact_info, entry):
+        now = time.monotonic()
+        pending = self._unsaved.get(contact_info)
+        if pending is None:
+            pending = self._unsaved[contact_info] = deque(maxlen=self.per_contact)
+        elif len(pending) == pending.maxlen:
+            self.unsaved_size -= entry_size(pending[0][0])
+        pending.append((entry, now))
+        self.unsaved_size += entry_size(entry)
+        self._unsaved.move_to_end(contact_info)
+
+        # Forget contacts whose messages are surely in Supabase by now, and bound the memory
+        while self._unsaved:
+            oldest_contact, oldest = next(iter(self._unsaved.items()))
+            if oldest[-1][1] + self.unsaved_ttl >= now and self.unsaved_size <= self.max_bytes // 4:
+                break
+            self._unsaved.popitem(last=False)
+            self.unsaved_size -= sum(entry_size(kept) for kept, _ in oldest)
+
+    def _take_unsaved(self, contact_info):
+        pending = self._unsaved.pop(contact_info, None)
+        if pending is None:
+            return []
+        self.unsaved_size -= sum(entry_size(entry) for entry, _ in pending)
+        cutoff = time.monotonic() - self.unsaved_ttl
+        return [entry for entry, appended_at in pending if appended_at >= cutoff]
+
+    def _drop(self, contact_info):
+        history = self._histories.pop(contact_info, None)
+        if history is not None:
+            self.size -= history.size
+
+    def _evict(self):
+        # Never evict the contact that was just used, even if it alone is over the limit
+        while self.size > self.max_bytes and len(self._histories) > 1:
+            contact_info, history = self._histories.popitem(last=False)
+            self.size -= history.size
+            self.evictions += 1
+
+# Shared by every bot in the process
+history_cache = HistoryCache()
@@ -0,0 +1,60 @@
+import asyncio
+
+class KeyedSerializer:
+    """
+    Runs calls concurrently across keys but one at a time, in call order, per key
+
+    At most `limit` calls run at once. Calls waiting for an earlier call with the
+    same key don't take up one of the `limit` slots, so a busy key can't hold up
+    the others. Calls with key None are only limited, not ordered.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.running = 0
+        self._unkeyed = 0    # calls with key None running or waiting
+        self._slots = asyncio.Semaphore(limit)
+        self._keys = {}    # key -> [lock, calls holding or waiting for it]
+
+    @property
+    def pending(self):
+        """Calls running or waiting to run"""
+        return sum(count for _, count in self._keys.values()) + self._unkeyed
+
+    async def run(self, key, func, *args):
+        """Await func(*args) once every earlier call with the same key has finished"""
+        if key is None:
+            self._unkeyed += 1
+            try:
+                return await self._run_limited(func, *args)
+            finally:
+                self._unkeyed -= 1
+
+        entry = self._keys.get(key)
+        if entry is None:
+            entry = self._keys[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # asyncio.Lock hands itself to waiters in the order they started waiting
+            async with entry[0]:
+                return await self._run_limited(func, *args)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._keys[key]
+
+    async def _run_limited(self, func, *args):
+        async with self._slots:
+            self.running += 1
+            try:
+                return await func(*args)
+            finally:
+                self.running -= 1
+
+    def stats(self):
+        return {
+            'limit': self.limit,
+            'running': self.running,
+            'pending': self.pending,
+            'active_keys': len(self._keys)
+        }
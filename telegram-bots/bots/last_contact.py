@@ -0,0 +1,142 @@
+import os
+import asyncio
+import logging
+
+from bots.supabase_client import get_supabase_client
+from bots.metrics import LAST_CONTACT_PENDING, LAST_CONTACT_UPDATES
+
+# Seconds between bulk last_contact updates. 0 leaves last_contact to the messages
+# trigger, which updates the contact row with every insert.
+LAST_CONTACT_FLUSH_INTERVAL = float(os.getenv('LAST_CONTACT_FLUSH_INTERVAL', '2'))
+# Flush early once this many contacts are waiting
+LAST_CONTACT_BATCH_SIZE = int(os.getenv('LAST_CONTACT_BATCH_SIZE', '1000'))
+
+# Tells update_contact_last_contact_trigger to skip the insert (see backend/supabase/schema.sql)
+DEFERRED_HEADERS = {'X-Last-Contact': 'deferred'}
+
+def is_last_contact_coalescing_enabled():
+    return LAST_CONTACT_FLUSH_INTERVAL > 0
+
+def last_contact_headers(headers=None):
+    """
+    Headers for a request inserting messages: with coalescing on, the trigger leaves
+    last_contact alone and the bots update it through touch_last_contact() instead
+    """
+    if not is_last_contact_coalescing_enabled():
+        return headers
+    return {**(headers or {}), **DEFERRED_HEADERS}
+
+class LastContactCoalescer:
+    """
+    Batches the contacts.last_contact updates for the messages the bots store
+
+    touch() remembers the newest message time per contact, and a background task
+    writes them every `flush_interval` seconds (or once `batch_size` contacts are
+    waiting) with one touch_contacts call. A customer sending ten messages in a
+    burst then costs one contact row update instead of ten, and bursts on hot
+    contacts no longer queue up on the contact's row lock. When the call fails,
+    the contacts are kept for the next flush.
+    """
+
+    def __init__(self, flush_interval=None, batch_size=None, logger=None):
+        self.flush_interval = flush_interval or LAST_CONTACT_FLUSH_INTERVAL
+        self.batch_size = batch_size or LAST_CONTACT_BATCH_SIZE
+        self.logger = logger or logging.getLogger(__name__)
+        self.pending = {}    # contact_info -> newest message timestamp (ISO)
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = None
+
+        # Counters for tuning
+        self.touched = 0
+        self.flushed_contacts = 0
+        self.flushes = 0
+
+    def touch(self, contact_info, timestamp):
+        """Record a message stored at `timestamp` (ISO, UTC) for the contact"""
+        current = self.pending.get(contact_info)
+        if current is None or timestamp > current:
+            self.pending[contact_info] = timestamp
+        self.touched += 1
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        if len(self.pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def stop(self):
+        """Stop the background task and write whatever is still pending"""
+        self._stopping = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write the pending timestamps with one touch_contacts call"""
+        if not self.pending:
+            return
+
+        batch, self.pending = self.pending, {}
+        try:
+            response = await get_supabase_client().rpc("touch_contacts", {
+                'p_contacts': [
+                    {'contact_info': contact_info, 'last_contact': timestamp}
+                    for contact_info, timestamp in batch.items()
+                ]
+            })
+            if response.status_code != 200:
+                raise RuntimeError(response.text)
+        except Exception as e:
+            # Keep them for the next flush, unless newer messages arrived meanwhile
+            for contact_info, timestamp in batch.items():
+                if timestamp > self.pending.get(contact_info, ''):
+                    self.pending[contact_info] = timestamp
+            self.logger.warning(f"Error updating last_contact for {len(batch)} contacts, retrying: {e}")
+            return
+
+        self.flushes += 1
+        self.flushed_contacts += len(batch)
+        LAST_CONTACT_UPDATES.inc(len(batch))
+        self.logger.debug(f"Updated last_contact for {len(batch)} contacts ({self.touched} messages so far)")
+
+    def stats(self):
+        return {
+            'pending': len(self.pending),
+            'touched': self.touched,
+            'flushed_contacts': self.flushed_contacts,
+            'flushes': self.flushes
+        }
+
+# One coalescer per event loop, like the Supabase client it writes through
+_coalescers = {}
+
+LAST_CONTACT_PENDING.set_function(lambda: sum(len(coalescer.pending) for coalescer in list(_coalescers.values())))
+
+def touch_last_contact(contact_info, timestamp):
+    """Update the contact's last_contact with the next flush (no-op when coalescing is off)"""
+    if not is_last_contact_coalescing_enabled():
+        return
+
+    loop = asyncio.get_running_loop()
+    coalescer = _coalescers.get(loop)
+    if coalescer is None:
+        coalescer = _coalescers[loop] = LastContactCoalescer()
+    coalescer.touch(contact_info, timestamp)
+
+async def close_last_contact_coalescer():
+    """Write pending last_contact updates for the running event loop and drop its coalescer"""
+    coalescer = _coalescers.pop(asyncio.get_running_loop(), None)
+
+    if coalescer is not None:
+        await coalescer.stop()
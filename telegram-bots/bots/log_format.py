@@ -0,0 +1,66 @@
+import os
+import json
+import logging
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# "text": the usual log line followed by the record's extra fields as key=value,
+# "json": one JSON object per line, for log collectors
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+STANDARD_ATTRIBUTES = frozenset(logging.LogRecord(None, None, '', 0, '', (), None).__dict__) | {'message', 'asctime'}
+
+def extra_fields(record):
+    """The fields passed to the logging call through `extra`"""
+    return {key: value for key, value in record.__dict__.items() if key not in STANDARD_ATTRIBUTES}
+
+def _text_value(value):
+    value = str(value)
+    return json.dumps(value) if not value or any(c.isspace() or c in '="' for c in value) else value
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formatter that also prints the `extra` fields of a record
+
+    The bots log per-message events with fields like bot, message_id and chat_id
+    in `extra`, which logging's own formatters drop.
+    """
+
+    def __init__(self, json_lines=False):
+        super().__init__(TEXT_FORMAT)
+        self.json_lines = json_lines
+
+    def formatMessage(self, record):
+        # The line before any traceback, so the fields stay on the same line as the message
+        line = super().formatMessage(record)
+        fields = extra_fields(record)
+        if not fields:
+            return line
+        return line + ' ' + ' '.join(f"{key}={_text_value(value)}" for key, value in fields.items())
+
+    def format(self, record):
+        if not self.json_lines:
+            return super().format(record)
+
+        entry = {
+            'time': self.formatTime(record),
+            'logger': record.name,
+            'level': record.levelname,
+            'message': record.getMessage(),
+            **extra_fields(record)
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def configure_logging(level=None, log_format=None):
+    """Set up the root logger with StructuredFormatter (LOG_LEVEL and LOG_FORMAT by default)"""
+    handler = logging.StreamHandler()
+    handler.setFormatter(StructuredFormatter(json_lines=(log_format or LOG_FORMAT) == 'json'))
+    logging.basicConfig(handlers=[handler], level=(level or LOG_LEVEL).upper())
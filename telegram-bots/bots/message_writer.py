@@ -0,0 +1,206 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+
+from bots.supabase_client import MESSAGE_CONFLICT_COLUMNS, get_supabase_client
+from bots.contact_cache import contact_cache, chat_registry, is_chat_registered
+from bots.last_contact import last_contact_headers, touch_last_contact
+from bots.metrics import MESSAGES_INGESTED, MESSAGES_FAILED, WRITE_BEHIND_QUEUE_DEPTH
+
+# Write-behind settings
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv('WRITE_BEHIND_BATCH_SIZE', '100'))
+WRITE_BEHIND_MAX_LATENCY = float(os.getenv('WRITE_BEHIND_MAX_LATENCY_MS', '200')) / 1000
+WRITE_BEHIND_QUEUE_SIZE = int(os.getenv('WRITE_BEHIND_QUEUE_SIZE', '10000'))
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv('WRITE_BEHIND_MAX_RETRIES', '3'))
+
+def is_write_behind_enabled():
+    """Check whether write-behind persistence is turned on in the environment"""
+    return os.getenv('MESSAGE_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+
+class MessageWriter:
+    """
+    Write-behind persistence for messages
+
+    Messages are put on an asyncio queue and a background task bulk-inserts them,
+    flushing when `batch_size` messages are waiting or the oldest one has waited
+    `max_latency` seconds. When the queue is full, enqueue() waits (backpressure).
+    """
+
+    def __init__(self, bot_identifier=None, logger=None, batch_size=None, max_latency=None,
+                 queue_size=None, max_retries=None):
+        self.bot_identifier = bot_identifier
+        self.logger = logger or logging.getLogger(__name__)
+        self.batch_size = batch_size or WRITE_BEHIND_BATCH_SIZE
+        self.max_latency = max_latency if max_latency is not None else WRITE_BEHIND_MAX_LATENCY
+        self.max_retries = max_retries if max_retries is not None else WRITE_BEHIND_MAX_RETRIES
+        self.queue = asyncio.Queue(maxsize=queue_size or WRITE_BEHIND_QUEUE_SIZE)
+        self._task = None
+
+        # Counters for tuning
+        self.flushed_messages = 0
+        self.flushed_batches = 0
+        self.dropped_messages = 0
+
+        label = bot_identifier or self.logger.name
+        self._ingested = MESSAGES_INGESTED.labels(label)
+        self._failed = MESSAGES_FAILED.labels(label, "incoming")
+        WRITE_BEHIND_QUEUE_DEPTH.labels(label).set_function(self.queue.qsize)
+
+    def start(self):
+        """Start the background flusher on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued and stop the flusher"""
+        if self._task is None:
+            return
+
+        # The sentinel is queued behind any pending messages, so they get flushed first
+        await self.queue.put(None)
+        await self._task
+        self._task = None
+
+    async def enqueue(self, contact_info, contact_name, content, direction="incoming", timestamp=None,
+                      chat_id=None, telegram_message_id=None):
+        """Queue a message for the next batch, waiting if the queue is full"""
+        record = {
+            'contact_info': contact_info,
+            'contact_name': contact_name,
+            'content': content,
+            'direction': direction,
+            'timestamp': timestamp or datetime.utcnow().isoformat(),
+            'bot_identifier': self.bot_identifier,
+            'telegram_chat_id': chat_id,
+            'telegram_message_id': telegram_message_id,
+            'queued_at': time.monotonic()
+        }
+
+        if self.queue.full():
+            self.logger.warning(f"Write-behind queue full ({self.queue.qsize()} messages), waiting for a flush")
+
+        await self.queue.put(record)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            record = await self.queue.get()
+            if record is None:
+                break
+
+            batch = [record]
+            deadline = loop.time() + self.max_latency
+
+            # Collect more messages until the batch is full or the deadline passes
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    record = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if record is None:
+                    stopping = True
+                    break
+                batch.append(record)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        started = time.monotonic()
+        oldest_wait = started - batch[0]['queued_at']
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self._insert_batch(batch)
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.dropped_messages += len(batch)
+                    self._failed.inc(len(batch))
+                    self.logger.error(f"Giving up on batch of {len(batch)} messages after {attempt + 1} attempts: {e}")
+                    return
+                self.logger.warning(f"Error flushing batch of {len(batch)} messages (attempt {attempt + 1}): {e}")
+                await asyncio.sleep(min(2 ** attempt, 10))
+
+        self.flushed_messages += len(batch)
+        self.flushed_batches += 1
+        self._ingested.inc(len(batch))
+        flush_ms = (time.monotonic() - started) * 1000
+        self.logger.debug(
+            f"Flushed {len(batch)} messages in {flush_ms:.1f} ms "
+            f"(oldest waited {oldest_wait * 1000:.1f} ms, {self.queue.qsize()} still queued)",
+            extra={'bot': self.bot_identifier, 'batch_size': len(batch), 'flush_ms': round(flush_ms, 1),
+                   'oldest_wait_ms': round(oldest_wait * 1000, 1), 'queue_depth': self.queue.qsize()}
+        )
+
+    async def _insert_batch(self, batch):
+        """Insert a batch with a single request"""
+        client = get_supabase_client()
+
+        # If every contact and its chat are known, insert straight into messages
+        contact_ids = [contact_cache.get(record['contact_info']) for record in batch]
+        if all(contact_ids) and all(
+            is_chat_registered(record['contact_info'], record['telegram_chat_id']) for record in batch
+        ):
+            rows = [
+                {
+                    'contact_id': contact_id,
+                    'content': record['content'],
+                    'timestamp': record['timestamp'],
+                    'direction': record['direction'],
+                    'is_from_customer': record['direction'] == 'incoming',
+                    'is_ai_response': False,
+                    'is_sent': record['direction'] == 'incoming',
+                    'bot_identifier': record['bot_identifier'],
+                    'telegram_chat_id': record['telegram_chat_id'],
+                    'telegram_message_id': record['telegram_message_id']
+                }
+                for contact_id, record in zip(contact_ids, batch)
+            ]
+            # Messages stored by an earlier attempt of this batch are skipped
+            response = await client.post(
+                "/messages",
+                json=rows,
+                params={"on_conflict": MESSAGE_CONFLICT_COLUMNS},
+                headers=last_contact_headers({"Prefer": "return=minimal,resolution=ignore-duplicates"})
+            )
+
+            if response.status_code == 201:
+                self._touch_contacts(batch)
+                return
+
+            if response.status_code != 409:
+                raise RuntimeError(f"Error saving messages: {response.text}")
+
+            # A cached contact was deleted - forget them and let the RPC recreate them
+            for record in batch:
+                contact_cache.invalidate(record['contact_info'])
+
+        # Otherwise create missing contacts, record their chats and insert the messages in one RPC
+        response = await client.rpc("ingest_messages", {
+            'p_messages': [
+                {key: value for key, value in record.items() if key != 'queued_at'}
+                for record in batch
+            ]
+        }, headers=last_contact_headers())
+
+        if response.status_code != 200:
+            raise RuntimeError(f"Error saving messages: {response.text}")
+
+        self._touch_contacts(batch)
+
+        for row in response.json():
+            contact_cache.set(row['contact_info'], row['contact_id'])
+        for record in batch:
+            if record['telegram_chat_id'] is not None:
+                chat_registry.set(record['contact_info'], record['telegram_chat_id'])
+
+    def _touch_contacts(self, batch):
+        for record in batch:
+            touch_last_contact(record['contact_info'], record['timestamp'])
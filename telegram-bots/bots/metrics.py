@@ -0,0 +1,285 @@
+"""
+Prometheus-style metrics for the bots
+
+A small in-process registry of counters, gauges and histograms with labels,
+rendered in the Prometheus text format on run_all.py's /metrics endpoint.
+Metrics are updated from the event loop, so no locking is done.
+
+    from bots.metrics import MESSAGES_INGESTED
+    MESSAGES_INGESTED.labels(bot="bot1").inc()
+"""
+import math
+import time
+
+# Latency buckets in seconds, from fast DB round trips to slow Telegram calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+
+    def labels(self, *values, **kwargs):
+        """Get the child metric for one combination of label values"""
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(value) for value in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _unlabelled(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name} has labels {self.labelnames}; use .labels()")
+        return self.labels()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for key, child in list(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._unlabelled().inc(amount)
+
+    def _render_child(self, key, child):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"]
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+        self._function = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set_function(self, function):
+        """Read the value from `function()` whenever the metrics are rendered"""
+        self._function = function
+
+    def get(self):
+        return self._function() if self._function else self.value
+
+class Gauge(_Metric):
+    """Value that can go up and down, optionally read from a callback"""
+    type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._unlabelled().set(value)
+
+    def set_function(self, function):
+        self._unlabelled().set_function(function)
+
+    def remove(self, *values, **kwargs):
+        """Forget one combination of label values, e.g. for a bot that was stopped"""
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        self._children.pop(tuple(str(value) for value in values), None)
+
+    def _render_child(self, key, child):
+        try:
+            value = child.get()
+        except Exception:
+            return []
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def time(self):
+        """Context manager observing the time spent in its block"""
+        return _Timer(self)
+
+class _Timer:
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.started)
+
+class Histogram(_Metric):
+    """Distribution of observed values (typically durations in seconds)"""
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._unlabelled().observe(value)
+
+    def time(self):
+        return self._unlabelled().time()
+
+    def _render_child(self, key, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Render every metric in the Prometheus text format"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# Supabase REST calls
+SUPABASE_REQUESTS = REGISTRY.counter(
+    "bladex_supabase_requests_total", "Supabase REST requests", ("method", "endpoint", "status"))
+SUPABASE_REQUEST_DURATION = REGISTRY.histogram(
+    "bladex_supabase_request_duration_seconds", "Supabase REST request latency", ("method", "endpoint"))
+
+# Telegram sends and outgoing delivery
+TELEGRAM_SEND_DURATION = REGISTRY.histogram(
+    "bladex_telegram_send_duration_seconds", "Telegram sendMessage latency", ("bot",))
+TELEGRAM_RETRY_AFTERS = REGISTRY.counter(
+    "bladex_telegram_retry_after_total", "RetryAfter responses from Telegram", ("bot",))
+OUTGOING_POLL_DURATION = REGISTRY.histogram(
+    "bladex_outgoing_poll_duration_seconds", "Time to claim, send and mark one batch of outgoing messages", ("bot",))
+
+# Message flow per bot
+MESSAGES_INGESTED = REGISTRY.counter(
+    "bladex_messages_ingested_total", "Incoming messages stored in Supabase", ("bot",))
+MESSAGES_SENT = REGISTRY.counter(
+    "bladex_messages_sent_total", "Outgoing messages delivered to Telegram", ("bot",))
+MESSAGES_FAILED = REGISTRY.counter(
+    "bladex_messages_failed_total", "Messages that could not be stored or delivered", ("bot", "direction"))
+
+# Queues
+SEND_QUEUE_DEPTH = REGISTRY.gauge(
+    "bladex_send_queue_depth", "Outgoing messages waiting in the send scheduler", ("bot",))
+WRITE_BEHIND_QUEUE_DEPTH = REGISTRY.gauge(
+    "bladex_write_behind_queue_depth", "Incoming messages waiting in the write-behind queue", ("bot",))
+SPOOL_SIZE = REGISTRY.gauge(
+    "bladex_spool_size", "Incoming messages in the local spool waiting to be replayed to Supabase", ("bot",))
+UPDATES_PENDING = REGISTRY.gauge(
+    "bladex_updates_pending", "Telegram updates being handled or waiting for an earlier update from their chat", ("bot",))
+SPOOL_REPLAY_LAG = REGISTRY.gauge(
+    "bladex_spool_replay_lag_seconds", "Age of the oldest message waiting in the local spool", ("bot",))
+
+# Contact and history caches (shared by every bot in the process)
+CONTACT_CACHE_SIZE = REGISTRY.gauge("bladex_contact_cache_size", "Contacts in the contact id cache")
+CONTACT_CACHE_HIT_RATE = REGISTRY.gauge("bladex_contact_cache_hit_rate", "Contact id cache hit rate")
+HISTORY_CACHE_BYTES = REGISTRY.gauge("bladex_history_cache_bytes", "Approximate memory used by cached conversation histories")
+HISTORY_CACHE_HIT_RATE = REGISTRY.gauge("bladex_history_cache_hit_rate", "Conversation history cache hit rate")
+
+# AI auto-replies
+AUTO_REPLIES = REGISTRY.counter(
+    "bladex_auto_replies_total", "Auto-reply outcomes: cache, coalesced or llm replies, errors and drops", ("bot", "source"))
+AUTO_REPLY_LATENCY = REGISTRY.histogram(
+    "bladex_auto_reply_latency_seconds", "Time from receiving a message to storing its auto-reply", ("bot",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+AUTO_REPLY_PENDING = REGISTRY.gauge(
+    "bladex_auto_reply_pending", "Auto-replies being generated or waiting for a worker", ("bot",))
+AUTO_REPLY_CACHE_HIT_RATE = REGISTRY.gauge("bladex_auto_reply_cache_hit_rate", "Auto-reply cache hit rate")
+
+# Batched contacts.last_contact updates (shared by every bot in the process)
+LAST_CONTACT_PENDING = REGISTRY.gauge("bladex_last_contact_pending", "Contacts waiting for their batched last_contact update")
+LAST_CONTACT_UPDATES = REGISTRY.counter("bladex_last_contact_updates_total", "Contacts whose last_contact was written by the bots")
+
+# Per-bot gauges read through set_function() from the bot's application and services
+BOT_GAUGES = (
+    SEND_QUEUE_DEPTH, WRITE_BEHIND_QUEUE_DEPTH, SPOOL_SIZE, UPDATES_PENDING, SPOOL_REPLAY_LAG, AUTO_REPLY_PENDING
+)
+
+def remove_bot_gauges(bot_identifier):
+    """Forget the gauges of a bot that was removed, and the objects their callbacks keep alive"""
+    for gauge in BOT_GAUGES:
+        gauge.remove(bot_identifier)
@@ -0,0 +1,245 @@
+import os
+import json
+import asyncio
+import logging
+import aiohttp
+
+from bots.supabase_client import SUPABASE_URL, SUPABASE_KEY
+
+# Realtime settings
+# Realtime server, when it isn't reached through SUPABASE_URL (e.g. the fake one in stubs/ for load tests)
+SUPABASE_REALTIME_URL = os.getenv('SUPABASE_REALTIME_URL', '')
+REALTIME_HEARTBEAT_INTERVAL = float(os.getenv('REALTIME_HEARTBEAT_INTERVAL', '25'))
+REALTIME_MAX_BACKOFF = float(os.getenv('REALTIME_MAX_BACKOFF', '30'))
+
+def get_realtime_url(supabase_url=None, key=None):
+    """Build the Supabase Realtime websocket URL from the REST URL"""
+    url = (supabase_url or SUPABASE_REALTIME_URL or SUPABASE_URL).rstrip('/')
+    if url.startswith('https://'):
+        url = 'wss://' + url[len('https://'):]
+    elif url.startswith('http://'):
+        url = 'ws://' + url[len('http://'):]
+    return f"{url}/realtime/v1/websocket?apikey={key or SUPABASE_KEY}&vsn=1.0.0"
+
+class RealtimeListener:
+    """
+    Subscribes to INSERTs on public.messages through Supabase Realtime
+
+    Speaks the Phoenix channel protocol used by Realtime: joins a channel with a
+    postgres_changes config, sends heartbeats, and reconnects with exponential
+    backoff when the socket drops, or when a heartbeat is still unanswered once
+    the next one is due (a connection lost without a close). `on_insert(record)`
+    is called for every inserted row and `on_connect()` after every successful
+    (re)join, so callers can catch up on anything missed while disconnected.
+    """
+
+    def __init__(self, on_insert, on_connect=None, url=None, key=None, row_filter="direction=eq.outgoing",
+                 topic="realtime:bladex-outgoing", heartbeat_interval=None, logger=None):
+        self.on_insert = on_insert
+        self.on_connect = on_connect
+        self.key = key or SUPABASE_KEY
+        self.url = url or get_realtime_url(key=self.key)
+        self.row_filter = row_filter
+        self.topic = topic
+        self.heartbeat_interval = heartbeat_interval or REALTIME_HEARTBEAT_INTERVAL
+        self.logger = logger or logging.getLogger(__name__)
+        self.connected = False
+        self.reconnects = 0
+        self.heartbeat_timeouts = 0
+        self._ref = 0
+        self._heartbeat_ref = None
+        self._task = None
+
+    def start(self):
+        """Start listening in the background on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.connected = False
+
+    def _next_ref(self):
+        self._ref += 1
+        return str(self._ref)
+
+    def _join_message(self):
+        postgres_changes = {"event": "INSERT", "schema": "public", "table": "messages"}
+        if self.row_filter:
+            postgres_changes["filter"] = self.row_filter
+
+        return {
+            "topic": self.topic,
+            "event": "phx_join",
+            "payload": {
+                "config": {"postgres_changes": [postgres_changes]},
+                "access_token": self.key
+            },
+            "ref": self._next_ref()
+        }
+
+    async def _run(self):
+        backoff = 1
+
+        async with aiohttp.ClientSession() as session:
+            while True:
+                try:
+                    await self._listen(session)
+                    backoff = 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.logger.warning(f"Realtime connection error: {e}")
+
+                self.connected = False
+                self.reconnects += 1
+                self.logger.info(f"Realtime disconnected, reconnecting in {backoff}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, REALTIME_MAX_BACKOFF)
+
+    async def _listen(self, session):
+        async with session.ws_connect(self.url) as ws:
+            join = self._join_message()
+            await ws.send_json(join)
+            heartbeat = asyncio.create_task(self._heartbeat(ws))
+
+            try:
+                async for msg in ws:
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        if msg.type == aiohttp.WSMsgType.ERROR:
+                            raise ws.exception()
+                        continue
+
+                    data = json.loads(msg.data)
+                    event = data.get("event")
+                    payload = data.get("payload") or {}
+
+                    if event == "phx_reply" and data.get("ref") == self._heartbeat_ref:
+                        self._heartbeat_ref = None
+
+                    elif event == "phx_reply" and data.get("ref") == join["ref"]:
+                        if payload.get("status") != "ok":
+                            raise RuntimeError(f"Could not join {self.topic}: {payload}")
+                        self.connected = True
+                        self.logger.info(f"Subscribed to {self.topic}")
+                        if self.on_connect:
+                            await self.on_connect()
+
+                    elif event == "postgres_changes":
+                        change = payload.get("data") or {}
+                        if change.get("type") == "INSERT" and change.get("record"):
+                            await self.on_insert(change["record"])
+
+                    elif event in ("phx_error", "phx_close") and data.get("topic") == self.topic:
+                        raise RuntimeError(f"Channel {self.topic} closed: {event}")
+            finally:
+                heartbeat.cancel()
+
+    async def _heartbeat(self, ws):
+        self._heartbeat_ref = None
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            if self._heartbeat_ref is not None:
+                # Closing ends _listen, and _run reconnects
+                self.heartbeat_timeouts += 1
+                self.logger.warning(f"Realtime heartbeat not answered within {self.heartbeat_interval}s, reconnecting")
+                await ws.close()
+                return
+            self._heartbeat_ref = self._next_ref()
+            await ws.send_json({"topic": "phoenix", "event": "heartbeat", "payload": {}, "ref": self._heartbeat_ref})
+
+class RealtimeRouter:
+    """
+    One RealtimeListener shared by every bot on an event loop
+
+    Each bot delivers the outgoing messages of its own contacts, so rather than
+    every bot holding a socket that wakes it for every outgoing insert, the
+    process holds one and hands each insert to the bot named in the row's
+    bot_identifier (filled in for dashboard messages by
+    set_outgoing_bot_identifier_trigger). Inserts for bots running elsewhere are
+    ignored. After every (re)join each bot's on_connect() runs so it catches up.
+    The listener runs while at least one bot is subscribed.
+    """
+
+    def __init__(self, logger=None, **listener_kwargs):
+        self.logger = logger or logging.getLogger(__name__)
+        self.listener = RealtimeListener(self._on_insert, self._on_connect, logger=self.logger, **listener_kwargs)
+        self.routed = 0
+        self.ignored = 0
+        self._bots = {}    # bot_identifier -> (on_insert, on_connect)
+
+    async def subscribe(self, bot_identifier, on_insert, on_connect=None):
+        """Route inserts for bot_identifier to on_insert(record), starting the listener if needed"""
+        self._bots[bot_identifier] = (on_insert, on_connect)
+        self.listener.start()
+        # Already joined, so the bot won't see the next on_connect(): catch up now
+        if self.listener.connected and on_connect:
+            await on_connect()
+
+    async def unsubscribe(self, bot_identifier):
+        """Stop routing to bot_identifier; the listener stops with the last bot"""
+        self._bots.pop(bot_identifier, None)
+        if not self._bots:
+            await self.listener.stop()
+
+    async def _on_insert(self, record):
+        handlers = self._bots.get(record.get('bot_identifier'))
+        if handlers is None:
+            self.ignored += 1
+            return
+        self.routed += 1
+        await handlers[0](record)
+
+    async def _on_connect(self):
+        for bot_identifier, (_, on_connect) in list(self._bots.items()):
+            if on_connect:
+                try:
+                    await on_connect()
+                except Exception as e:
+                    self.logger.error(f"Realtime catch-up failed for {bot_identifier}: {e}")
+
+# One router per event loop - the listener's socket belongs to the loop it runs on
+_routers = {}
+
+def get_realtime_router():
+    """Get the shared Realtime router for the running event loop"""
+    loop = asyncio.get_running_loop()
+    router = _routers.get(loop)
+
+    if router is None:
+        router = RealtimeRouter()
+        _routers[loop] = router
+
+    return router
+
+class RealtimeSubscription:
+    """
+    A bot's subscription to the shared RealtimeRouter, started and stopped with the bot
+    """
+
+    def __init__(self, bot_identifier, on_insert, on_connect=None, router=None):
+        self.bot_identifier = bot_identifier
+        self.on_insert = on_insert
+        self.on_connect = on_connect
+        self.router = router
+
+    @property
+    def listener(self):
+        return self.router.listener if self.router is not None else None
+
+    async def start(self):
+        if self.router is None:
+            self.router = get_realtime_router()
+        await self.router.subscribe(self.bot_identifier, self.on_insert, self.on_connect)
+
+    async def stop(self):
+        if self.router is not None:
+            await self.router.unsubscribe(self.bot_identifier)
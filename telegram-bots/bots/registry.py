@@ -0,0 +1,93 @@
+import os
+import re
+import zlib
+import logging
+from collections import namedtuple
+
+try:
+    import tomllib
+except ImportError:
+    # Python < 3.11
+    import tomli as tomllib
+
+# Bot registry file; run_all.py falls back to the bots/botN.py modules when it doesn't exist
+BOTS_CONFIG = os.getenv('BOTS_CONFIG', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bots.toml'))
+# Seconds between checks of the registry file for changes (0 disables hot reload)
+BOTS_CONFIG_RELOAD_INTERVAL = float(os.getenv('BOTS_CONFIG_RELOAD_INTERVAL', '5'))
+
+# Used in contact_info ("<user_id>:<bot_identifier>") and in webhook URLs
+BOT_IDENTIFIER_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+BOT_OPTIONS = {'token', 'token_env', 'enabled', 'update_concurrency'}
+
+logger = logging.getLogger(__name__)
+
+# One bot from the registry
+BotConfig = namedtuple('BotConfig', ['bot_identifier', 'token', 'update_concurrency'], defaults=[None])
+
+def parse_registry(data, environ=None):
+    """
+    Turn the parsed registry file into a list of BotConfig, in file order
+
+    [defaults] applies to every bot and [bots.<bot_identifier>] configures one bot:
+    its `token`, or `token_env` naming the environment variable holding it, plus
+    `enabled` and `update_concurrency`. Bots without a token are skipped with a
+    warning; anything else that's wrong raises ValueError.
+    """
+    environ = os.environ if environ is None else environ
+    unknown = set(data) - {'defaults', 'bots'}
+    if unknown:
+        raise ValueError(f"Unknown sections in bot registry: {', '.join(sorted(unknown))}")
+
+    defaults = data.get('defaults', {})
+    bots = data.get('bots', {})
+    if not isinstance(defaults, dict) or not isinstance(bots, dict):
+        raise ValueError("[defaults] and [bots.<name>] must be tables")
+
+    configs = []
+    for bot_identifier, options in bots.items():
+        if not BOT_IDENTIFIER_PATTERN.match(bot_identifier):
+            raise ValueError(f"Invalid bot identifier {bot_identifier!r}: use letters, digits, _ and -")
+        if not isinstance(options, dict):
+            raise ValueError(f"[bots.{bot_identifier}] must be a table")
+
+        options = {**defaults, **options}
+        unknown = set(options) - BOT_OPTIONS
+        if unknown:
+            raise ValueError(f"Unknown options for {bot_identifier}: {', '.join(sorted(unknown))}")
+
+        if not options.get('enabled', True):
+            continue
+
+        update_concurrency = options.get('update_concurrency')
+        if update_concurrency is not None and (not isinstance(update_concurrency, int) or update_concurrency < 1):
+            raise ValueError(f"update_concurrency for {bot_identifier} must be a positive integer")
+
+        token = options.get('token')
+        if token is None and 'token_env' in options:
+            token = environ.get(options['token_env'])
+        if not token:
+            logger.warning(f"No bot token provided for {bot_identifier} in the bot registry, skipping")
+            continue
+
+        configs.append(BotConfig(bot_identifier, token, update_concurrency))
+    return configs
+
+def load_registry(path=BOTS_CONFIG):
+    """Read the registry file at `path` (see parse_registry)"""
+    with open(path, 'rb') as f:
+        try:
+            data = tomllib.load(f)
+        except tomllib.TOMLDecodeError as e:
+            raise ValueError(f"Invalid bot registry {path}: {e}") from e
+    return parse_registry(data)
+
+def registry_mtime(path=BOTS_CONFIG):
+    """Modification time of the registry file, or None if it doesn't exist"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def shard_index(bot_identifier, shards):
+    """Shard a bot belongs to; stable across restarts and registry changes"""
+    return zlib.crc32(bot_identifier.encode()) % shards
@@ -0,0 +1,254 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from telegram.error import RetryAfter
+
+from bots.metrics import TELEGRAM_SEND_DURATION, TELEGRAM_RETRY_AFTERS, SEND_QUEUE_DEPTH
+
+# Telegram allows roughly 30 messages per second per bot and 1 per second per chat
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))
+TELEGRAM_GLOBAL_BURST = float(os.getenv('TELEGRAM_GLOBAL_BURST', '30'))
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '1'))
+TELEGRAM_CHAT_BURST = float(os.getenv('TELEGRAM_CHAT_BURST', '1'))
+TELEGRAM_MAX_CONCURRENT_SENDS = int(os.getenv('TELEGRAM_MAX_CONCURRENT_SENDS', '30'))
+# A message is handed back to its caller (as a failed send) after this many RetryAfter
+# answers, or once they add up to more than this many seconds of waiting
+TELEGRAM_RETRY_AFTER_MAX_RETRIES = int(os.getenv('TELEGRAM_RETRY_AFTER_MAX_RETRIES', '3'))
+TELEGRAM_RETRY_AFTER_MAX_WAIT = float(os.getenv('TELEGRAM_RETRY_AFTER_MAX_WAIT', '60'))
+
+# Idle per-chat buckets are pruned once there are more than this many
+CHAT_BUCKET_PRUNE_THRESHOLD = 10000
+
+class ChatSendAborted(Exception):
+    """Not sent because an earlier message to the same chat failed; retrying it keeps the chat in order"""
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate` operations per second with bursts of up to `capacity`
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """Take a token if one is available, otherwise return how long to wait for one"""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        """Wait until a token is available and take it (waiters are served in order)"""
+        async with self._lock:
+            while True:
+                wait = self.reserve()
+                if wait <= 0:
+                    return
+                await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        """Hand out no tokens for the next `seconds` seconds"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def is_idle(self):
+        """True when the bucket is full again, i.e. forgetting it changes nothing"""
+        now = time.monotonic()
+        return now >= self.paused_until and self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+class SendScheduler:
+    """
+    Rate-limit-aware Telegram sender owned by a bot application
+
+    Messages are queued per chat and sent in order, one at a time per chat,
+    while different chats are sent concurrently. A global token bucket keeps
+    the bot under Telegram's overall limit and per-chat buckets under the
+    per-chat limit. When Telegram answers with RetryAfter the whole bot backs
+    off for the requested time, not just that chat: Telegram's flood control
+    counts every message the bot sends, and sending to other chats meanwhile
+    only earns more RetryAfter answers. The message is retried at the head of
+    its chat's queue, up to retry_after_max_retries times or
+    retry_after_max_wait seconds in total; after that its future raises the
+    RetryAfter, so the caller can release the message instead of holding it
+    indefinitely.
+
+    When the message at the head of a chat's queue fails, the messages queued
+    behind it for that chat fail too, with ChatSendAborted, so the customer
+    never gets them ahead of the failed one. The caller retries them in order.
+    """
+
+    def __init__(self, bot, logger=None, global_rate=None, global_burst=None, chat_rate=None,
+                 chat_burst=None, max_concurrency=None, bot_identifier=None, retry_after_max_retries=None,
+                 retry_after_max_wait=None):
+        self.bot = bot
+        self.logger = logger or logging.getLogger(__name__)
+        self.bot_identifier = bot_identifier or self.logger.name
+        self.chat_rate = chat_rate or TELEGRAM_CHAT_RATE
+        self.chat_burst = chat_burst or TELEGRAM_CHAT_BURST
+        self.retry_after_max_retries = (
+            TELEGRAM_RETRY_AFTER_MAX_RETRIES if retry_after_max_retries is None else retry_after_max_retries
+        )
+        self.retry_after_max_wait = TELEGRAM_RETRY_AFTER_MAX_WAIT if retry_after_max_wait is None else retry_after_max_wait
+        self.global_bucket = TokenBucket(global_rate or TELEGRAM_GLOBAL_RATE, global_burst or TELEGRAM_GLOBAL_BURST)
+        self._send_slots = asyncio.Semaphore(max_concurrency or TELEGRAM_MAX_CONCURRENT_SENDS)
+        self._queues = {}    # chat_id -> deque of pending sends
+        self._buckets = {}   # chat_id -> TokenBucket
+        self._workers = {}   # chat_id -> task draining that chat's queue
+        self._sent_times = deque()
+
+        # Counters
+        self.sent = 0
+        self.failed = 0
+        self.retry_afters = 0
+
+        self._send_duration = TELEGRAM_SEND_DURATION.labels(self.bot_identifier)
+        self._retry_after_count = TELEGRAM_RETRY_AFTERS.labels(self.bot_identifier)
+        SEND_QUEUE_DEPTH.labels(self.bot_identifier).set_function(lambda: self.queue_depth)
+
+    @property
+    def queue_depth(self):
+        """Number of messages waiting to be sent"""
+        return sum(len(queue) for queue in self._queues.values())
+
+    def submit(self, chat_id, text, **kwargs):
+        """
+        Queue a message for `chat_id` and return a future for the sent telegram.Message
+
+        The future raises the send error if Telegram rejected the message.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(chat_id, deque()).append((text, kwargs, future))
+
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._drain_chat(chat_id))
+
+        return future
+
+    async def stop(self):
+        """Cancel queued sends; their futures are cancelled so callers can release them"""
+        for task in list(self._workers.values()):
+            task.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+        self._workers.clear()
+
+        for queue in self._queues.values():
+            for _, _, future in queue:
+                future.cancel()
+        self._queues.clear()
+
+    def achieved_rate(self, window=60):
+        """Messages sent per second over the last `window` seconds"""
+        cutoff = time.monotonic() - window
+        while self._sent_times and self._sent_times[0] < cutoff:
+            self._sent_times.popleft()
+        return len(self._sent_times) / window
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue_depth,
+            'active_chats': len(self._workers),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retry_afters': self.retry_afters,
+            'send_rate': self.achieved_rate()
+        }
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if len(self._buckets) > CHAT_BUCKET_PRUNE_THRESHOLD:
+                self._buckets = {
+                    key: value for key, value in self._buckets.items()
+                    if key in self._workers or not value.is_idle()
+                }
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._buckets[chat_id] = bucket
+        return bucket
+
+    def _fail_chat(self, chat_id, queue, error):
+        """Fail the message at the head of a chat's queue with `error`, and the ones behind it"""
+        _, _, future = queue.popleft()
+        self.failed += 1
+        if not future.done():
+            future.set_exception(error)
+
+        if queue:
+            self.logger.warning(f"Not sending {len(queue)} later messages to chat {chat_id} after a failed send")
+        aborted = ChatSendAborted(f"An earlier message to chat {chat_id} failed: {error!r}")
+        while queue:
+            _, _, future = queue.popleft()
+            if not future.done():
+                self.failed += 1
+                future.set_exception(aborted)
+
+    async def _drain_chat(self, chat_id):
+        queue = self._queues[chat_id]
+        bucket = self._chat_bucket(chat_id)
+        # RetryAfter answers for the message at the head of the queue, and the seconds they asked for
+        head = None
+        retries = 0
+        waited = 0.0
+
+        try:
+            while queue:
+                if queue[0] is not head:
+                    head = queue[0]
+                    retries = 0
+                    waited = 0.0
+                text, kwargs, future = head
+                if future.cancelled():
+                    queue.popleft()
+                    continue
+
+                await bucket.acquire()
+                await self.global_bucket.acquire()
+
+                try:
+                    async with self._send_slots:
+                        with self._send_duration.time():
+                            message = await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                except RetryAfter as e:
+                    # Back off for the time Telegram asked for, then retry this message first
+                    self.retry_afters += 1
+                    self._retry_after_count.inc()
+                    retry_after = float(e.retry_after)
+                    self.global_bucket.pause(retry_after)
+                    bucket.pause(retry_after)
+                    retries += 1
+                    waited += retry_after
+                    if retries > self.retry_after_max_retries or waited > self.retry_after_max_wait:
+                        # Give up on this message here; the caller decides when to try again
+                        self.logger.warning(f"Giving up on a message to chat {chat_id} after {retries} RetryAfter answers "
+                                            f"({waited:.0f}s)")
+                        self._fail_chat(chat_id, queue, e)
+                        continue
+                    self.logger.warning(f"Telegram asked us to retry after {retry_after}s (chat {chat_id})")
+                    continue
+                except Exception as e:
+                    self._fail_chat(chat_id, queue, e)
+                    continue
+
+                queue.popleft()
+                self.sent += 1
+                self._sent_times.append(time.monotonic())
+                if not future.done():
+                    future.set_result(message)
+        finally:
+            if not queue:
+                self._queues.pop(chat_id, None)
+            self._workers.pop(chat_id, None)
@@ -0,0 +1,361 @@
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from bots.supabase_client import get_supabase_client
+from bots.contact_cache import contact_cache, chat_registry
+from bots.last_contact import last_contact_headers, touch_last_contact
+from bots.metrics import MESSAGES_INGESTED, MESSAGES_FAILED, SPOOL_SIZE, SPOOL_REPLAY_LAG
+
+# Spool settings
+SPOOL_DIR = os.getenv('SPOOL_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'spool'))
+SPOOL_FSYNC_INTERVAL = float(os.getenv('SPOOL_FSYNC_INTERVAL_MS', '5')) / 1000
+SPOOL_FSYNC_BATCH = int(os.getenv('SPOOL_FSYNC_BATCH', '500'))
+SPOOL_REPLAY_BATCH = int(os.getenv('SPOOL_REPLAY_BATCH', '100'))
+SPOOL_REPLAY_MAX_BACKOFF = float(os.getenv('SPOOL_REPLAY_MAX_BACKOFF', '30'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS spooled_messages (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    telegram_chat_id INTEGER,
+    telegram_message_id INTEGER,
+    contact_info TEXT NOT NULL,
+    contact_name TEXT,
+    content TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    spooled_at REAL NOT NULL,
+    UNIQUE (telegram_chat_id, telegram_message_id)
+);
+CREATE TABLE IF NOT EXISTS dead_letters (
+    seq INTEGER PRIMARY KEY,
+    telegram_chat_id INTEGER,
+    telegram_message_id INTEGER,
+    contact_info TEXT NOT NULL,
+    contact_name TEXT,
+    content TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    spooled_at REAL NOT NULL,
+    error TEXT
+);
+"""
+
+COLUMNS = ('telegram_chat_id', 'telegram_message_id', 'contact_info', 'contact_name', 'content', 'direction', 'timestamp', 'spooled_at')
+
+def is_spool_enabled():
+    """Check whether the local message spool is turned on in the environment"""
+    return os.getenv('MESSAGE_SPOOL', '').lower() in ('1', 'true', 'yes')
+
+# Statuses meaning Supabase rejected the data itself (bad values, foreign keys, too large).
+# Anything else, including a bad service key (401/403) or an ingest_messages RPC that
+# isn't deployed yet (404), is retried until it's fixed.
+REJECTED_STATUSES = (400, 409, 413, 422)
+CONFIG_ERROR_STATUSES = (401, 403, 404)
+
+def is_retryable_status(status_code):
+    """Everything but a rejection of the records themselves is retried"""
+    return status_code not in REJECTED_STATUSES
+
+class MessageSpool:
+    """
+    Durable local outbox for incoming messages
+
+    Messages are appended to a SQLite database in WAL mode before the update is
+    acknowledged, and a background replayer pushes them to Supabase in order
+    through the ingest_messages RPC. Appends are group-committed: everything
+    appended within `fsync_interval` shares one transaction and one fsync, so
+    ingest latency stays flat whether Supabase is fast, slow or down. Records
+    carry their Telegram chat and message id, so a batch that is replayed again
+    after a timeout is only stored once. When Supabase rejects a batch as invalid,
+    it is split in halves until the offending record is found, and only that one
+    is moved to the dead_letters table instead of blocking the spool. Outages and
+    authentication or configuration errors are retried with backoff, so no
+    message is given up because of them; so is any other error in the replay
+    loop, such as a locked spool database.
+    """
+
+    def __init__(self, bot_identifier, logger=None, path=None, fsync_interval=None, fsync_batch=None,
+                 replay_batch=None, max_backoff=None):
+        self.bot_identifier = bot_identifier
+        self.logger = logger or logging.getLogger(__name__)
+        self.path = path or os.path.join(SPOOL_DIR, f"{bot_identifier}.db")
+        self.fsync_interval = fsync_interval if fsync_interval is not None else SPOOL_FSYNC_INTERVAL
+        self.fsync_batch = fsync_batch or SPOOL_FSYNC_BATCH
+        self.replay_batch = replay_batch or SPOOL_REPLAY_BATCH
+        self.max_backoff = max_backoff or SPOOL_REPLAY_MAX_BACKOFF
+
+        # SQLite connections stay on one thread, so all database work goes through this executor
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"spool-{bot_identifier}")
+        self._db = None
+        self._pending = []  # (row, future) waiting for the next commit
+        self._commit_wakeup = asyncio.Event()
+        self._replay_wakeup = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._tasks = []
+
+        # Records on disk not yet in Supabase, and when the oldest of them was spooled
+        self.size = 0
+        self.oldest_spooled_at = None
+
+        # Counters
+        self.appended = 0
+        self.replayed = 0
+        self.dead_lettered = 0
+        self.commits = 0
+
+        self._ingested = MESSAGES_INGESTED.labels(bot_identifier)
+        self._failed = MESSAGES_FAILED.labels(bot_identifier, "incoming")
+        SPOOL_SIZE.labels(bot_identifier).set_function(lambda: self.size)
+        SPOOL_REPLAY_LAG.labels(bot_identifier).set_function(self.replay_lag)
+
+    def replay_lag(self):
+        """Seconds the oldest spooled record has been waiting for Supabase"""
+        if not self.size or self.oldest_spooled_at is None:
+            return 0.0
+        return max(0.0, time.time() - self.oldest_spooled_at)
+
+    async def _run_db(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        # FULL fsyncs the WAL on every commit - a committed append survives a power loss
+        db.execute("PRAGMA synchronous=FULL")
+        db.executescript(SCHEMA)
+        self._db = db
+        return db.execute("SELECT count(*), min(spooled_at) FROM spooled_messages").fetchone()
+
+    async def start(self):
+        """Open the spool and start committing and replaying on the running event loop"""
+        if self._tasks:
+            return
+        self.size, self.oldest_spooled_at = await self._run_db(self._open)
+        if self.size:
+            self.logger.info(f"Spool {self.path} has {self.size} messages to replay")
+        self._stopping.clear()
+        self._tasks = [asyncio.create_task(self._commit_loop()), asyncio.create_task(self._replay_loop())]
+
+    async def stop(self):
+        """Commit pending appends and stop; unreplayed records stay on disk for the next start"""
+        if not self._tasks:
+            return
+        self._stopping.set()
+        self._commit_wakeup.set()
+        self._replay_wakeup.set()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._run_db(self._db.close)
+        self._executor.shutdown(wait=False)
+
+    async def append(self, contact_info, contact_name, content, direction="incoming", timestamp=None,
+                     chat_id=None, telegram_message_id=None):
+        """Durably spool a message; returns once it has been committed to disk"""
+        if self._stopping.is_set() or not self._tasks:
+            raise RuntimeError(f"Spool for {self.bot_identifier} is not running")
+
+        row = (
+            chat_id,
+            telegram_message_id,
+            contact_info,
+            contact_name,
+            content,
+            direction,
+            timestamp or datetime.utcnow().isoformat(),
+            time.time()
+        )
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((row, future))
+        self._commit_wakeup.set()
+        await future
+
+    def _write(self, rows):
+        db = self._db
+        db.execute("BEGIN")
+        try:
+            before = db.total_changes
+            # Telegram may deliver an update twice - the local unique key drops the repeat
+            db.executemany(
+                f"INSERT OR IGNORE INTO spooled_messages ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                rows
+            )
+            inserted = db.total_changes - before
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return inserted
+
+    async def _commit_loop(self):
+        while True:
+            await self._commit_wakeup.wait()
+            self._commit_wakeup.clear()
+
+            # Give concurrent handlers a moment to join this commit
+            if len(self._pending) < self.fsync_batch and not self._stopping.is_set() and self.fsync_interval:
+                await asyncio.sleep(self.fsync_interval)
+
+            while self._pending:
+                batch, self._pending = self._pending[:self.fsync_batch], self._pending[self.fsync_batch:]
+                try:
+                    inserted = await self._run_db(self._write, [row for row, _ in batch])
+                except Exception as e:
+                    self.logger.error(f"Error writing {len(batch)} messages to spool {self.path}: {e}")
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+
+                self.commits += 1
+                self.appended += inserted
+                if self.size == 0:
+                    self.oldest_spooled_at = batch[0][0][-1]
+                self.size += inserted
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+                self._replay_wakeup.set()
+
+            if self._stopping.is_set():
+                return
+
+    def _read_batch(self, limit):
+        return self._db.execute(
+            f"SELECT seq, {', '.join(COLUMNS)} FROM spooled_messages ORDER BY seq LIMIT ?",
+            (limit,)
+        ).fetchall()
+
+    def _delete(self, last_seq):
+        self._db.execute("DELETE FROM spooled_messages WHERE seq <= ?", (last_seq,))
+
+    def _dead_letter(self, seq, error):
+        db = self._db
+        db.execute("BEGIN")
+        try:
+            db.execute(
+                f"INSERT INTO dead_letters (seq, {', '.join(COLUMNS)}, error) "
+                f"SELECT seq, {', '.join(COLUMNS)}, ? FROM spooled_messages WHERE seq = ?",
+                (error, seq)
+            )
+            db.execute("DELETE FROM spooled_messages WHERE seq = ?", (seq,))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    async def _wait_or_stop(self, seconds):
+        """Sleep for `seconds`; return True if the spool was stopped meanwhile"""
+        try:
+            await asyncio.wait_for(self._stopping.wait(), seconds)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _send(self, rows):
+        """One ingest_messages call for spooled rows; returns (response or None, error text)"""
+        try:
+            response = await get_supabase_client().rpc("ingest_messages", {
+                'p_messages': [
+                    {'bot_identifier': self.bot_identifier, **dict(zip(COLUMNS[:-1], row[1:-1]))}
+                    for row in rows
+                ]
+            }, headers=last_contact_headers())
+        except Exception as e:
+            return None, str(e) or type(e).__name__
+        return response, response.text
+
+    async def _stored(self, rows, response):
+        """Remove replayed rows from the spool and update the caches"""
+        await self._run_db(self._delete, rows[-1][0])
+        self.size = max(0, self.size - len(rows))
+        self.replayed += len(rows)
+        self._ingested.inc(len(rows))
+        for row in response.json():
+            contact_cache.set(row['contact_info'], row['contact_id'])
+        # ingest_messages recorded each contact's chat
+        for row in rows:
+            if row[1] is not None:
+                chat_registry.set(row[3], row[1])
+            touch_last_contact(row[3], row[7])
+
+    async def _replay(self, rows):
+        """
+        Replay rows (the oldest in the spool) in order
+
+        A batch Supabase rejects is split in halves until the rejected rows are
+        found, and only those are dead-lettered. Returns None once every row is
+        stored or dead-lettered, or (status, error) to retry after; rows handled
+        before that are already removed from the spool.
+        """
+        response, error = await self._send(rows)
+        if response is not None and response.status_code == 200:
+            await self._stored(rows, response)
+            return None
+        if response is None or is_retryable_status(response.status_code):
+            return (response.status_code if response is not None else None), error
+
+        if len(rows) == 1:
+            # Replaying this record can never succeed - park it so newer messages get through
+            await self._run_db(self._dead_letter, rows[0][0], error)
+            self.size = max(0, self.size - 1)
+            self.dead_lettered += 1
+            self._failed.inc()
+            self.logger.error(f"Moved spooled message {rows[0][0]} to dead_letters in {self.path}: {error}")
+            return None
+
+        middle = len(rows) // 2
+        return await self._replay(rows[:middle]) or await self._replay(rows[middle:])
+
+    async def _replay_loop(self):
+        backoff = 1
+        while not self._stopping.is_set():
+            self._replay_wakeup.clear()
+            try:
+                rows = await self._run_db(self._read_batch, self.replay_batch)
+                if not rows:
+                    self.oldest_spooled_at = None
+                    await self._replay_wakeup.wait()
+                    continue
+
+                self.oldest_spooled_at = rows[0][-1]
+                failure = await self._replay(rows)
+            except Exception as e:
+                # e.g. the spool database is locked or the disk is full; the rows stay spooled
+                self.logger.error(
+                    f"Error replaying spooled messages, {self.size} spooled, retrying in {backoff}s: {e!r}",
+                    extra={'bot': self.bot_identifier, 'spool_size': self.size, 'replay_lag': self.replay_lag()}
+                )
+                if await self._wait_or_stop(backoff):
+                    return
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            if failure is None:
+                self.logger.debug(
+                    f"Replayed {len(rows)} spooled messages ({self.size} left, lag {self.replay_lag():.1f}s)",
+                    extra={'bot': self.bot_identifier, 'count': len(rows), 'spool_size': self.size}
+                )
+                backoff = 1
+                continue
+
+            status, error = failure
+            if status in CONFIG_ERROR_STATUSES:
+                self.logger.error(
+                    f"Supabase refused the replay ({status}), check SUPABASE_KEY and that ingest_messages is deployed; "
+                    f"{self.size} messages spooled, retrying in {backoff}s: {error}",
+                    extra={'bot': self.bot_identifier, 'spool_size': self.size, 'replay_lag': self.replay_lag()}
+                )
+            else:
+                self.logger.warning(
+                    f"Supabase unavailable, {self.size} messages spooled, retrying in {backoff}s: {error}",
+                    extra={'bot': self.bot_identifier, 'spool_size': self.size, 'replay_lag': self.replay_lag()}
+                )
+            if await self._wait_or_stop(backoff):
+                return
+            backoff = min(backoff * 2, self.max_backoff)
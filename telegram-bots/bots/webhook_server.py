@@ -0,0 +1,123 @@
+import os
+import hmac
+import hashlib
+import secrets
+import logging
+from aiohttp import web
+from telegram import Update
+
+# Webhook settings
+TELEGRAM_WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL', '')  # Public base URL, e.g. https://bots.example.com
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_MAX_PENDING_UPDATES = int(os.getenv('WEBHOOK_MAX_PENDING_UPDATES', '1000'))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+
+logger = logging.getLogger(__name__)
+
+def is_webhook_enabled():
+    """Check whether webhook mode is configured in the environment"""
+    return bool(TELEGRAM_WEBHOOK_URL)
+
+def webhook_secret_token(secret, bot_identifier):
+    """
+    Derive the secret token Telegram sends with every update for one bot
+
+    Telegram only allows A-Z, a-z, 0-9, _ and - (up to 256 characters), so a hex HMAC is used.
+    """
+    return hmac.new(secret.encode(), bot_identifier.encode(), hashlib.sha256).hexdigest()
+
+def pending_updates(application):
+    """
+    Updates a bot accepted and hasn't handled yet
+
+    qsize() alone misses the updates python-telegram-bot already took off the queue
+    to handle concurrently; UpdateQueue (bots/bot_utils.py) counts those too.
+    """
+    return getattr(application.update_queue, 'in_flight', application.update_queue.qsize())
+
+class WebhookServer:
+    """
+    One local HTTP server receiving webhook updates for every bot in the process
+
+    Updates arrive on POST /telegram/<bot_identifier>, are checked against that
+    bot's secret token and put on the bot application's update_queue. When a bot
+    already has `max_pending` updates queued or being handled, the request is
+    answered with 503 so Telegram backs off and redelivers it later instead of
+    us buffering without bound.
+    """
+
+    def __init__(self, public_url=None, host=None, port=None, secret=None, max_pending=None):
+        self.public_url = (public_url or TELEGRAM_WEBHOOK_URL).rstrip('/')
+        self.host = host or WEBHOOK_LISTEN
+        self.port = port if port is not None else WEBHOOK_PORT
+        # Without a configured secret, use a random one - we register the webhook ourselves on start
+        self.secret = secret or WEBHOOK_SECRET or secrets.token_hex(32)
+        self.max_pending = max_pending or WEBHOOK_MAX_PENDING_UPDATES
+        self.applications = {}
+        self.rejected_updates = 0
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_post("/telegram/{bot_identifier}", self._handle_update)
+
+    def webhook_url(self, bot_identifier):
+        return f"{self.public_url}/telegram/{bot_identifier}"
+
+    def secret_token(self, bot_identifier):
+        return webhook_secret_token(self.secret, bot_identifier)
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Pick up the real port when started with port=0
+        self.port = site._server.sockets[0].getsockname()[1]
+        logger.info(f"Webhook server listening on http://{self.host}:{self.port}, public URL {self.public_url}")
+        return self
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def register(self, bot_identifier, application):
+        """Route updates for `bot_identifier` to `application` and point Telegram at us"""
+        self.applications[bot_identifier] = application
+        await application.bot.set_webhook(
+            url=self.webhook_url(bot_identifier),
+            secret_token=self.secret_token(bot_identifier),
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=Update.ALL_TYPES
+        )
+
+    def unregister(self, bot_identifier):
+        """Stop routing updates to a bot; Telegram keeps retrying them until it's registered again"""
+        self.applications.pop(bot_identifier, None)
+
+    async def _handle_update(self, request):
+        bot_identifier = request.match_info['bot_identifier']
+        application = self.applications.get(bot_identifier)
+
+        if application is None:
+            return web.Response(status=404)
+
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(token, self.secret_token(bot_identifier)):
+            logger.warning(f"Rejected webhook request for {bot_identifier} with a bad secret token")
+            return web.Response(status=403)
+
+        if pending_updates(application) >= self.max_pending:
+            self.rejected_updates += 1
+            return web.Response(status=503, headers={"Retry-After": "1"})
+
+        try:
+            update = Update.de_json(await request.json(), application.bot)
+        except Exception as e:
+            logger.warning(f"Invalid update for {bot_identifier}: {e}")
+            return web.Response(status=400)
+
+        await application.update_queue.put(update)
+        return web.Response(status=200)
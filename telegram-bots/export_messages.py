@@ -0,0 +1,291 @@
+"""
+Export messages from Supabase for offline analysis and backfills
+
+Walks the messages table in (timestamp, id) order with keyset pagination, so
+every page is an index range scan no matter how deep into the table it is, and
+streams the rows into compressed part files:
+
+    <out>/part-00000.jsonl.gz, <out>/part-00001.jsonl.gz, ...   (--format jsonl)
+    <out>/part-00000.parquet, ...                                 (--format parquet, needs pyarrow)
+
+Only one page and one open part file are held in memory at a time. After each
+finished part the position is saved to <out>/_checkpoint.json; running the same
+command again resumes after the last finished part.
+
+Examples:
+    python export_messages.py --out exports/all
+    python export_messages.py --out exports/bot1-jan --bot bot1 --since 2024-01-01 --until 2024-02-01
+    python export_messages.py --out exports/all --format parquet --part-rows 500000
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import asyncio
+import logging
+import argparse
+from datetime import datetime
+from dotenv import load_dotenv
+
+from bots.supabase_client import get_supabase_client, close_supabase_client
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Load environment variables
+load_dotenv()
+
+EXPORT_PAGE_SIZE = int(os.getenv('EXPORT_PAGE_SIZE', '1000'))
+EXPORT_PART_ROWS = int(os.getenv('EXPORT_PART_ROWS', '100000'))
+
+MESSAGE_COLUMNS = (
+    'id', 'contact_id', 'content', 'timestamp', 'direction', 'is_from_customer', 'is_ai_response',
+    'is_sent', 'bot_identifier', 'telegram_chat_id', 'telegram_message_id'
+)
+# The contact is embedded so rows can be filtered by its bot and carry its contact_info
+SELECT = ','.join(MESSAGE_COLUMNS) + ',contacts!inner(contact_info,bot_identifier)'
+
+CHECKPOINT_FILE = '_checkpoint.json'
+
+logger = logging.getLogger(__name__)
+
+def _quote(value):
+    """Quote a value inside a PostgREST or=(...) filter, where , . : ( ) are reserved"""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def _flatten(row):
+    """Move the embedded contact's columns onto the message row"""
+    contact = row.pop('contacts', None) or {}
+    row['contact_info'] = contact.get('contact_info')
+    # Outgoing messages from the dashboard don't record their bot; the contact always does
+    row['bot_identifier'] = row.get('bot_identifier') or contact.get('bot_identifier')
+    return row
+
+async def iter_messages(client=None, bot_identifier=None, since=None, until=None, after=None,
+                        page_size=EXPORT_PAGE_SIZE):
+    """
+    Yield messages in (timestamp, id) order, one page request at a time
+
+    since/until: ISO timestamps, since inclusive and until exclusive
+    after: (timestamp, id) of the last row already exported; rows up to it are skipped
+    The next page is requested while the caller is still processing the current one.
+    """
+    client = client or get_supabase_client()
+
+    async def fetch_page(after):
+        params = [('select', SELECT), ('order', 'timestamp.asc,id.asc'), ('limit', str(page_size))]
+        if bot_identifier:
+            params.append(('contacts.bot_identifier', f"eq.{bot_identifier}"))
+        if since:
+            params.append(('timestamp', f"gte.{since}"))
+        if until:
+            params.append(('timestamp', f"lt.{until}"))
+        if after:
+            timestamp, message_id = after
+            params.append((
+                'or',
+                f"(timestamp.gt.{_quote(timestamp)},"
+                f"and(timestamp.eq.{_quote(timestamp)},id.gt.{_quote(message_id)}))"
+            ))
+
+        response = await client.get("/messages", params=params)
+        if response.status_code != 200:
+            raise RuntimeError(f"Error fetching messages after {after}: {response.text}")
+        return response.json()
+
+    page = await fetch_page(after)
+    while page:
+        last = page[-1]
+        next_page = None
+        if len(page) == page_size:
+            next_page = asyncio.create_task(fetch_page((last['timestamp'], last['id'])))
+
+        try:
+            for row in page:
+                yield _flatten(row)
+        except BaseException:
+            if next_page:
+                next_page.cancel()
+            raise
+
+        page = await next_page if next_page else []
+
+class JsonlPartWriter:
+    """Gzip-compressed JSON lines, one message per line"""
+    extension = '.jsonl.gz'
+
+    def __init__(self, path):
+        self._file = gzip.open(path, 'wt', encoding='utf-8', compresslevel=6)
+
+    def write(self, rows):
+        self._file.writelines(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+
+    def close(self):
+        self._file.close()
+
+class ParquetPartWriter:
+    """Parquet with zstd compression, one row group per page"""
+    extension = '.parquet'
+
+    def __init__(self, path):
+        if pa is None:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+        self.schema = pa.schema([
+            ('id', pa.string()),
+            ('contact_id', pa.string()),
+            ('content', pa.string()),
+            ('timestamp', pa.timestamp('us', tz='UTC')),
+            ('direction', pa.string()),
+            ('is_from_customer', pa.bool_()),
+            ('is_ai_response', pa.bool_()),
+            ('is_sent', pa.bool_()),
+            ('bot_identifier', pa.string()),
+            ('telegram_chat_id', pa.int64()),
+            ('telegram_message_id', pa.int64()),
+            ('contact_info', pa.string())
+        ])
+        self._writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write(self, rows):
+        rows = [
+            {**row, 'timestamp': datetime.fromisoformat(row['timestamp'].replace('Z', '+00:00'))}
+            for row in rows
+        ]
+        self._writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        self._writer.close()
+
+WRITERS = {'jsonl': JsonlPartWriter, 'parquet': ParquetPartWriter}
+
+def load_checkpoint(out_dir, filters):
+    """Position saved by an earlier run of the same export, or None"""
+    path = os.path.join(out_dir, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint['filters'] != filters:
+        raise ValueError(
+            f"{path} belongs to an export with different filters ({checkpoint['filters']}); "
+            f"use another --out directory"
+        )
+    return checkpoint
+
+def save_checkpoint(out_dir, checkpoint):
+    """Write the checkpoint atomically, so a crash leaves either the old or the new one"""
+    path = os.path.join(out_dir, CHECKPOINT_FILE)
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{path}.tmp", path)
+
+async def export_messages(out_dir, fmt='jsonl', bot_identifier=None, since=None, until=None,
+                          page_size=EXPORT_PAGE_SIZE, part_rows=EXPORT_PART_ROWS, client=None):
+    """
+    Export messages into part files under out_dir, resuming from its checkpoint
+
+    Returns the checkpoint after the last part: rows exported in total, parts
+    written and the (timestamp, id) of the last exported row.
+    """
+    writer_class = WRITERS[fmt]
+    os.makedirs(out_dir, exist_ok=True)
+
+    filters = {'format': fmt, 'bot_identifier': bot_identifier, 'since': since, 'until': until}
+    checkpoint = load_checkpoint(out_dir, filters) or {'filters': filters, 'after': None, 'parts': 0, 'rows': 0}
+    if checkpoint['after']:
+        logger.info(f"Resuming export after {checkpoint['rows']} rows in {checkpoint['parts']} parts")
+
+    started = time.monotonic()
+    exported = 0
+    writer = None
+    part_path = None
+    part_count = 0
+    page = []
+
+    def open_part():
+        path = os.path.join(out_dir, f"part-{checkpoint['parts']:05d}{writer_class.extension}")
+        # Written under a temporary name, so a crash never leaves a part that looks complete
+        return writer_class(f"{path}.tmp"), path
+
+    def finish_part():
+        writer.close()
+        os.replace(f"{part_path}.tmp", part_path)
+        checkpoint['parts'] += 1
+        checkpoint['rows'] += part_count
+        save_checkpoint(out_dir, checkpoint)
+        logger.info(f"Wrote {part_path} ({part_count} rows, {checkpoint['rows']} in total)")
+
+    after = tuple(checkpoint['after']) if checkpoint['after'] else None
+    async for row in iter_messages(client, bot_identifier, since, until, after, page_size):
+        page.append(row)
+        if len(page) < page_size:
+            continue
+
+        if writer is None:
+            writer, part_path = open_part()
+        writer.write(page)
+        part_count += len(page)
+        exported += len(page)
+        checkpoint['after'] = [page[-1]['timestamp'], page[-1]['id']]
+        page = []
+
+        if part_count >= part_rows:
+            finish_part()
+            writer, part_count = None, 0
+
+    if page:
+        if writer is None:
+            writer, part_path = open_part()
+        writer.write(page)
+        part_count += len(page)
+        exported += len(page)
+        checkpoint['after'] = [page[-1]['timestamp'], page[-1]['id']]
+    if writer is not None:
+        finish_part()
+
+    elapsed = time.monotonic() - started
+    logger.info(
+        f"Exported {exported} messages in {elapsed:.1f}s ({exported / max(elapsed, 1e-9):.0f} rows/s) to {out_dir}"
+    )
+    return checkpoint
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export messages from Supabase to compressed part files")
+    parser.add_argument("--out", required=True, help="Directory for the part files and the checkpoint")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="jsonl")
+    parser.add_argument("--bot", help="Only export messages of this bot_identifier")
+    parser.add_argument("--since", help="Only export messages at or after this ISO timestamp")
+    parser.add_argument("--until", help="Only export messages before this ISO timestamp")
+    parser.add_argument("--page-size", type=int, default=EXPORT_PAGE_SIZE, help="Rows per request")
+    parser.add_argument("--part-rows", type=int, default=EXPORT_PART_ROWS, help="Rows per part file")
+    parser.add_argument("--log-level", default="INFO")
+    return parser.parse_args(argv)
+
+async def main(args):
+    try:
+        await export_messages(
+            args.out, args.format, args.bot, args.since, args.until,
+            page_size=args.page_size, part_rows=args.part_rows
+        )
+    finally:
+        await close_supabase_client()
+
+if __name__ == "__main__":
+    args = parse_args()
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=args.log_level.upper()
+    )
+    try:
+        asyncio.run(main(args))
+    except (RuntimeError, ValueError) as e:
+        logger.error(str(e))
+        sys.exit(1)
@@ -8,13 +8,17 @@ import logging
 import signal
 import fcntl
 import atexit
-from concurrent.futures import ProcessPoolExecutor
+import argparse
+import multiprocessing
+import time
+import httpx
+from aiohttp import web
+from telegram.request import HTTPXRequest
+
+from bots.log_format import configure_logging
 
 # Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+configure_logging()
 
 logger = logging.getLogger(__name__)
 
@@ -71,95 +75,562 @@ def release_lock():
 # Register the cleanup function to run when the program exits
 atexit.register(release_lock)
 
-# Handle signals
-def signal_handler(sig, frame):
-    logger.info(f"Received signal {sig}, shutting down...")
-    release_lock()
-    sys.exit(0)
-
-signal.signal(signal.SIGINT, signal_handler)
-signal.signal(signal.SIGTERM, signal_handler)
-
 # Add the current directory to sys.path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 if current_dir not in sys.path:
     sys.path.append(current_dir)
 
-from bots.bot_utils import create_bot_application, get_logger
+from bots.bot_utils import (
+    create_bot_application,
+    get_logger,
+    start_application,
+    stop_application,
+    SharedHTTPXRequest
+)
+from bots.supabase_client import close_supabase_client
+from bots.auto_reply import close_llm_client
+from bots.last_contact import close_last_contact_coalescer
+from bots.metrics import REGISTRY as metrics_registry, remove_bot_gauges
+from bots.webhook_server import WebhookServer, is_webhook_enabled
+from bots.registry import (
+    BOTS_CONFIG, BOTS_CONFIG_RELOAD_INTERVAL, BotConfig, load_registry, registry_mtime, shard_index
+)
 
 # Load environment variables
 load_dotenv()
 
-def run_bot_process(bot_file):
-    """Run a single bot in a separate process"""
-    try:
+# Connections in the Bot API pool shared by all bots in a process
+TELEGRAM_POOL_SIZE = int(os.getenv('TELEGRAM_POOL_SIZE', '64'))
+
+# Supervisor settings
+BOT_START_CONCURRENCY = int(os.getenv('BOT_START_CONCURRENCY', '20'))  # Bots being started at once
+HEALTH_HOST = os.getenv('HEALTH_HOST', '127.0.0.1')
+HEALTH_PORT = int(os.getenv('HEALTH_PORT', '8090'))  # 0 disables the health endpoint
+HEALTH_CHECK_INTERVAL = float(os.getenv('HEALTH_CHECK_INTERVAL', '10'))
+POLL_STALE_SECONDS = float(os.getenv('POLL_STALE_SECONDS', '120'))
+RESTART_BACKOFF_BASE = float(os.getenv('RESTART_BACKOFF_BASE', '2'))
+RESTART_BACKOFF_MAX = float(os.getenv('RESTART_BACKOFF_MAX', '300'))
+RESTART_STABLE_SECONDS = float(os.getenv('RESTART_STABLE_SECONDS', '300'))
+CIRCUIT_BREAKER_FAILURES = int(os.getenv('CIRCUIT_BREAKER_FAILURES', '5'))
+CIRCUIT_BREAKER_WINDOW = float(os.getenv('CIRCUIT_BREAKER_WINDOW', '600'))
+CIRCUIT_BREAKER_COOLDOWN = float(os.getenv('CIRCUIT_BREAKER_COOLDOWN', '900'))
+
+def discover_bots():
+    """
+    Find bot modules in bots/ and return (bot_identifier, token) pairs
+    
+    Only used when there is no bot registry file (see bots/registry.py).
+    """
+    # Get all bot modules
+    bot_files = [f for f in os.listdir(os.path.join(current_dir, "bots")) if f.endswith(".py") and f.startswith("bot")]
+    
+    # Filter out utility files
+    bot_files = sorted(f for f in bot_files if f not in ["bot_utils.py", "bot_template.py"])
+    
+    logger.info(f"Found {len(bot_files)} bots: {', '.join(bot_files)}")
+    
+    bots = []
+    for bot_file in bot_files:
         # Extract module name (without .py)
         module_name = bot_file.replace(".py", "")
         
-        # Skip utility files
-        if module_name in ["bot_utils", "bot_template"]:
+        try:
+            # Import the bot module
+            bot_module = importlib.import_module(f"bots.{module_name}")
+        except Exception as e:
+            logger.error(f"Error loading bot {bot_file}: {e}")
+            continue
+        
+        # Get the bot identifier and token
+        bot_identifier = getattr(bot_module, 'BOT_IDENTIFIER', module_name)
+        token = getattr(bot_module, 'TOKEN', None)
+        
+        if not token:
+            logger.warning(f"No bot token provided for {bot_identifier} ({bot_file}), skipping")
+            continue
+        
+        bots.append((bot_identifier, token))
+    
+    return bots
+
+_ssl_context = None
+
+def shared_ssl_context():
+    """One SSL context for every bot's polling client; loading the CA bundle takes tens of ms"""
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = httpx.create_ssl_context()
+    return _ssl_context
+
+class PollTrackingRequest(HTTPXRequest):
+    """HTTPXRequest for getUpdates that remembers when the last poll completed"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.last_poll_at = None
+    
+    def _build_client(self):
+        return httpx.AsyncClient(verify=shared_ssl_context(), **self._client_kwargs)
+    
+    async def do_request(self, url, method, *args, **kwargs):
+        result = await super().do_request(url, method, *args, **kwargs)
+        if url.endswith("/getUpdates"):
+            self.last_poll_at = time.time()
+        return result
+
+def select_shard(bots, shard=None):
+    """The bots in shard (index, count), or all of them when shard is None"""
+    if shard is None:
+        return list(bots)
+    index, count = shard
+    return [bot for bot in bots if shard_index(bot[0], count) == index]
+
+class SupervisedBot:
+    """State and health of one bot run by the supervisor"""
+    
+    def __init__(self, config):
+        self.config = config
+        self.bot_identifier = config.bot_identifier
+        self.token = config.token
+        self.logger = get_logger(config.bot_identifier)
+        self.stop_event = asyncio.Event()
+        self.state = "starting"
+        self.application = None
+        self.poll_request = None
+        self.started_at = None
+        self.restarts = 0
+        self.consecutive_failures = 0
+        self.recent_failures = []
+        self.last_error = None
+    
+    @property
+    def uptime(self):
+        return time.time() - self.started_at if self.state == "running" and self.started_at else 0.0
+    
+    @property
+    def last_poll_at(self):
+        return self.poll_request.last_poll_at if self.poll_request else None
+    
+    def health_problem(self, webhook=False):
+        """Return why a running bot looks unhealthy, or None"""
+        application = self.application
+        if not application.running:
+            return "application stopped"
+        if webhook:
+            # Updates are pushed to us, there is no polling to watch
+            return None
+        if not application.updater.running:
+            return "polling stopped"
+        last_poll_at = self.last_poll_at or self.started_at
+        if time.time() - last_poll_at > POLL_STALE_SECONDS:
+            return f"no successful poll for {time.time() - last_poll_at:.0f}s"
+        return None
+    
+    def status(self):
+        bot_data = self.application.bot_data if self.application else {}
+        return {
+            'state': self.state,
+            'uptime_seconds': round(self.uptime, 1),
+            'restarts': self.restarts,
+            'last_poll_at': self.last_poll_at,
+            'last_update_at': bot_data.get('last_update_at'),
+            'last_outgoing_check_at': bot_data.get('last_outgoing_check_at'),
+            'last_error': self.last_error
+        }
+
+class BotSupervisor:
+    """
+    Runs bots as tasks on one event loop and keeps them alive
+    
+    A bot that fails to start, crashes or stops polling is stopped and restarted
+    with exponential backoff. If a bot keeps failing (CIRCUIT_BREAKER_FAILURES
+    failures within CIRCUIT_BREAKER_WINDOW seconds) its circuit opens and it is
+    left alone for CIRCUIT_BREAKER_COOLDOWN seconds before one more attempt.
+    One bot failing never affects the others.
+    
+    `bots` are BotConfig entries or (bot_identifier, token) pairs. apply() adds,
+    removes and restarts bots while the others keep running. Each bot's
+    application is only built once one of BOT_START_CONCURRENCY start slots is
+    free, so hundreds of bots come up in waves instead of all at once.
+    """
+    
+    def __init__(self, bots, webhook_server=None):
+        self.webhook_server = webhook_server
+        self.request = SharedHTTPXRequest(connection_pool_size=TELEGRAM_POOL_SIZE)
+        self.bots = {}
+        self.tasks = {}
+        for bot in bots:
+            config = BotConfig(*bot)
+            self.bots[config.bot_identifier] = SupervisedBot(config)
+        self.stop_event = asyncio.Event()
+        self.start_slots = asyncio.Semaphore(BOT_START_CONCURRENCY)
+    
+    async def run(self):
+        """Supervise all bots until stop() is called, then shut them down"""
+        for bot in self.bots.values():
+            self._start_bot(bot)
+        await self.stop_event.wait()
+        logger.info("Shutting down bots...")
+        for bot in self.bots.values():
+            bot.stop_event.set()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+    
+    def stop(self):
+        self.stop_event.set()
+    
+    def _start_bot(self, bot):
+        self.bots[bot.bot_identifier] = bot
+        self.tasks[bot.bot_identifier] = asyncio.create_task(self._supervise(bot))
+    
+    async def remove_bot(self, bot_identifier):
+        """Stop one bot and forget it, including its metrics"""
+        bot = self.bots.pop(bot_identifier, None)
+        task = self.tasks.pop(bot_identifier, None)
+        if bot is not None:
+            bot.stop_event.set()
+        if task is not None:
+            await asyncio.gather(task, return_exceptions=True)
+        # A restarted bot registers them again when it starts
+        remove_bot_gauges(bot_identifier)
+    
+    async def apply(self, bots):
+        """
+        Bring the supervised bots in line with `bots`
+        
+        New bots are started, missing ones stopped and bots whose token or options
+        changed restarted; unchanged bots keep running untouched.
+        """
+        if self.stop_event.is_set():
+            return
+        wanted = {}
+        for bot in bots:
+            config = BotConfig(*bot)
+            wanted[config.bot_identifier] = config
+        
+        removed = [bot_identifier for bot_identifier in self.bots if bot_identifier not in wanted]
+        changed = [bot_identifier for bot_identifier, config in wanted.items()
+                   if bot_identifier in self.bots and self.bots[bot_identifier].config != config]
+        added = [bot_identifier for bot_identifier in wanted if bot_identifier not in self.bots]
+        if not (removed or changed or added):
+            return
+        logger.info(f"Bot registry changed: {len(added)} added, {len(removed)} removed, {len(changed)} restarted")
+        
+        # A restarted bot must be fully stopped before its replacement registers its webhook
+        await asyncio.gather(*(self.remove_bot(bot_identifier) for bot_identifier in removed + changed))
+        if self.stop_event.is_set():
             return
+        for bot_identifier in changed + added:
+            self._start_bot(SupervisedBot(wanted[bot_identifier]))
+    
+    async def _wait_or_stop(self, bot, seconds):
+        """Sleep for `seconds`; return True if the bot was stopped meanwhile"""
+        try:
+            await asyncio.wait_for(bot.stop_event.wait(), seconds)
+            return True
+        except asyncio.TimeoutError:
+            return False
+    
+    async def _supervise(self, bot):
+        while not bot.stop_event.is_set():
+            problem = await self._run_once(bot)
+            if bot.stop_event.is_set():
+                break
+            
+            # The bot failed - decide how long to wait before restarting it
+            now = time.time()
+            bot.last_error = problem
+            bot.consecutive_failures += 1
+            bot.recent_failures = [t for t in bot.recent_failures if now - t < CIRCUIT_BREAKER_WINDOW] + [now]
+            
+            if len(bot.recent_failures) >= CIRCUIT_BREAKER_FAILURES:
+                bot.state = "circuit_open"
+                bot.recent_failures = []
+                delay = CIRCUIT_BREAKER_COOLDOWN
+                bot.logger.error(f"{bot.bot_identifier} keeps failing ({problem}), pausing restarts for {delay}s")
+            else:
+                bot.state = "backoff"
+                delay = min(RESTART_BACKOFF_BASE * 2 ** (bot.consecutive_failures - 1), RESTART_BACKOFF_MAX)
+                bot.logger.warning(f"{bot.bot_identifier} failed ({problem}), restarting in {delay:.1f}s")
             
-        # Import the bot module
-        bot_module = importlib.import_module(f"bots.{module_name}")
+            if await self._wait_or_stop(bot, delay):
+                break
+            bot.restarts += 1
         
-        # Get the bot identifier
-        bot_identifier = getattr(bot_module, 'BOT_IDENTIFIER', module_name)
+        bot.state = "stopped"
+    
+    async def _run_once(self, bot):
+        """Start the bot and watch it until it becomes unhealthy or the supervisor stops; return the problem"""
+        bot.state = "starting"
+        async with self.start_slots:
+            if bot.stop_event.is_set():
+                return None
+            bot.poll_request = PollTrackingRequest()
+            bot.application = create_bot_application(
+                bot.token, bot.bot_identifier, bot.logger,
+                request=self.request, get_updates_request=bot.poll_request,
+                update_concurrency=bot.config.update_concurrency
+            )
+            
+            if bot.application is None:
+                return "could not create application"
+            
+            try:
+                await start_application(bot.application, bot.bot_identifier, bot.logger, self.webhook_server)
+            except Exception as e:
+                bot.logger.error(f"Error starting bot {bot.bot_identifier}: {e}")
+                await stop_application(bot.application, bot.bot_identifier, bot.logger, self.webhook_server)
+                return f"start failed: {e}"
         
-        # Configure logging for this bot
-        bot_logger = logging.getLogger(bot_identifier)
+        try:
+            bot.state = "running"
+            bot.started_at = time.time()
+            
+            while not await self._wait_or_stop(bot, HEALTH_CHECK_INTERVAL):
+                # A bot that stayed up for a while is considered recovered
+                if bot.uptime > RESTART_STABLE_SECONDS:
+                    bot.consecutive_failures = 0
+                
+                problem = bot.health_problem(webhook=self.webhook_server is not None)
+                if problem:
+                    bot.logger.error(f"{bot.bot_identifier} is unhealthy: {problem}")
+                    return problem
+            return None
+        finally:
+            await stop_application(bot.application, bot.bot_identifier, bot.logger, self.webhook_server)
+    
+    def status(self):
+        return {bot_identifier: bot.status() for bot_identifier, bot in self.bots.items()}
+    
+    def render_metrics(self):
+        """Render per-bot health as Prometheus text"""
+        now = time.time()
+        lines = [
+            "# TYPE bladex_bot_up gauge",
+            "# TYPE bladex_bot_uptime_seconds gauge",
+            "# TYPE bladex_bot_restarts_total counter",
+            "# TYPE bladex_bot_last_poll_age_seconds gauge"
+        ]
+        for bot_identifier, bot in self.bots.items():
+            label = f'{{bot="{bot_identifier}"}}'
+            lines.append(f"bladex_bot_up{label} {1 if bot.state == 'running' else 0}")
+            lines.append(f"bladex_bot_uptime_seconds{label} {bot.uptime:.1f}")
+            lines.append(f"bladex_bot_restarts_total{label} {bot.restarts}")
+            if bot.last_poll_at:
+                lines.append(f"bladex_bot_last_poll_age_seconds{label} {now - bot.last_poll_at:.1f}")
+        return "\n".join(lines) + "\n"
+
+async def start_health_server(supervisor, port):
+    """
+    Serve /health (JSON, 503 if any bot isn't running) and /metrics (Prometheus text) on localhost
+    """
+    async def health(request):
+        status = supervisor.status()
+        healthy = all(bot['state'] == 'running' for bot in status.values())
+        return web.json_response({'healthy': healthy, 'bots': status}, status=200 if healthy else 503)
+    
+    async def metrics(request):
+        # Supervisor health plus the bots' own counters and histograms
+        text = supervisor.render_metrics() + metrics_registry.render()
+        return web.Response(text=text, content_type="text/plain")
+    
+    app = web.Application()
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics)
+    
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, HEALTH_HOST, port).start()
+    logger.info(f"Health endpoint listening on http://{HEALTH_HOST}:{port}/health")
+    return runner
+
+async def watch_registry(supervisor, path, shard=None, interval=BOTS_CONFIG_RELOAD_INTERVAL):
+    """
+    Apply the bot registry at `path` to the supervisor whenever it changes
+    
+    The file's modification time is checked every `interval` seconds (never if 0)
+    and SIGHUP forces a reload. A registry that can't be read or is invalid is
+    logged and the running bots are left as they are.
+    """
+    reload_requested = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_requested.set)
+    mtime = registry_mtime(path)
+    
+    while not supervisor.stop_event.is_set():
+        try:
+            await asyncio.wait_for(reload_requested.wait(), interval if interval > 0 else None)
+        except asyncio.TimeoutError:
+            pass
         
-        # Run the bot using its main function
-        if hasattr(bot_module, 'main'):
-            bot_module.main()
-        else:
-            logger.warning(f"Bot module {module_name} has no main function")
+        current = registry_mtime(path)
+        if current == mtime and not reload_requested.is_set():
+            continue
+        reload_requested.clear()
+        mtime = current
         
-    except Exception as e:
-        logger.error(f"Error running bot {bot_file}: {e}")
+        if current is None:
+            logger.warning(f"Bot registry {path} is missing, keeping the running bots")
+            continue
+        try:
+            bots = select_shard(load_registry(path), shard)
+        except (OSError, ValueError) as e:
+            logger.error(f"Not reloading the bot registry: {e}")
+            continue
+        await supervisor.apply(bots)
+
+async def run_bots(bots, health_port=None, webhook=False, registry_path=None, shard=None):
+    """
+    Run the given bots under a supervisor on the current event loop until SIGINT/SIGTERM
+    
+    All bots share one Bot API connection pool and one Supabase client. With
+    webhook=True they also share one local webhook server instead of polling.
+    With a registry_path, changes to the registry are applied while running,
+    limited to the bots in `shard` (index, count) when given.
+    """
+    webhook_server = WebhookServer() if webhook else None
+    supervisor = BotSupervisor(bots, webhook_server)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, supervisor.stop)
+    
+    health_runner = None
+    watcher = None
+    try:
+        if webhook_server:
+            await webhook_server.start()
+        if health_port:
+            health_runner = await start_health_server(supervisor, health_port)
+        if registry_path:
+            watcher = asyncio.create_task(watch_registry(supervisor, registry_path, shard))
+        
+        logger.info(f"Supervising {len(bots)} bots in process {os.getpid()}")
+        await supervisor.run()
+    finally:
+        if watcher:
+            watcher.cancel()
+            await asyncio.gather(watcher, return_exceptions=True)
+        if health_runner:
+            await health_runner.cleanup()
+        if webhook_server:
+            await webhook_server.stop()
+        await close_last_contact_coalescer()
+        await close_supabase_client()
+        await close_llm_client()
+
+def run_shard(bots, health_port=None, registry_path=None, shard=None):
+    """Entry point for a worker process running a shard of the bots"""
+    asyncio.run(run_bots(bots, health_port, registry_path=registry_path, shard=shard))
+
+def shard_bots(bots, processes):
+    """Split bots into `processes` shards by a hash of their identifier, so a bot keeps its shard"""
+    return [select_shard(bots, (index, processes)) for index in range(processes)]
+
+def load_bots(registry_path=None):
+    """Bots from the registry file when given, otherwise from the bot modules in bots/"""
+    if not registry_path:
+        return discover_bots()
+    bots = load_registry(registry_path)
+    logger.info(f"Loaded {len(bots)} bots from {registry_path}")
+    return bots
 
-async def run_all_bots():
-    """Run all bots concurrently"""
+def run_all_bots(processes=1, mode="polling", config=BOTS_CONFIG):
+    """Run all bots, in this process or sharded across worker processes"""
+    if mode == "webhook" and processes > 1:
+        logger.error("Webhook mode runs all bots behind one server; it can't be combined with --processes")
+        return
+    
     # Check if we can acquire the lock
     if not acquire_lock():
         logger.error("Failed to acquire lock. Exiting to prevent multiple instances.")
         return
         
     try:
-        # Get all bot modules
-        bot_files = [f for f in os.listdir("bots") if f.endswith(".py") and f.startswith("bot")]
+        registry_path = config if os.path.exists(config) else None
+        try:
+            bots = load_bots(registry_path)
+        except ValueError as e:
+            logger.error(str(e))
+            return
         
-        # Filter out utility files
-        bot_files = [f for f in bot_files if f not in ["bot_utils.py", "bot_template.py"]]
+        if not bots:
+            if not registry_path:
+                logger.error("No bots to run")
+                return
+            logger.warning(f"No bots in {registry_path} yet, waiting for it to change")
         
-        logger.info(f"Found {len(bot_files)} bots: {', '.join(bot_files)}")
+        if processes <= 1:
+            asyncio.run(run_bots(bots, HEALTH_PORT, webhook=mode == "webhook", registry_path=registry_path))
+            return
         
-        # Create tasks for each bot
-        tasks = []
-        for bot_file in bot_files:
-            # Create a task for this bot
-            task = asyncio.create_task(asyncio.to_thread(run_bot_process, bot_file))
-            tasks.append(task)
-            
-            logger.info(f"Started bot: {bot_file}")
+        # Shard bots across worker processes for multi-core hosts
+        workers = []
+        for index, shard in enumerate(shard_bots(bots, processes)):
+            # Without a registry to reload, a worker without bots would have nothing to do
+            if not shard and not registry_path:
+                continue
+            # Each worker serves its own health endpoint on HEALTH_PORT + shard index
+            health_port = HEALTH_PORT + index if HEALTH_PORT else None
+            worker = multiprocessing.Process(
+                target=run_shard, args=(shard, health_port, registry_path, (index, processes))
+            )
+            worker.start()
+            workers.append(worker)
+            logger.info(f"Started worker {worker.pid} with bots: {', '.join(bot[0] for bot in shard)}")
         
-        # Wait for all tasks to complete
-        await asyncio.gather(*tasks)
+        def forward_signal(sig, frame):
+            logger.info(f"Received signal {sig}, stopping workers...")
+            for worker in workers:
+                if worker.is_alive():
+                    os.kill(worker.pid, signal.SIGTERM)
         
+        def forward_reload(sig, frame):
+            for worker in workers:
+                if worker.is_alive():
+                    os.kill(worker.pid, signal.SIGHUP)
+        
+        signal.signal(signal.SIGINT, forward_signal)
+        signal.signal(signal.SIGTERM, forward_signal)
+        if registry_path:
+            signal.signal(signal.SIGHUP, forward_reload)
+        
+        for worker in workers:
+            worker.join()
+    
     except Exception as e:
         logger.error(f"Error in run_all_bots: {e}")
     finally:
         # Make sure to release the lock when done
         release_lock()
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run all Telegram bots")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=int(os.getenv('BOT_PROCESSES', '1')),
+        help="Number of worker processes to shard the bots across (default: 1, all bots on one event loop)"
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["polling", "webhook"],
+        default="webhook" if is_webhook_enabled() else "polling",
+        help="How to receive updates (default: webhook if TELEGRAM_WEBHOOK_URL is set, otherwise polling)"
+    )
+    parser.add_argument(
+        "--config",
+        default=BOTS_CONFIG,
+        help="Bot registry file (default: BOTS_CONFIG or bots.toml); without it the bots/botN.py modules are run"
+    )
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
     try:
         # Run the main function
-        asyncio.run(run_all_bots())
+        run_all_bots(args.processes, args.mode, args.config)
     except KeyboardInterrupt:
         logger.info("Keyboard interrupt received, shutting down...")
     except Exception as e:
         logger.error(f"Unhandled exception: {e}")
     finally:
         # Make sure to release the lock when done
-        release_lock()
\ No newline at end of file
+        release_lock()
@@ -0,0 +1,116 @@
+"""
+Local fake of the Anthropic Messages API
+
+Serves POST /v1/messages and answers with a canned reply derived from the last
+user message, after a fixed latency plus optional jitter, like a model would.
+Every request is recorded in `requests` so tests can check how many LLM calls
+the auto-reply cache and request coalescing saved.
+
+Point the bots at it with LLM_API_URL=http://127.0.0.1:<port>
+
+Run standalone:
+    python -m stubs.fake_llm --port 8083 --latency-ms 800 --jitter-ms 400
+"""
+import time
+import random
+import asyncio
+import argparse
+import logging
+import itertools
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+class FakeLLMServer:
+    """In-process fake Messages API server"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_every=0, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        # Answer every Nth request with a 529 overloaded error (0 disables)
+        self.error_every = error_every
+        self.requests = []    # dicts with model, messages, received_at
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._ids = itertools.count(1)
+        self._random = random.Random(seed)
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_post("/v1/messages", self._handle_messages)
+
+    @property
+    def url(self):
+        """Base URL to use as LLM_API_URL"""
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Pick up the real port when started with port=0
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def _handle_messages(self, request):
+        body = await request.json()
+        messages = body.get("messages") or []
+        self.requests.append({
+            "model": body.get("model"),
+            "messages": messages,
+            "received_at": time.monotonic()
+        })
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+            if delay:
+                await asyncio.sleep(delay)
+        finally:
+            self.in_flight -= 1
+
+        if self.error_every and len(self.requests) % self.error_every == 0:
+            return web.json_response({
+                "type": "error",
+                "error": {"type": "overloaded_error", "message": "Overloaded"}
+            }, status=529)
+
+        question = messages[-1]["content"] if messages and messages[-1].get("role") == "user" else ""
+        if isinstance(question, list):
+            question = " ".join(block.get("text", "") for block in question)
+        reply = f"Thanks for your message! About \"{question[:80]}\": a member of our team can help with that."
+
+        return web.json_response({
+            "id": f"msg_fake_{next(self._ids)}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model"),
+            "content": [{"type": "text", "text": reply}],
+            "stop_reason": "end_turn",
+            "usage": {"input_tokens": sum(len(str(m.get("content", ""))) // 4 for m in messages),
+                      "output_tokens": len(reply) // 4}
+        })
+
+async def main(host, port, latency, jitter):
+    server = await FakeLLMServer(host, port, latency, jitter).start()
+    logger.info(f"Fake Messages API listening on {server.url}")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Anthropic Messages API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8083)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(args.host, args.port, args.latency_ms / 1000, args.jitter_ms / 1000))
@@ -0,0 +1,587 @@
+"""
+Local fake of the Supabase REST (PostgREST) API
+
+Keeps contacts and messages in memory and implements the requests the bots
+make: the ingest_message / ingest_messages / claim_outgoing_messages /
+touch_contacts RPCs, the broadcast RPCs, POST/GET/PATCH on /messages and GET on
+/contacts and /broadcasts. Like update_contact_last_contact_trigger, every request
+inserting messages updates each of their contacts' last_contact once, unless it
+was sent with X-Last-Contact: deferred; `contact_writes` counts those updates.
+last_contact_trigger="row" emulates the original FOR EACH ROW trigger instead,
+which wrote the contact once per message. GET supports the eq., in.,
+is., gt(e). and lt(e). filters, or=(...)/and(...), multi-column ordering and
+embedding the contact in a message with select=...,contacts!inner(...).
+A fixed latency plus optional jitter is added to every request, and requests
+are counted per endpoint so callers can work out HTTP calls per message.
+
+Run standalone:
+    python -m stubs.fake_postgrest --port 54321 --latency-ms 10
+and point the bots at it with SUPABASE_URL=http://127.0.0.1:54321
+"""
+import time
+import uuid
+import heapq
+import contextlib
+import random
+import asyncio
+import argparse
+import logging
+from collections import defaultdict
+from datetime import datetime
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+def _parse_time(value):
+    """ISO timestamp (as sent by the bots) to epoch seconds"""
+    if value is None:
+        return None
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+RESERVED_PARAMS = ('select', 'order', 'limit', 'offset', 'on_conflict', 'columns')
+
+def _split_top_level(text):
+    """Split "a,b(c,d),\"e,f\"" on the commas that are not inside parentheses or quotes"""
+    parts, depth, quoted, current = [], 0, False, ''
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == '(':
+            depth += 1
+        elif not quoted and char == ')':
+            depth -= 1
+        elif not quoted and depth == 0 and char == ',':
+            parts.append(current)
+            current = ''
+            continue
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+def _column_value(row, column):
+    """Row value for a column, following embedded resources like contacts.bot_identifier"""
+    for part in column.split('.'):
+        row = row.get(part) if isinstance(row, dict) else None
+    return row
+
+def _compile_condition(column, condition):
+    """Compile one PostgREST filter into a predicate on a row"""
+    if column in ('or', 'and'):
+        predicates = [_compile_expression(part) for part in _split_top_level(condition[1:-1])]
+        combine = any if column == 'or' else all
+        return lambda row: combine(predicate(row) for predicate in predicates)
+
+    operator, _, value = condition.partition('.')
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        value = value[1:-1]
+
+    def compare(test):
+        def predicate(row):
+            current = _column_value(row, column)
+            return current is not None and test(str(current))
+        return predicate
+
+    if operator == 'eq':
+        return compare(lambda current: current == value)
+    if operator == 'in':
+        values = {item.strip('"') for item in _split_top_level(value.strip('()'))}
+        return compare(lambda current: current in values)
+    if operator == 'gt':
+        return compare(lambda current: current > value)
+    if operator == 'gte':
+        return compare(lambda current: current >= value)
+    if operator == 'lt':
+        return compare(lambda current: current < value)
+    if operator == 'lte':
+        return compare(lambda current: current <= value)
+    if operator == 'is' and value == 'null':
+        return lambda row: _column_value(row, column) is None
+    raise ValueError(f"Unsupported filter {column}={condition}")
+
+def _compile_expression(expression):
+    """Compile an item of an or=(...) list: column.operator.value, and(...) or or(...)"""
+    for combinator in ('and', 'or'):
+        if expression.startswith(f"{combinator}("):
+            return _compile_condition(combinator, expression[len(combinator):])
+    column, _, condition = expression.partition('.')
+    return _compile_condition(column, condition)
+
+def _compile_filters(params):
+    """Predicate applying every filter in the query string (a list of key/value pairs)"""
+    predicates = [
+        _compile_condition(column, condition)
+        for column, condition in params if column not in RESERVED_PARAMS
+    ]
+    return lambda row: all(predicate(row) for predicate in predicates)
+
+def _matches(row, params):
+    """Apply PostgREST filters from the query string"""
+    return _compile_filters(params.items() if isinstance(params, dict) else params)(row)
+
+def _sort_key(order):
+    """Key function and direction for order=col1.asc,col2.asc (one direction for all columns)"""
+    columns = [item.partition('.') for item in order.split(',')]
+    reverse = columns[0][2] == 'desc'
+    return (lambda row: tuple(str(row[column]) for column, _, _ in columns)), reverse
+
+class FakePostgrestServer:
+    """In-process fake PostgREST server"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, seed=None, last_contact_trigger="statement"):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.last_contact_trigger = last_contact_trigger
+        # Set to an HTTP status (e.g. 503) to fail every request, simulating an outage
+        self.fail_status = None
+        # Called with every messages row inserted, e.g. to publish it to a fake Realtime server
+        self.on_insert = None
+        self.requests = defaultdict(int)  # "METHOD /path" -> count
+        self.contacts = {}                # id -> row
+        self.contacts_by_info = {}        # contact_info -> id
+        self.messages = {}                # id -> row (plus inserted_at, monotonic)
+        self.telegram_keys = {}           # (bot_identifier, telegram_chat_id, telegram_message_id) -> message id
+        self.broadcasts = {}              # id -> row
+        self.broadcast_recipients = {}    # (broadcast_id, contact_id) -> row
+        self.contact_writes = 0           # contact rows updated for last_contact
+        self._statement = None            # messages inserted by the request being handled
+        self._random = random.Random(seed)
+        self._lock = asyncio.Lock()
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_post("/rest/v1/rpc/{function}", self._handle_rpc)
+        self.app.router.add_route("*", "/rest/v1/{table}", self._handle_table)
+
+    @property
+    def url(self):
+        """Base URL to use as SUPABASE_URL"""
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def total_requests(self):
+        return sum(self.requests.values())
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Pick up the real port when started with port=0
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    # Data helpers, also used directly by load tests
+
+    def upsert_contact(self, contact_info, name=None, chat_id=None):
+        """Return (contact_id, created) for contact_info, creating the contact if needed"""
+        contact_id = self.contacts_by_info.get(contact_info)
+        if contact_id:
+            if chat_id is not None:
+                self.contacts[contact_id]['chat_id'] = chat_id
+            return contact_id, False
+
+        contact_id = str(uuid.uuid4())
+        self.contacts[contact_id] = {
+            'id': contact_id,
+            'name': name or contact_info,
+            'contact_info': contact_info,
+            'bot_identifier': contact_info.split(':')[1] if ':' in contact_info else None,
+            'chat_id': chat_id,
+            'last_contact': datetime.utcnow().isoformat()
+        }
+        self.contacts_by_info[contact_info] = contact_id
+        return contact_id, True
+
+    def insert_message(self, row):
+        """Insert a messages row; returns the stored row"""
+        bot_identifier = row.get('bot_identifier')
+        if bot_identifier is None and row.get('direction') == 'outgoing':
+            # set_outgoing_bot_identifier_trigger
+            bot_identifier = self.contacts.get(row['contact_id'], {}).get('bot_identifier')
+        message = {
+            'id': str(uuid.uuid4()),
+            'content': row['content'],
+            'contact_id': row['contact_id'],
+            'timestamp': row.get('timestamp') or datetime.utcnow().isoformat(),
+            'direction': row.get('direction', 'incoming'),
+            'is_from_customer': row.get('is_from_customer', row.get('direction', 'incoming') == 'incoming'),
+            'is_ai_response': row.get('is_ai_response', False),
+            'is_sent': row.get('is_sent', row.get('direction', 'incoming') == 'incoming'),
+            'claimed_by': None,
+            'lease_expires_at': None,
+            'delivery_attempts': 0,
+            'delivery_error': None,
+            'bot_identifier': bot_identifier,
+            'telegram_chat_id': row.get('telegram_chat_id'),
+            'telegram_message_id': row.get('telegram_message_id'),
+            'inserted_at': time.monotonic()
+        }
+        self.messages[message['id']] = message
+        key = self._telegram_key(message)
+        if key:
+            self.telegram_keys[key] = message['id']
+        if self.last_contact_trigger == 'row':
+            self._touch_contact(message['contact_id'], message['timestamp'], force=True)
+        elif self._statement is not None:
+            self._statement.append(message)
+        else:
+            self.update_last_contact([message])
+        if self.on_insert:
+            self.on_insert(message)
+        return message
+
+    def update_last_contact(self, messages):
+        """update_contact_last_contact_trigger: each contact once, to its newest message"""
+        latest = {}
+        for message in messages:
+            current = latest.get(message['contact_id'])
+            if current is None or _parse_time(message['timestamp']) > _parse_time(current):
+                latest[message['contact_id']] = message['timestamp']
+        return sum(1 for contact_id, timestamp in latest.items() if self._touch_contact(contact_id, timestamp))
+
+    def _touch_contact(self, contact_id, timestamp, force=False):
+        """Move the contact's last_contact forward to timestamp (any timestamp with force); True if written"""
+        contact = self.contacts.get(contact_id)
+        if contact is None or (not force and _parse_time(contact['last_contact']) >= _parse_time(timestamp)):
+            return False
+        contact['last_contact'] = timestamp
+        self.contact_writes += 1
+        return True
+
+    @contextlib.contextmanager
+    def _insert_statement(self, request):
+        """Collect the messages a request inserts, then run the last_contact trigger once for them"""
+        self._statement = []
+        try:
+            yield
+        finally:
+            statement, self._statement = self._statement, None
+            if request.headers.get('X-Last-Contact') != 'deferred':
+                self.update_last_contact(statement)
+
+    def _telegram_key(self, row):
+        """
+        messages_telegram_message_key together with skip_redelivered_message_trigger, which
+        also skips a message Telegram delivered again with a later timestamp; like Postgres,
+        rows with a NULL column never conflict
+        """
+        key = (row.get('bot_identifier'), row.get('telegram_chat_id'), row.get('telegram_message_id'))
+        return key if None not in key else None
+
+    def existing_message_id(self, row):
+        """Id of the message already stored under row's Telegram key, if any"""
+        key = self._telegram_key(row)
+        return self.telegram_keys.get(key) if key else None
+
+    def add_outgoing(self, contact_info, content, name=None):
+        """Queue an outgoing message the way the dashboard does; returns the stored row"""
+        contact_id, _ = self.upsert_contact(contact_info, name)
+        return self.insert_message({
+            'contact_id': contact_id,
+            'content': content,
+            'direction': 'outgoing',
+            'is_from_customer': False,
+            'is_sent': False
+        })
+
+    def create_broadcast(self, content, contact_ids):
+        """Create a broadcast the way the dashboard does; returns the broadcast row"""
+        broadcast_id = str(uuid.uuid4())
+        recipients = [contact_id for contact_id in dict.fromkeys(contact_ids) if contact_id in self.contacts]
+        # Contacts without a bot can't be claimed, so they fail right away
+        unreachable = [contact_id for contact_id in recipients if self.contacts[contact_id]['bot_identifier'] is None]
+        self.broadcasts[broadcast_id] = {
+            'id': broadcast_id,
+            'content': content,
+            'status': 'sending' if len(unreachable) < len(recipients) else 'completed',
+            'total_recipients': len(recipients),
+            'sent_count': 0,
+            'failed_count': len(unreachable),
+            'created_at': datetime.utcnow().isoformat()
+        }
+        for contact_id in recipients:
+            bot_identifier = self.contacts[contact_id]['bot_identifier']
+            self.broadcast_recipients[(broadcast_id, contact_id)] = {
+                'broadcast_id': broadcast_id,
+                'contact_id': contact_id,
+                'bot_identifier': bot_identifier,
+                'status': 'pending' if bot_identifier else 'failed',
+                'claimed_by': None,
+                'lease_expires_at': None,
+                'delivery_attempts': 0,
+                'delivery_error': None if bot_identifier else 'Contact is not linked to a bot'
+            }
+        return self.broadcasts[broadcast_id]
+
+    def pending_outgoing(self):
+        return sum(
+            1 for m in self.messages.values()
+            if m['direction'] == 'outgoing' and not m['is_sent'] and m['delivery_error'] is None
+        )
+
+    def _public(self, message):
+        return {key: value for key, value in message.items() if key != 'inserted_at'}
+
+    def _select(self, table, rows, query):
+        """Rows of a GET request: filter, embed, order, limit and pick the selected columns"""
+        params = dict(query)
+        columns = _split_top_level(params.get('select', '*'))
+        # e.g. contacts!inner(contact_info,bot_identifier) on messages
+        embedded = {}
+        for column in columns:
+            if '(' in column:
+                name, _, embedded_columns = column[:-1].partition('(')
+                embedded[name.partition('!')[0]] = _split_top_level(embedded_columns)
+
+        def with_embedded(row):
+            if 'contacts' in embedded and table == 'messages':
+                contact = self.contacts.get(row['contact_id'], {})
+                return {**row, 'contacts': {column: contact.get(column) for column in embedded['contacts']}}
+            return row
+
+        predicate = _compile_filters(query)
+        result = (row for row in map(with_embedded, rows.values()) if predicate(row))
+        if 'order' in params:
+            key, reverse = _sort_key(params['order'])
+            if 'limit' in params and not reverse:
+                result = heapq.nsmallest(int(params['limit']), result, key=key)
+            else:
+                result = sorted(result, key=key, reverse=reverse)
+        result = list(result)[:int(params['limit'])] if 'limit' in params else list(result)
+
+        if columns == ['*']:
+            return [self._public(row) for row in result]
+        names = [column.partition('(')[0].partition('!')[0] for column in columns]
+        return [{name: row.get(name) for name in names} for row in result]
+
+    # Request handling
+
+    async def _delay(self):
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _handle_rpc(self, request):
+        function = request.match_info['function']
+        self.requests[f"POST /rpc/{function}"] += 1
+        args = await request.json()
+        await self._delay()
+        if self.fail_status:
+            return web.json_response({"message": "Service unavailable"}, status=self.fail_status)
+
+        handler = getattr(self, f"_rpc_{function}", None)
+        if handler is None:
+            return web.json_response({"code": "PGRST202", "message": f"Unknown function {function}"}, status=404)
+
+        async with self._lock:
+            with self._insert_statement(request):
+                return web.json_response(handler(args))
+
+    def _rpc_ingest_message(self, args):
+        contact_id, created = self.upsert_contact(
+            args['p_contact_info'], args.get('p_contact_name'), args.get('p_telegram_chat_id'))
+        row = {
+            'contact_id': contact_id,
+            'content': args['p_content'],
+            'timestamp': args.get('p_timestamp'),
+            'direction': args.get('p_direction', 'incoming'),
+            'bot_identifier': args.get('p_bot_identifier'),
+            'telegram_chat_id': args.get('p_telegram_chat_id'),
+            'telegram_message_id': args.get('p_telegram_message_id'),
+            'is_ai_response': args.get('p_is_ai_response', False)
+        }
+        message_id = self.existing_message_id(row) or self.insert_message(row)['id']
+        return [{'message_id': message_id, 'contact_id': contact_id, 'contact_created': created}]
+
+    def _rpc_ingest_messages(self, args):
+        rows = []
+        for record in args['p_messages']:
+            contact_id, _ = self.upsert_contact(
+                record['contact_info'], record.get('contact_name'), record.get('telegram_chat_id'))
+            row = {
+                'contact_id': contact_id,
+                'content': record['content'],
+                'timestamp': record.get('timestamp'),
+                'direction': record.get('direction', 'incoming'),
+                'bot_identifier': record.get('bot_identifier'),
+                'telegram_chat_id': record.get('telegram_chat_id'),
+                'telegram_message_id': record.get('telegram_message_id')
+            }
+            # ON CONFLICT DO NOTHING
+            if self.existing_message_id(row):
+                continue
+            message = self.insert_message(row)
+            rows.append({'message_id': message['id'], 'contact_id': contact_id, 'contact_info': record['contact_info']})
+        return rows
+
+    def _rpc_touch_contacts(self, args):
+        return self.update_last_contact([
+            {'contact_id': self.contacts_by_info[item['contact_info']], 'timestamp': item['last_contact']}
+            for item in args['p_contacts'] if item['contact_info'] in self.contacts_by_info
+        ])
+
+    def _rpc_claim_outgoing_messages(self, args):
+        now = time.time()
+        bot_identifier = args['p_bot_identifier']
+        candidates = sorted(
+            (
+                m for m in self.messages.values()
+                if m['direction'] == 'outgoing'
+                and not m['is_sent']
+                and m['delivery_error'] is None
+                and (m['lease_expires_at'] is None or _parse_time(m['lease_expires_at']) <= now)
+                and self.contacts[m['contact_id']]['bot_identifier'] == bot_identifier
+            ),
+            key=lambda m: m['timestamp']
+        )[:int(args.get('p_limit', 100))]
+
+        lease = datetime.utcfromtimestamp(now + int(args.get('p_lease_seconds', 120))).isoformat() + 'Z'
+        claimed = []
+        for message in candidates:
+            message['claimed_by'] = args['p_worker_id']
+            message['lease_expires_at'] = lease
+            message['delivery_attempts'] += 1
+            claimed.append({
+                'message_id': message['id'],
+                'contact_id': message['contact_id'],
+                'content': message['content'],
+                'message_timestamp': message['timestamp'],
+                'contact_info': self.contacts[message['contact_id']]['contact_info'],
+                'chat_id': self.contacts[message['contact_id']]['chat_id'],
+                'delivery_attempts': message['delivery_attempts']
+            })
+        return claimed
+
+    def _rpc_create_broadcast(self, args):
+        broadcast = self.create_broadcast(args['p_content'], args['p_contact_ids'])
+        return [{'broadcast_id': broadcast['id'], 'total_recipients': broadcast['total_recipients']}]
+
+    def _rpc_claim_broadcast_recipients(self, args):
+        now = time.time()
+        candidates = [
+            r for r in self.broadcast_recipients.values()
+            if r['status'] == 'pending'
+            and (r['lease_expires_at'] is None or r['lease_expires_at'] <= now)
+            and r['bot_identifier'] == args['p_bot_identifier']
+        ][:int(args.get('p_limit', 500))]
+
+        claimed = []
+        for recipient in candidates:
+            recipient['claimed_by'] = args['p_worker_id']
+            recipient['lease_expires_at'] = now + int(args.get('p_lease_seconds', 300))
+            recipient['delivery_attempts'] += 1
+            contact = self.contacts[recipient['contact_id']]
+            claimed.append({
+                'broadcast_id': recipient['broadcast_id'],
+                'contact_id': recipient['contact_id'],
+                'content': self.broadcasts[recipient['broadcast_id']]['content'],
+                'contact_info': contact['contact_info'],
+                'chat_id': contact['chat_id'],
+                'delivery_attempts': recipient['delivery_attempts']
+            })
+        return claimed
+
+    def _rpc_complete_broadcast_recipients(self, args):
+        updated = 0
+        for result in args['p_results']:
+            recipient = self.broadcast_recipients.get((result['broadcast_id'], result['contact_id']))
+            if recipient is None or recipient['claimed_by'] != args['p_worker_id'] or recipient['status'] != 'pending':
+                continue
+
+            updated += 1
+            retry = result['status'] == 'retry'
+            recipient.update(
+                status='pending' if retry else result['status'],
+                claimed_by=None,
+                lease_expires_at=time.time() + int(args.get('p_retry_delay_seconds', 30)) if retry else None,
+                delivery_error=result.get('error')
+            )
+            broadcast = self.broadcasts[result['broadcast_id']]
+            if result['status'] == 'sent':
+                broadcast['sent_count'] += 1
+                self.insert_message({
+                    'contact_id': result['contact_id'],
+                    'content': broadcast['content'],
+                    'direction': 'outgoing',
+                    'is_from_customer': False,
+                    'is_sent': True
+                })
+            elif result['status'] == 'failed':
+                broadcast['failed_count'] += 1
+            if broadcast['sent_count'] + broadcast['failed_count'] >= broadcast['total_recipients']:
+                broadcast['status'] = 'completed'
+        return updated
+
+    async def _handle_table(self, request):
+        table = request.match_info['table']
+        self.requests[f"{request.method} /{table}"] += 1
+        body = await request.json() if request.can_read_body else None
+        await self._delay()
+        if self.fail_status:
+            return web.json_response({"message": "Service unavailable"}, status=self.fail_status)
+
+        tables = {'messages': self.messages, 'contacts': self.contacts, 'broadcasts': self.broadcasts}
+        if table not in tables:
+            return web.json_response({"code": "42P01", "message": f"relation {table} does not exist"}, status=404)
+
+        rows = tables[table]
+        params = dict(request.query)
+
+        async with self._lock:
+            with self._insert_statement(request):
+                if request.method == 'GET':
+                    return web.json_response(self._select(table, rows, list(request.query.items())))
+
+                if request.method == 'POST' and table == 'messages':
+                    new_rows = body if isinstance(body, list) else [body]
+                    missing = [row['contact_id'] for row in new_rows if row['contact_id'] not in self.contacts]
+                    if missing:
+                        return web.json_response({
+                            "code": "23503",
+                            "message": 'insert or update on table "messages" violates foreign key constraint "messages_contact_id_fkey"'
+                        }, status=409)
+                    ignore_duplicates = 'resolution=ignore-duplicates' in request.headers.get('Prefer', '')
+                    if not ignore_duplicates and any(self.existing_message_id(row) for row in new_rows):
+                        return web.json_response({
+                            "code": "23505",
+                            "message": 'duplicate key value violates unique constraint "messages_telegram_message_key"'
+                        }, status=409)
+                    inserted = [
+                        self._public(self.insert_message(row))
+                        for row in new_rows if not self.existing_message_id(row)
+                    ]
+                    if 'return=representation' in request.headers.get('Prefer', ''):
+                        return web.json_response(inserted, status=201)
+                    return web.Response(status=201)
+
+                if request.method == 'PATCH':
+                    updated = [row for row in rows.values() if _matches(row, params)]
+                    for row in updated:
+                        row.update(body)
+                    if 'return=representation' in request.headers.get('Prefer', ''):
+                        return web.json_response([self._public(row) for row in updated])
+                    return web.Response(status=204)
+
+        return web.Response(status=405)
+
+async def main(host, port, latency):
+    server = await FakePostgrestServer(host, port, latency).start()
+    logger.info(f"Fake PostgREST listening on {server.url}")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Supabase REST server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(args.host, args.port, args.latency_ms / 1000))
@@ -0,0 +1,159 @@
+"""
+Local fake of the Supabase Realtime websocket endpoint
+
+Implements just enough of the Phoenix channel protocol for RealtimeListener:
+phx_join / heartbeat replies and postgres_changes INSERT events. Inserts can be
+pushed from Python with `push_insert()` or over HTTP with `POST /insert`.
+Connections can be dropped with `disconnect_all()`, or left open but silent with
+`stall_all()`, like a connection lost without a close, to exercise reconnects.
+
+Run standalone:
+    python -m stubs.fake_realtime --port 4000
+and point the bots at it with SUPABASE_REALTIME_URL=http://127.0.0.1:4000
+"""
+import json
+import asyncio
+import argparse
+import logging
+from datetime import datetime
+from aiohttp import web, WSMsgType
+
+logger = logging.getLogger(__name__)
+
+class FakeRealtimeServer:
+    """In-process fake Realtime server"""
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self.joins = 0
+        self.heartbeats = 0
+        self.pushed = 0  # INSERT events sent to a subscriber
+        self.missed = 0  # INSERT events no live subscriber received
+        self._sockets = {}  # websocket -> list of joined topics
+        self._stalled = set()  # websockets that get no more replies or events
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_get("/realtime/v1/websocket", self._handle_websocket)
+        self.app.router.add_post("/insert", self._handle_insert)
+        self.app.router.add_post("/disconnect", self._handle_disconnect)
+
+    @property
+    def url(self):
+        """Base URL to use as SUPABASE_URL"""
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def subscribers(self):
+        return sum(len(topics) for topics in self._sockets.values())
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Pick up the real port when started with port=0
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        await self.disconnect_all()
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def push_insert(self, record, table="messages", schema="public"):
+        """Send an INSERT event for `record` to every joined channel"""
+        delivered = False
+        for ws, topics in list(self._sockets.items()):
+            if ws in self._stalled:
+                continue
+            for topic in topics:
+                delivered = True
+                await ws.send_json({
+                    "topic": topic,
+                    "event": "postgres_changes",
+                    "payload": {
+                        "data": {
+                            "type": "INSERT",
+                            "schema": schema,
+                            "table": table,
+                            "commit_timestamp": datetime.utcnow().isoformat() + "Z",
+                            "record": record
+                        },
+                        "ids": []
+                    },
+                    "ref": None
+                })
+        if delivered:
+            self.pushed += 1
+        else:
+            self.missed += 1
+
+    def stall_all(self):
+        """Stop answering the current connections without closing them; new connections work normally"""
+        self._stalled.update(self._sockets)
+
+    async def disconnect_all(self):
+        """Drop every client connection, e.g. to exercise reconnect handling"""
+        for ws in list(self._sockets):
+            await ws.close()
+        self._sockets.clear()
+        self._stalled.clear()
+
+    async def _handle_websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self._sockets[ws] = []
+
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT or ws in self._stalled:
+                    continue
+
+                data = json.loads(msg.data)
+                event = data.get("event")
+
+                if event == "phx_join":
+                    self.joins += 1
+                    self._sockets[ws].append(data["topic"])
+                elif event == "heartbeat":
+                    self.heartbeats += 1
+                elif event == "phx_leave":
+                    if data["topic"] in self._sockets[ws]:
+                        self._sockets[ws].remove(data["topic"])
+
+                await ws.send_json({
+                    "topic": data.get("topic"),
+                    "event": "phx_reply",
+                    "payload": {"status": "ok", "response": {}},
+                    "ref": data.get("ref")
+                })
+        finally:
+            self._sockets.pop(ws, None)
+            self._stalled.discard(ws)
+
+        return ws
+
+    async def _handle_insert(self, request):
+        record = await request.json()
+        await self.push_insert(record)
+        return web.json_response({"status": "ok", "subscribers": self.subscribers})
+
+    async def _handle_disconnect(self, request):
+        await self.disconnect_all()
+        return web.json_response({"status": "ok"})
+
+async def main(host, port):
+    server = await FakeRealtimeServer(host, port).start()
+    logger.info(f"Fake Realtime server listening on {server.url}")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Supabase Realtime server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(args.host, args.port))
@@ -0,0 +1,183 @@
+"""
+Local fake of the Telegram Bot API
+
+Serves getMe, getUpdates (long polling with offsets), sendMessage and the
+webhook methods for any number of bot tokens. Updates are queued with
+`enqueue_update()`; sent messages are recorded in `sent_messages` with the
+time they arrived. An optional latency is added to every request.
+
+Point the bots at it with TELEGRAM_API_BASE_URL=http://127.0.0.1:<port>
+
+Run standalone:
+    python -m stubs.fake_telegram --port 8081 --latency-ms 20
+"""
+import json
+import time
+import asyncio
+import argparse
+import logging
+import itertools
+from collections import defaultdict
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+class FakeTelegramServer:
+    """In-process fake Bot API server"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, retry_after_every=0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        # Answer every Nth sendMessage with a 429 RetryAfter (0 disables)
+        self.retry_after_every = retry_after_every
+        self.requests = defaultdict(int)  # method -> count
+        self.sent_messages = []           # dicts with token, chat_id, text, received_at
+        self.enqueued_at = {}             # (token, update_id) -> monotonic time
+        self._updates = defaultdict(list)
+        self._update_events = defaultdict(asyncio.Event)
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._send_count = 0
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_route("*", "/bot{token}/{method}", self._handle)
+
+    @property
+    def url(self):
+        """Base URL to use as TELEGRAM_API_BASE_URL"""
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Pick up the real port when started with port=0
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def enqueue_update(self, token, update):
+        """Queue an update (Bot API JSON) for the bot with `token`; assigns update_id if missing"""
+        if "update_id" not in update:
+            update["update_id"] = next(self._update_ids)
+        self._updates[token].append(update)
+        self.enqueued_at[(token, update["update_id"])] = time.monotonic()
+        self._update_events[token].set()
+        return update["update_id"]
+
+    def wake_pollers(self):
+        """Answer every getUpdates call waiting for updates now, so bots stop without waiting out the long poll"""
+        for event in self._update_events.values():
+            event.set()
+
+    def pending_updates(self, token=None):
+        if token is not None:
+            return len(self._updates[token])
+        return sum(len(updates) for updates in self._updates.values())
+
+    async def _params(self, request):
+        if request.content_type == "application/json":
+            return await request.json()
+        params = {}
+        for key, value in (await request.post()).items():
+            try:
+                params[key] = json.loads(value)
+            except (TypeError, ValueError):
+                params[key] = value
+        return params
+
+    async def _handle(self, request):
+        token = request.match_info["token"]
+        method = request.match_info["method"]
+        self.requests[method] += 1
+        params = await self._params(request)
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        handler = getattr(self, f"_method_{method}", None)
+        if handler is None:
+            return web.json_response({"ok": True, "result": True})
+        return await handler(token, params)
+
+    async def _method_getMe(self, token, params):
+        bot_id = int(token.split(":")[0]) if token.split(":")[0].isdigit() else abs(hash(token)) % 10 ** 9
+        return web.json_response({"ok": True, "result": {
+            "id": bot_id,
+            "is_bot": True,
+            "first_name": f"Bot {bot_id}",
+            "username": f"fake_bot_{bot_id}",
+            "can_join_groups": True,
+            "can_read_all_group_messages": False,
+            "supports_inline_queries": False
+        }})
+
+    async def _method_getUpdates(self, token, params):
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+
+        # Confirm everything below the offset, like Telegram does
+        self._updates[token] = [u for u in self._updates[token] if u["update_id"] >= offset]
+
+        if not self._updates[token] and timeout > 0:
+            event = self._update_events[token]
+            event.clear()
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        return web.json_response({"ok": True, "result": self._updates[token][:limit]})
+
+    async def _method_sendMessage(self, token, params):
+        self._send_count += 1
+        if self.retry_after_every and self._send_count % self.retry_after_every == 0:
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1}
+            }, status=429)
+
+        chat_id = params.get("chat_id")
+        self.sent_messages.append({
+            "token": token,
+            "chat_id": chat_id,
+            "text": params.get("text"),
+            "received_at": time.monotonic()
+        })
+        return web.json_response({"ok": True, "result": {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "text": params.get("text")
+        }})
+
+    async def _method_getWebhookInfo(self, token, params):
+        return web.json_response({"ok": True, "result": {
+            "url": "",
+            "has_custom_certificate": False,
+            "pending_update_count": len(self._updates[token])
+        }})
+
+async def main(host, port, latency):
+    server = await FakeTelegramServer(host, port, latency).start()
+    logger.info(f"Fake Telegram Bot API listening on {server.url}")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(args.host, args.port, args.latency_ms / 1000))
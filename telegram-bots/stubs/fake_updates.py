@@ -0,0 +1,129 @@
+"""
+Fake Telegram update generator
+
+Builds Bot API `Update` JSON for synthetic customers and can post it to a
+webhook endpoint the way Telegram does (with the secret token header).
+
+Drive a local webhook server:
+    python -m stubs.fake_updates --url http://127.0.0.1:8443/telegram/bot1 \
+        --bot bot1 --secret $WEBHOOK_SECRET --count 1000 --rate 200 --users 50
+"""
+import time
+import random
+import asyncio
+import argparse
+import itertools
+import httpx
+
+from bots.webhook_server import webhook_secret_token
+
+SAMPLE_TEXTS = [
+    "Hi, is my order shipped yet?",
+    "What are your opening hours?",
+    "I want a refund for my last purchase",
+    "Do you deliver on weekends?",
+    "Thanks for the quick reply!",
+    "Can I change my delivery address?",
+    "The product arrived damaged",
+    "How much is express shipping?",
+]
+
+def make_text_update(update_id, user_id, text, chat_id=None, message_id=None, username=None, date=None):
+    """Build the JSON of a private-chat text message update"""
+    chat_id = chat_id if chat_id is not None else user_id
+    user = {
+        "id": user_id,
+        "is_bot": False,
+        "first_name": f"Customer{user_id}",
+        "username": username or f"customer{user_id}"
+    }
+    chat = {"id": chat_id, "type": "private" if chat_id == user_id else "group"}
+    if chat["type"] == "private":
+        chat.update(first_name=user["first_name"], username=user["username"])
+    else:
+        chat["title"] = f"Group {chat_id}"
+
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": message_id if message_id is not None else update_id,
+            "from": user,
+            "chat": chat,
+            "date": int(date if date is not None else time.time()),
+            "text": text
+        }
+    }
+
+class UpdateGenerator:
+    """
+    Produces an endless stream of text updates from `users` synthetic customers
+
+    Update ids increase monotonically like Telegram's; message ids are counted
+    per chat. Pass a seed for reproducible traffic.
+    """
+
+    def __init__(self, users=10, first_user_id=100000, first_update_id=1, seed=None, texts=None):
+        self.user_ids = [first_user_id + i for i in range(users)]
+        self.texts = texts or SAMPLE_TEXTS
+        self._update_ids = itertools.count(first_update_id)
+        self._message_ids = {}
+        self._random = random.Random(seed)
+
+    def next_update(self, user_id=None, text=None):
+        user_id = user_id or self._random.choice(self.user_ids)
+        message_id = self._message_ids.get(user_id, 0) + 1
+        self._message_ids[user_id] = message_id
+        return make_text_update(
+            next(self._update_ids),
+            user_id,
+            text or self._random.choice(self.texts),
+            message_id=message_id
+        )
+
+    def take(self, count):
+        return [self.next_update() for _ in range(count)]
+
+async def post_updates(url, updates, secret_token=None, rate=None, concurrency=20):
+    """
+    POST updates to a webhook URL, optionally at `rate` updates per second
+
+    Returns a dict counting responses by HTTP status.
+    """
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret_token} if secret_token else {}
+    statuses = {}
+    slots = asyncio.Semaphore(concurrency)
+    started = time.monotonic()
+
+    async with httpx.AsyncClient(headers=headers, timeout=30) as client:
+        async def post(index, update):
+            if rate:
+                delay = started + index / rate - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            async with slots:
+                response = await client.post(url, json=update)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        await asyncio.gather(*(post(index, update) for index, update in enumerate(updates)))
+
+    return statuses
+
+async def main(args):
+    generator = UpdateGenerator(users=args.users, seed=args.seed)
+    secret_token = webhook_secret_token(args.secret, args.bot) if args.secret else None
+    started = time.monotonic()
+    statuses = await post_updates(args.url, generator.take(args.count), secret_token, args.rate, args.concurrency)
+    elapsed = time.monotonic() - started
+    print(f"Sent {args.count} updates in {elapsed:.2f}s ({args.count / elapsed:.1f}/s): {statuses}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Post fake Telegram updates to a webhook")
+    parser.add_argument("--url", required=True, help="Webhook URL, e.g. http://127.0.0.1:8443/telegram/bot1")
+    parser.add_argument("--bot", default="", help="Bot identifier (used to derive the secret token)")
+    parser.add_argument("--secret", default="", help="WEBHOOK_SECRET of the server")
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=None, help="Updates per second (default: as fast as possible)")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=None)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,38 @@
+"""
+Shared setup for the tests: the fakes in stubs/ listen on fixed local ports
+
+Settings are read when the bots modules are imported, so the fakes' URLs are put
+in the environment here, before any test module imports them.
+"""
+import os
+import sys
+import socket
+from pathlib import Path
+
+# Make the bots package importable when pytest is run from anywhere
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+POSTGREST_PORT = free_port()
+TELEGRAM_PORT = free_port()
+REALTIME_PORT = free_port()
+
+os.environ.update({
+    'SUPABASE_URL': f"http://127.0.0.1:{POSTGREST_PORT}",
+    'TELEGRAM_API_BASE_URL': f"http://127.0.0.1:{TELEGRAM_PORT}",
+    'SUPABASE_REALTIME_URL': f"http://127.0.0.1:{REALTIME_PORT}",
+    'OUTGOING_DELIVERY': 'realtime',
+    # Long enough that only Realtime events and reconnects deliver during a test
+    'OUTGOING_FALLBACK_POLL_INTERVAL': '3600',
+    'REALTIME_HEARTBEAT_INTERVAL': '0.5',
+    'REALTIME_MAX_BACKOFF': '1',
+    'MESSAGE_WRITE_BEHIND': '0',
+    'MESSAGE_SPOOL': '0',
+    'AUTO_REPLY': '0',
+    'CONTACT_CACHE_STATS_INTERVAL': '0',
+    'LOG_LEVEL': 'WARNING'
+})
@@ -0,0 +1,153 @@
+"""
+Auto-replies against the fake LLM and Supabase servers: reply cache, coalescing, TTL and history
+"""
+import time
+import doctest
+import asyncio
+
+from conftest import POSTGREST_PORT
+from stubs.fake_postgrest import FakePostgrestServer
+from stubs.fake_llm import FakeLLMServer
+
+from bots import auto_reply
+from bots.auto_reply import AutoReplier, LLMClient, ReplyCache, normalize_question, similarity_key
+from bots.supabase_client import close_supabase_client
+from bots.last_contact import close_last_contact_coalescer
+
+BOT_IDENTIFIER = "bot1"
+
+async def wait_until(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        await asyncio.sleep(0.02)
+    return predicate()
+
+async def run_with_replier(scenario, histories=None, llm_latency=0.0, ttl=3600):
+    """Run `scenario(replier, llm, ask)` with an AutoReplier whose customers have `histories` (user_id -> entries)"""
+    histories = histories or {}
+    db = await FakePostgrestServer(port=POSTGREST_PORT).start()
+    llm = await FakeLLMServer(latency=llm_latency).start()
+    client = LLMClient(url=llm.url, api_key="test")
+
+    async def load_history(user_id, limit):
+        return histories.get(user_id, [])[-limit:]
+
+    replier = AutoReplier(BOT_IDENTIFIER, load_history, cache=ReplyCache(ttl=ttl), client=client)
+
+    async def ask(*questions):
+        """Submit (user_id, text) pairs at once and wait for their replies"""
+        done = replier.replies + replier.errors + len(questions)
+        for user_id, text in questions:
+            replier.submit(user_id, f"{user_id}:{BOT_IDENTIFIER}", None, user_id, text)
+        assert await wait_until(lambda: replier.replies + replier.errors >= done)
+        assert replier.errors == 0
+
+    try:
+        await scenario(replier, llm, ask)
+    finally:
+        await replier.stop()
+        await client.aclose()
+        await close_last_contact_coalescer()
+        await close_supabase_client()
+        await llm.stop()
+        await db.stop()
+
+def test_first_questions_are_answered_from_the_cache():
+    async def scenario(replier, llm, ask):
+        await ask((111, "What are your opening hours?"))
+        await ask((222, "What are your opening hours?"))
+        await ask((333, "opening hours??"))
+
+        assert len(llm.requests) == 1
+        stats = replier.cache.stats()
+        assert (stats['exact_hits'], stats['similar_hits']) == (1, 1)
+        assert replier.replies == 3
+
+    asyncio.run(run_with_replier(scenario))
+
+def test_identical_questions_in_flight_share_one_llm_call():
+    async def scenario(replier, llm, ask):
+        await ask(*((user_id, "Do you ship to Canada?") for user_id in (111, 222, 333)))
+
+        assert len(llm.requests) == 1
+        assert replier.coalesced == 2
+        assert replier.replies == 3
+
+    asyncio.run(run_with_replier(scenario, llm_latency=0.2))
+
+def test_cached_replies_expire_after_the_ttl():
+    async def scenario(replier, llm, ask):
+        await ask((111, "What are your opening hours?"))
+        await ask((222, "What are your opening hours?"))
+        assert len(llm.requests) == 1
+
+        await asyncio.sleep(0.3)
+        await ask((333, "What are your opening hours?"))
+        assert len(llm.requests) == 2
+
+    asyncio.run(run_with_replier(scenario, ttl=0.2))
+
+def test_questions_with_history_are_answered_in_context_and_never_shared():
+    histories = {
+        111: [
+            {'content': "I ordered the blue jacket", 'direction': 'incoming'},
+            {'content': "Thanks, it ships tomorrow", 'direction': 'outgoing'}
+        ]
+    }
+
+    async def scenario(replier, llm, ask):
+        await ask((111, "What are your opening hours?"))
+        assert llm.requests[-1]['messages'] == [
+            {'role': 'user', 'content': "I ordered the blue jacket"},
+            {'role': 'assistant', 'content': "Thanks, it ships tomorrow"},
+            {'role': 'user', 'content': "What are your opening hours?"}
+        ]
+
+        # Neither served from nor stored in the shared cache
+        await ask((222, "What are your opening hours?"))
+        assert len(llm.requests) == 2
+        assert llm.requests[-1]['messages'] == [{'role': 'user', 'content': "What are your opening hours?"}]
+
+        await ask((111, "What are your opening hours?"))
+        assert len(llm.requests) == 3
+        assert replier.cache.stats()['exact_hits'] == 0
+
+    asyncio.run(run_with_replier(scenario, histories=histories))
+
+def test_reply_cache_expires_and_evicts():
+    cache = ReplyCache(maxsize=2, ttl=60)
+    keys = cache.keys(BOT_IDENTIFIER, "What are your opening hours?")
+    cache.set(keys, "9 to 5")
+    assert cache.get(keys) == "9 to 5"
+    assert cache.get(cache.keys("bot2", "What are your opening hours?")) is None
+
+    # Each reply takes two entries (exact and similar), so a second question evicts the first
+    other = cache.keys(BOT_IDENTIFIER, "Do you ship to Canada?")
+    cache.set(other, "Yes")
+    assert cache.get(keys) is None
+    assert cache.stats()['evictions'] == 2
+
+    expired = ReplyCache(ttl=0.01)
+    keys = expired.keys(BOT_IDENTIFIER, "What are your opening hours?")
+    expired.set(keys, "9 to 5")
+    time.sleep(0.02)
+    assert expired.get(keys) is None
+
+    assert ReplyCache(ttl=0).keys(BOT_IDENTIFIER, "What are your opening hours?") == (None, None)
+
+def test_similarity_key_doctests():
+    result = doctest.testmod(auto_reply)
+    assert result.attempted > 0
+    assert result.failed == 0
+
+def test_similarity_key():
+    def key(text):
+        return similarity_key(normalize_question(text))
+
+    assert key("Do you deliver on Sundays?") == key("deliver sunday") == "deliver sunday"
+    # One content word is too little to tell what is asked
+    assert key("Where is my order?") is None
+    assert key("Is it free?") is None
+    assert key("yes") is None
+    assert key("Can't I cancel my order?") != key("Can I cancel my order?")
+    assert key("I did not receive my order") != key("I did receive my order")
@@ -0,0 +1,59 @@
+"""
+BotSupervisor hot reload against the fake Supabase, Realtime and Telegram servers
+"""
+import time
+import asyncio
+
+from conftest import POSTGREST_PORT, TELEGRAM_PORT, REALTIME_PORT
+from stubs.fake_postgrest import FakePostgrestServer
+from stubs.fake_realtime import FakeRealtimeServer
+from stubs.fake_telegram import FakeTelegramServer
+
+from run_all import BotSupervisor
+from bots.metrics import BOT_GAUGES
+from bots.supabase_client import close_supabase_client
+from bots.last_contact import close_last_contact_coalescer
+
+BOTS = [("bot1", "900001:TESTBOT1"), ("bot2", "900002:TESTBOT2")]
+
+async def wait_until(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    return predicate()
+
+def gauge_bots():
+    """Bots with a child in any per-bot gauge"""
+    return {key[0] for gauge in BOT_GAUGES for key in gauge._children}
+
+def test_removed_bot_drops_its_gauges():
+    async def main():
+        db = await FakePostgrestServer(port=POSTGREST_PORT).start()
+        realtime = await FakeRealtimeServer(port=REALTIME_PORT).start()
+        telegram = await FakeTelegramServer(port=TELEGRAM_PORT).start()
+        supervisor = BotSupervisor(BOTS)
+        task = asyncio.create_task(supervisor.run())
+        try:
+            assert await wait_until(lambda: all(bot.state == "running" for bot in supervisor.bots.values()))
+            assert {"bot1", "bot2"} <= gauge_bots()
+
+            removing = asyncio.create_task(supervisor.apply(BOTS[:1]))
+            await asyncio.sleep(0.1)
+            telegram.wake_pollers()
+            await removing
+
+            assert "bot2" not in gauge_bots()
+            assert "bot1" in gauge_bots()
+            assert not any('bot="bot2"' in line for gauge in BOT_GAUGES for line in gauge.render())
+        finally:
+            supervisor.stop()
+            await asyncio.sleep(0.1)
+            telegram.wake_pollers()
+            await task
+            await close_last_contact_coalescer()
+            await close_supabase_client()
+            await telegram.stop()
+            await realtime.stop()
+            await db.stop()
+
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+"""
+KeyedSerializer: concurrent across chats, in order within a chat
+"""
+import random
+import asyncio
+
+from bots.keyed_serializer import KeyedSerializer
+
+def test_calls_with_the_same_key_run_in_call_order():
+    async def main():
+        serializer = KeyedSerializer(4)
+        rng = random.Random(1)
+        finished = []
+
+        async def handle(chat_id, sequence):
+            # Later calls often finish sooner, so only the serializer keeps them in order
+            await asyncio.sleep(rng.uniform(0, 0.01))
+            finished.append((chat_id, sequence))
+
+        await asyncio.gather(*(
+            serializer.run(chat_id, handle, chat_id, sequence)
+            for sequence in range(20) for chat_id in range(5)
+        ))
+
+        for chat_id in range(5):
+            assert [sequence for chat, sequence in finished if chat == chat_id] == list(range(20))
+        assert serializer.pending == 0
+
+    asyncio.run(main())
+
+def test_limit_caps_running_calls_without_counting_waiting_ones():
+    async def main():
+        serializer = KeyedSerializer(2)
+        release = asyncio.Event()
+        started = []
+
+        async def handle(key):
+            started.append(key)
+            await release.wait()
+
+        # Three calls for chat "a" and one for chat "b": "a" waiting on itself mustn't block "b"
+        tasks = [asyncio.create_task(serializer.run(key, handle, key)) for key in ("a", "a", "a", "b")]
+        await asyncio.sleep(0.01)
+        assert started == ["a", "b"]
+        assert serializer.running == 2
+        assert serializer.pending == 4
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert started == ["a", "b", "a", "a"]
+        assert serializer.stats() == {'limit': 2, 'running': 0, 'pending': 0, 'active_keys': 0}
+
+    asyncio.run(main())
+
+def test_calls_without_a_key_are_only_limited():
+    async def main():
+        serializer = KeyedSerializer(3)
+        finished = []
+
+        async def handle(sequence, delay):
+            await asyncio.sleep(delay)
+            finished.append(sequence)
+
+        await asyncio.gather(serializer.run(None, handle, 1, 0.03), serializer.run(None, handle, 2, 0))
+        assert finished == [2, 1]
+
+    asyncio.run(main())
@@ -0,0 +1,52 @@
+"""
+maintain_partitions: finishing the manifests of archives dropped by an interrupted run
+"""
+import json
+
+from maintain_partitions import finish_pending_manifests, manifest_path, write_manifest
+
+class TablesConnection:
+    """Connection stand-in answering to_regclass() from a set of existing table names"""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self._result = None
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params):
+        assert "to_regclass" in query
+        self._result = (params[0].split('.', 1)[1] in self.tables,)
+
+    def fetchone(self):
+        return self._result
+
+def manifest(name):
+    return {'partition': name, 'rows': 3, 'sha256': 'abc'}
+
+def test_pending_manifests_are_finished_once_their_table_is_gone(tmp_path):
+    archive_dir = str(tmp_path)
+    write_manifest(archive_dir, manifest("messages_p2024_01"), pending=True)
+    write_manifest(archive_dir, manifest("messages_p2024_02"), pending=True)
+
+    # The run crashed after dropping 2024_01, and before dropping 2024_02
+    finished = finish_pending_manifests(TablesConnection({"messages_p2024_02"}), archive_dir)
+
+    assert [m['partition'] for m in finished] == ["messages_p2024_01"]
+    with open(manifest_path(archive_dir, "messages_p2024_01")) as f:
+        final = json.load(f)
+    assert final['rows'] == 3 and 'archived_at' in final
+    assert not (tmp_path / "messages_p2024_01.pending.json").exists()
+    # Left for the next archive of the table to overwrite
+    assert (tmp_path / "messages_p2024_02.pending.json").exists()
+    assert not (tmp_path / "messages_p2024_02.json").exists()
+
+def test_missing_archive_dir_has_nothing_to_finish(tmp_path):
+    assert finish_pending_manifests(TablesConnection(set()), str(tmp_path / "missing")) == []
@@ -0,0 +1,121 @@
+"""
+Realtime push delivery of outgoing messages against the fake Supabase, Realtime and Telegram servers
+"""
+import time
+import asyncio
+
+from conftest import POSTGREST_PORT, TELEGRAM_PORT, REALTIME_PORT
+from stubs.fake_postgrest import FakePostgrestServer
+from stubs.fake_realtime import FakeRealtimeServer
+from stubs.fake_telegram import FakeTelegramServer
+
+from bots.bot_utils import create_bot_application, start_application, stop_application
+from bots.supabase_client import close_supabase_client
+from bots.last_contact import close_last_contact_coalescer
+
+BOTS = [("bot1", "900001:TESTBOT1"), ("bot2", "900002:TESTBOT2")]
+
+async def wait_until(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    return predicate()
+
+def claims(db):
+    return db.requests["POST /rpc/claim_outgoing_messages"]
+
+async def run_with_bots(scenario):
+    """Start the fakes and both bots, run `scenario(db, realtime, telegram, applications)`, then stop everything"""
+    db = await FakePostgrestServer(port=POSTGREST_PORT).start()
+    realtime = await FakeRealtimeServer(port=REALTIME_PORT).start()
+    telegram = await FakeTelegramServer(port=TELEGRAM_PORT).start()
+
+    # Publish every insert the way Realtime does
+    pushes = set()
+
+    def publish(row):
+        task = asyncio.create_task(realtime.push_insert(row))
+        pushes.add(task)
+        task.add_done_callback(pushes.discard)
+    db.on_insert = publish
+
+    applications = {}
+    try:
+        for bot_identifier, token in BOTS:
+            applications[bot_identifier] = create_bot_application(token, bot_identifier)
+            await start_application(applications[bot_identifier], bot_identifier)
+
+        subscriptions = [application.bot_data['realtime_subscription'] for application in applications.values()]
+        assert await wait_until(lambda: all(s.listener.connected for s in subscriptions))
+        # Let the catch-up checks that follow the join finish
+        assert await wait_until(lambda: claims(db) >= len(BOTS))
+        await asyncio.sleep(0.2)
+
+        await scenario(db, realtime, telegram, applications)
+    finally:
+        stopping = asyncio.gather(*(
+            stop_application(application, bot_identifier) for bot_identifier, application in applications.items()
+        ))
+        await asyncio.sleep(0.1)
+        telegram.wake_pollers()
+        await stopping
+        await close_last_contact_coalescer()
+        await close_supabase_client()
+        await telegram.stop()
+        await realtime.stop()
+        await db.stop()
+
+def test_insert_is_pushed_to_the_owning_bot_only():
+    async def scenario(db, realtime, telegram, applications):
+        # The bots of a process share one socket
+        assert realtime.joins == 1
+
+        db.upsert_contact("111:bot1", chat_id=111)
+        claims_before = claims(db)
+        db.add_outgoing("111:bot1", "Your order has shipped")
+
+        assert await wait_until(lambda: len(telegram.sent_messages) == 1)
+        assert telegram.sent_messages[0]["chat_id"] == 111
+        assert telegram.sent_messages[0]["token"] == "900001:TESTBOT1"
+        # Only bot1 woke up and claimed
+        await asyncio.sleep(0.2)
+        assert claims(db) - claims_before == 1
+
+        router = applications["bot1"].bot_data['realtime_subscription'].router
+        assert router.routed == 1
+
+    asyncio.run(run_with_bots(scenario))
+
+def test_messages_inserted_while_disconnected_are_delivered_after_reconnect():
+    async def scenario(db, realtime, telegram, applications):
+        listener = applications["bot1"].bot_data['realtime_subscription'].listener
+        db.upsert_contact("111:bot1", chat_id=111)
+        db.upsert_contact("222:bot2", chat_id=222)
+
+        await realtime.disconnect_all()
+        assert await wait_until(lambda: not listener.connected)
+        db.add_outgoing("111:bot1", "Sent while the socket was down")
+        db.add_outgoing("222:bot2", "Also sent while the socket was down")
+        await asyncio.sleep(0.1)
+        assert realtime.missed == 2
+        assert telegram.sent_messages == []
+
+        # The fallback poll is an hour away, so only the catch-up after the rejoin delivers these
+        assert await wait_until(lambda: len(telegram.sent_messages) == 2)
+        assert listener.reconnects >= 1
+        assert sorted(m["chat_id"] for m in telegram.sent_messages) == [111, 222]
+
+    asyncio.run(run_with_bots(scenario))
+
+def test_unanswered_heartbeat_reconnects_and_catches_up():
+    async def scenario(db, realtime, telegram, applications):
+        listener = applications["bot1"].bot_data['realtime_subscription'].listener
+        db.upsert_contact("111:bot1", chat_id=111)
+
+        realtime.stall_all()
+        db.add_outgoing("111:bot1", "Sent to a stalled socket")
+
+        assert await wait_until(lambda: len(telegram.sent_messages) == 1)
+        assert listener.heartbeat_timeouts >= 1
+
+    asyncio.run(run_with_bots(scenario))
@@ -0,0 +1,61 @@
+"""
+SendScheduler: a failed send holds back the rest of its chat
+"""
+import asyncio
+from telegram.error import NetworkError, RetryAfter
+
+from bots.send_scheduler import SendScheduler, ChatSendAborted
+
+class RecordingBot:
+    """Bot stand-in that records sends and fails the texts in `failures` with the given error"""
+
+    def __init__(self, failures=None):
+        self.failures = failures or {}
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        error = self.failures.get(text)
+        if error is not None:
+            raise error
+        self.sent.append((chat_id, text))
+        return text
+
+def scheduler_for(bot, **kwargs):
+    return SendScheduler(bot, bot_identifier="test", global_rate=1000, global_burst=1000, chat_rate=1000,
+                         chat_burst=1000, **kwargs)
+
+def test_failed_send_fails_the_rest_of_its_chat():
+    async def main():
+        bot = RecordingBot({"a2": NetworkError("connection reset")})
+        scheduler = scheduler_for(bot)
+        futures = {text: scheduler.submit(chat_id, text) for chat_id, text in
+                   ((1, "a1"), (1, "a2"), (2, "b1"), (1, "a3"), (2, "b2"), (1, "a4"))}
+        results = dict(zip(futures, await asyncio.gather(*futures.values(), return_exceptions=True)))
+
+        assert results["a1"] == "a1"
+        assert isinstance(results["a2"], NetworkError)
+        assert isinstance(results["a3"], ChatSendAborted)
+        assert isinstance(results["a4"], ChatSendAborted)
+        # Other chats are unaffected
+        assert (results["b1"], results["b2"]) == ("b1", "b2")
+        assert [text for chat_id, text in bot.sent if chat_id == 1] == ["a1"]
+        assert scheduler.stats()['failed'] == 3
+
+        # The chat works again for messages submitted afterwards
+        assert await scheduler.submit(1, "a5") == "a5"
+
+    asyncio.run(main())
+
+def test_giving_up_after_retry_after_fails_the_rest_of_its_chat():
+    async def main():
+        bot = RecordingBot({"a1": RetryAfter(0.01)})
+        scheduler = scheduler_for(bot, retry_after_max_retries=2)
+        first, second = scheduler.submit(1, "a1"), scheduler.submit(1, "a2")
+        results = await asyncio.gather(first, second, return_exceptions=True)
+
+        assert isinstance(results[0], RetryAfter)
+        assert isinstance(results[1], ChatSendAborted)
+        assert scheduler.retry_afters == 3
+        assert bot.sent == []
+
+    asyncio.run(main())
@@ -0,0 +1,54 @@
+"""
+MessageSpool replay against the fake Supabase server
+"""
+import time
+import sqlite3
+import asyncio
+
+from conftest import POSTGREST_PORT
+from stubs.fake_postgrest import FakePostgrestServer
+
+from bots.spool import MessageSpool
+from bots.supabase_client import close_supabase_client
+from bots.last_contact import close_last_contact_coalescer
+
+async def wait_until(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    return predicate()
+
+class FlakySpool(MessageSpool):
+    """Spool whose first replay reads fail, like a spool database locked by another process"""
+
+    def __init__(self, *args, failures=1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failures = failures
+
+    def _read_batch(self, limit):
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError("database is locked")
+        return super()._read_batch(limit)
+
+def test_replay_continues_after_an_error(tmp_path):
+    async def main():
+        db = await FakePostgrestServer(port=POSTGREST_PORT).start()
+        spool = FlakySpool("bot1", path=str(tmp_path / "bot1.db"), failures=2, max_backoff=0.2)
+        try:
+            await spool.start()
+            for message_id in range(1, 4):
+                await spool.append("111:bot1", "Ann", f"message {message_id}", chat_id=111,
+                                   telegram_message_id=message_id)
+
+            assert await wait_until(lambda: spool.replayed == 3)
+            assert spool.failures == 0
+            assert spool.size == 0
+            assert sorted(m['content'] for m in db.messages.values()) == ["message 1", "message 2", "message 3"]
+        finally:
+            await spool.stop()
+            await close_last_contact_coalescer()
+            await close_supabase_client()
+            await db.stop()
+
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+"""
+Webhook server: secret token check and backpressure while updates are being handled
+"""
+import time
+import asyncio
+import aiohttp
+from telegram import Update
+from telegram.ext import TypeHandler
+
+from conftest import POSTGREST_PORT, TELEGRAM_PORT
+from stubs.fake_postgrest import FakePostgrestServer
+from stubs.fake_telegram import FakeTelegramServer
+from stubs.fake_updates import make_text_update
+
+from bots.bot_utils import create_bot_application
+from bots.supabase_client import close_supabase_client
+from bots.last_contact import close_last_contact_coalescer
+from bots.webhook_server import WebhookServer
+
+BOT_IDENTIFIER = "bot1"
+TOKEN = "900001:TESTBOT1"
+
+async def wait_until(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    return predicate()
+
+async def run_with_webhook(scenario, max_pending=5):
+    """Start a bot behind a WebhookServer, with every update held until `release` is set"""
+    db = await FakePostgrestServer(port=POSTGREST_PORT).start()
+    telegram = await FakeTelegramServer(port=TELEGRAM_PORT).start()
+    server = await WebhookServer(public_url="https://bots.example.com", host="127.0.0.1", port=0,
+                                 secret="test-secret", max_pending=max_pending).start()
+    release = asyncio.Event()
+
+    async def hold(update, context):
+        await release.wait()
+
+    application = create_bot_application(TOKEN, BOT_IDENTIFIER)
+    application.add_handler(TypeHandler(Update, hold), group=-2)
+    try:
+        await application.initialize()
+        await application.start()
+        await server.register(BOT_IDENTIFIER, application)
+
+        async with aiohttp.ClientSession() as session:
+            async def post(update, secret_token=None, bot_identifier=BOT_IDENTIFIER):
+                headers = {"X-Telegram-Bot-Api-Secret-Token": secret_token or server.secret_token(bot_identifier)}
+                async with session.post(f"http://127.0.0.1:{server.port}/telegram/{bot_identifier}",
+                                        json=update, headers=headers) as response:
+                    return response.status, response.headers
+
+            await scenario(server, application, post, release)
+    finally:
+        release.set()
+        server.unregister(BOT_IDENTIFIER)
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        await close_last_contact_coalescer()
+        await close_supabase_client()
+        await server.stop()
+        await telegram.stop()
+        await db.stop()
+
+def test_bad_secret_token_is_rejected():
+    async def scenario(server, application, post, release):
+        status, _ = await post(make_text_update(1, 111, "hello"), secret_token="wrong")
+        assert status == 403
+        status, _ = await post(make_text_update(2, 111, "hello"), bot_identifier="unknown-bot")
+        assert status == 404
+        assert application.update_queue.in_flight == 0
+
+        status, _ = await post(make_text_update(3, 111, "hello"))
+        assert status == 200
+
+    asyncio.run(run_with_webhook(scenario))
+
+def test_updates_being_handled_count_towards_max_pending():
+    async def scenario(server, application, post, release):
+        queue = application.update_queue
+        for update_id in range(1, 6):
+            status, _ = await post(make_text_update(update_id, 100 + update_id, "hello"))
+            assert status == 200
+
+        # python-telegram-bot has taken them all off the queue, but none is handled yet
+        assert await wait_until(lambda: queue.qsize() == 0)
+        assert queue.in_flight == 5
+
+        status, headers = await post(make_text_update(6, 106, "hello"))
+        assert status == 503
+        assert headers["Retry-After"] == "1"
+        assert server.rejected_updates == 1
+
+        release.set()
+        assert await wait_until(lambda: queue.in_flight == 0)
+        status, _ = await post(make_text_update(6, 106, "hello"))
+        assert status == 200
+
+    asyncio.run(run_with_webhook(scenario))